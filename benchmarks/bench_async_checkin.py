@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+בנצ'מרק צ'ק-אין אסינכרוני - תפוקה לפי מספר העדכונים שמטופלים במקביל
+מריץ checkin_user דרך database.async_queries על מסד SQLite זמני
+
+שימוש: python benchmarks/bench_async_checkin.py [--users N] [--concurrency 1 4 16]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+
+from database.engine import create_db_engine
+from database.models import Base, Session, User
+
+async def run_checkins(user_ids, concurrency):
+    """צ'ק-אין לכל המשתמשים כאשר לכל היותר concurrency עדכונים בטיפול בו זמנית"""
+    from database.async_queries import checkin_user
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def handle(telegram_id):
+        async with semaphore:
+            return await checkin_user(telegram_id)
+
+    results = await asyncio.gather(*(handle(telegram_id) for telegram_id in user_ids))
+    return sum(1 for success, _ in results if success)
+
+def main():
+    parser = argparse.ArgumentParser(description="בנצ'מרק צ'ק-אין אסינכרוני")
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        Session.configure(bind=engine)
+
+        for round_number, concurrency in enumerate(args.concurrency):
+            # משתמשים חדשים לכל סבב כדי שכל צ'ק-אין יצליח
+            first_id = 1000 + round_number * args.users
+            user_ids = list(range(first_id, first_id + args.users))
+            with engine.begin() as conn:
+                conn.execute(insert(User), [
+                    {'telegram_id': i, 'tokens': 0, 'level': 1, 'experience': 0,
+                     'total_experience': 0, 'next_level_exp': 100, 'referral_code': f'B{i}'}
+                    for i in user_ids
+                ])
+
+            started = time.perf_counter()
+            succeeded = asyncio.run(run_checkins(user_ids, concurrency))
+            elapsed = time.perf_counter() - started
+
+            print(f"⚡ מקביליות {concurrency:>3}: {succeeded}/{len(user_ids)} צ'ק-אינים "
+                  f"ב-{elapsed:.2f} שניות ({len(user_ids) / elapsed:.0f} לשנייה)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+בנצ'מרק מנוע השידור - קצב שליחה, RetryAfter והמשך אחרי הפעלה מחדש
+ה-Bot API מדומה: כל שליחה לוקחת --latency-ms, ושליחה מעל --api-limit לשנייה מקבלת 429 (RetryAfter)
+באמצע השידור המנוע נעצר ומנוע חדש ממשיך - כל משתמש צריך לקבל את ההודעה פעם אחת בדיוק
+
+שימוש: python benchmarks/bench_broadcast.py [--users N] [--rate N] [--api-limit N] [--latency-ms N]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from collections import Counter, deque
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from telegram.ext import Application
+from telegram.request import BaseRequest
+
+from database.engine import create_db_engine
+from database.models import Base, Session, User
+
+class LimitedBotAPI(BaseRequest):
+    """Bot API מדומה עם מגבלת קצב כמו של טלגרם"""
+
+    def __init__(self, limit, latency):
+        self.limit = limit
+        self.latency = latency
+        self.delivered = Counter()
+        self.retry_after = 0
+        self._recent = deque()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return 5
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit('/', 1)[-1]
+        if endpoint == 'getMe':
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+            return 200, json.dumps({"ok": True, "result": result}).encode()
+
+        await asyncio.sleep(self.latency)
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 1:
+            self._recent.popleft()
+        if len(self._recent) >= self.limit:
+            self.retry_after += 1
+            return 429, json.dumps({"ok": False, "error_code": 429, "description": "Too Many Requests",
+                                    "parameters": {"retry_after": 1}}).encode()
+        self._recent.append(now)
+
+        params = request_data.parameters if request_data else {}
+        chat_id = int(params.get('chat_id', 0))
+        if endpoint == 'sendMessage':
+            self.delivered[chat_id] += 1
+        result = {"message_id": 1, "date": int(now), "chat": {"id": chat_id, "type": "private"}, "text": ""}
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+async def run(args):
+    from bot.broadcast import BroadcastEngine
+    from database.async_queries import create_broadcast_job, get_broadcast_job
+
+    api = LimitedBotAPI(args.api_limit, args.latency_ms / 1000)
+    application = Application.builder().token("1:bench").request(api).get_updates_request(api).build()
+    await application.initialize()
+
+    job_id, total = await create_broadcast_job("בדיקה", 1)
+    print(f"📢 שידור {job_id} ל-{total} משתמשים (קצב {args.rate}/s, מגבלת ה-API {args.api_limit}/s)")
+
+    started = time.perf_counter()
+    engine = BroadcastEngine(application, rate=args.rate)
+    engine.launch(job_id)
+    await asyncio.sleep(args.restart_after)
+    await engine.stop()
+    before_restart = sum(api.delivered.values())
+    print(f"🔄 הפעלה מחדש אחרי {before_restart} הודעות")
+
+    engine = BroadcastEngine(application, rate=args.rate)
+    engine.launch(job_id)
+    while (await get_broadcast_job(job_id))['status'] != 'completed':
+        await asyncio.sleep(0.2)
+    elapsed = time.perf_counter() - started
+    await engine.stop()
+    await application.shutdown()
+
+    job = await get_broadcast_job(job_id)
+    duplicates = sum(1 for count in api.delivered.values() if count > 1)
+    missing = total - len(api.delivered)
+    print(f"⏱️ {elapsed:.1f} שניות - {job['sent'] / elapsed:.1f} הודעות לשנייה")
+    print(f"📊 נשלחו: {job['sent']} | נכשלו: {job['failed']} | RetryAfter: {api.retry_after} | "
+          f"כפולים: {duplicates} | חסרים: {missing}")
+    if duplicates or missing or job['sent'] != total:
+        print("❌ השידור לא נמסר פעם אחת בדיוק לכל משתמש")
+        sys.exit(1)
+    print("✅ כל משתמש קיבל את ההודעה פעם אחת")
+
+def main():
+    parser = argparse.ArgumentParser(description="בנצ'מרק מנוע השידור")
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=200, help="קצב השליחה של המנוע")
+    parser.add_argument('--api-limit', type=int, default=180, help="מעל הקצב הזה ה-API מחזיר 429")
+    parser.add_argument('--latency-ms', type=float, default=30)
+    parser.add_argument('--restart-after', type=float, default=3, help="שניות עד הפעלה מחדש מדומה")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        Session.configure(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(insert(User), [
+                {'telegram_id': 10000 + i, 'tokens': 0, 'referral_code': f'B{i}'}
+                for i in range(args.users)
+            ])
+        asyncio.run(run(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+בדיקת עומס לצ'ק-אין מקבילי - כל משתמש מקבל טוקנים פעם אחת בלבד
+לכל משתמש נשלחים כמה צ'ק-אינים בו זמנית: ניסיונות חוזרים של אותו update_id
+(כמו webhook שנשלח שוב) ולחיצות כפולות עם update_id שונה.
+אחר כך /start מקבילי (services.start - קריאה ואז רישום באותה יחידת עבודה) של משתמשים
+חדשים עם קוד הפניה: כל רישום מצליח וכל מזמין מזוכה על כל מוזמן
+
+שימוש: python benchmarks/bench_checkin_concurrency.py [--users N] [--repeats N] [--threads N] [--database-url URL]
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from types import SimpleNamespace
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, func
+
+from database.engine import create_db_engine
+from database.models import Base, Session, User, Attendance, UserDailyStats, Referral
+
+START_TOKENS = 100
+
+def populate(engine, user_ids):
+    """משתמשים חדשים ללא צ'ק-אין קודם"""
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {'telegram_id': i, 'tokens': START_TOKENS, 'level': 1, 'experience': 0,
+             'total_experience': 0, 'next_level_exp': 100, 'referral_code': f'C{i}'}
+            for i in user_ids
+        ])
+
+def build_calls(user_ids, repeats):
+    """רשימת קריאות מעורבבת: לכל משתמש repeats קריאות, חציין ניסיונות חוזרים של אותו עדכון"""
+    calls = []
+    next_update_id = 1
+    for telegram_id in user_ids:
+        retried_update_id = next_update_id
+        next_update_id += 1
+        for n in range(repeats):
+            if n % 2 == 0:
+                calls.append((telegram_id, retried_update_id))
+            else:
+                calls.append((telegram_id, next_update_id))
+                next_update_id += 1
+    random.Random(7).shuffle(calls)
+    return calls
+
+def verify(user_ids, results):
+    """בדיקה שכל משתמש זוכה פעם אחת ושהסטטיסטיקות היומיות תואמות - מחזיר רשימת שגיאות"""
+    errors = []
+    session = Session()
+    try:
+        attendance = dict(session.query(Attendance.telegram_id, func.count(Attendance.id))
+                          .group_by(Attendance.telegram_id).all())
+        earned = dict(session.query(Attendance.telegram_id, Attendance.tokens_earned).all())
+        winners = dict(session.query(Attendance.telegram_id, Attendance.update_id).all())
+        daily = dict(session.query(UserDailyStats.telegram_id, UserDailyStats.tokens_earned).all())
+        tokens = dict(session.query(User.telegram_id, User.tokens).all())
+    finally:
+        session.close()
+
+    for telegram_id in user_ids:
+        if attendance.get(telegram_id) != 1:
+            errors.append(f"{telegram_id}: {attendance.get(telegram_id, 0)} רשומות נוכחות")
+            continue
+        if tokens[telegram_id] != START_TOKENS + earned[telegram_id]:
+            errors.append(f"{telegram_id}: יתרה {tokens[telegram_id]} במקום {START_TOKENS + earned[telegram_id]}")
+        if daily.get(telegram_id) != earned[telegram_id]:
+            errors.append(f"{telegram_id}: סטטיסטיקה יומית {daily.get(telegram_id)} במקום {earned[telegram_id]}")
+
+        # כל הקריאות עם ה-update_id המנצח הצליחו, וכל השאר נדחו
+        for update_id, success in results[telegram_id]:
+            if success != (update_id == winners[telegram_id]):
+                errors.append(f"{telegram_id}: update_id {update_id} החזיר {success}")
+                break
+    return errors
+
+async def run_starts(starts, concurrency):
+    """/start לכל (משתמש חדש, מזמין) דרך שכבת השירות, עד concurrency במקביל - מחזיר את התשובות"""
+    from bot import services
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def start(telegram_id, referrer_id):
+        request = services.CommandRequest(
+            user=SimpleNamespace(id=telegram_id, username=None, first_name=f'new{telegram_id}', last_name=None),
+            args=(f'C{referrer_id}',)
+        )
+        async with semaphore:
+            return await services.execute(services.start, request)
+
+    return await asyncio.gather(*(start(telegram_id, referrer_id) for telegram_id, referrer_id in starts))
+
+def verify_starts(starts, replies):
+    """בדיקה שכל /start רשם את המשתמש ושכל מזמין זוכה פעם אחת לכל מוזמן - מחזיר רשימת שגיאות"""
+    errors = [f"{telegram_id}: {reply.text.splitlines()[0]}"
+              for (telegram_id, _), reply in zip(starts, replies) if 'נרשמת בהצלחה' not in reply.text]
+
+    expected = Counter(referrer_id for _, referrer_id in starts)
+    session = Session()
+    try:
+        referrals = dict(session.query(Referral.referrer_id, func.count(Referral.id))
+                         .group_by(Referral.referrer_id).all())
+        credited = dict(session.query(User.telegram_id, User.referral_tokens)
+                        .filter(User.telegram_id.in_(expected)).all())
+    finally:
+        session.close()
+
+    for referrer_id, count in expected.items():
+        if referrals.get(referrer_id) != count or (credited.get(referrer_id) or 0) != count * 10:
+            errors.append(f"מזמין {referrer_id}: {referrals.get(referrer_id, 0)} הפניות, "
+                          f"{credited.get(referrer_id) or 0} טוקני הפניה במקום {count} / {count * 10}")
+    return errors
+
+def main():
+    parser = argparse.ArgumentParser(description="בדיקת עומס לצ'ק-אין מקבילי")
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--repeats', type=int, default=6)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--database-url', default=None,
+                        help="מסד ריק לבדיקה (ברירת מחדל: SQLite זמני)")
+    args = parser.parse_args()
+
+    from database.queries import checkin_user
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        Session.configure(bind=engine)
+
+        user_ids = list(range(5000, 5000 + args.users))
+        populate(engine, user_ids)
+        calls = build_calls(user_ids, args.repeats)
+
+        print(f"🔧 {len(calls)} צ'ק-אינים ל-{args.users} משתמשים ב-{args.threads} threads...")
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            outcomes = list(executor.map(lambda call: checkin_user(call[0], update_id=call[1]), calls))
+        elapsed = time.perf_counter() - started
+
+        results = defaultdict(list)
+        for (telegram_id, update_id), (success, _) in zip(calls, outcomes):
+            results[telegram_id].append((update_id, success))
+
+        errors = verify(user_ids, results)
+        print(f"⏱️ {elapsed:.2f} שניות ({len(calls) / elapsed:.0f} צ'ק-אינים לשנייה)")
+        if errors:
+            print(f"❌ נמצאו {len(errors)} שגיאות:")
+            for error in errors[:20]:
+                print(f"   • {error}")
+            sys.exit(1)
+        print(f"✅ כל משתמש זוכה פעם אחת בדיוק")
+
+        # /start מקבילי - משתמשים חדשים, כל אחד דרך קוד ההפניה של אחד המשתמשים הקיימים
+        starts = [(9_000_000 + i, user_ids[i % len(user_ids)]) for i in range(args.users)]
+        print(f"\n🔧 {len(starts)} פקודות /start עם קוד הפניה, עד {args.threads} במקביל...")
+        started = time.perf_counter()
+        replies = asyncio.run(run_starts(starts, args.threads))
+        elapsed = time.perf_counter() - started
+
+        errors = verify_starts(starts, replies)
+        print(f"⏱️ {elapsed:.2f} שניות ({len(starts) / elapsed:.0f} רישומים לשנייה)")
+        if errors:
+            print(f"❌ נמצאו {len(errors)} שגיאות:")
+            for error in errors[:20]:
+                print(f"   • {error}")
+            sys.exit(1)
+        print(f"✅ כל /start נרשם וכל מזמין זוכה על כל מוזמן")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+בנצ'מרק עליית תהליך קרה - זמן היבוא של המודולים ושל create_app(), כל מדידה בתהליך Python חדש
+(כמו worker של gunicorn), ובדיקה שהיבוא עצמו לא יוצר את data/, את קובץ המסד או את crypto_class.log
+
+שימוש: python benchmarks/bench_import_time.py [--runs N]
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# כל שלב רץ בתהליך נפרד ומדפיס את הזמן שלו ב-JSON
+STEPS = {
+    'import database.queries': "import database.queries",
+    'import bot.main': "import bot.main",
+    'import bot.asgi': "import bot.asgi",
+    'create_app()': "import bot.main\nbot.main.create_app()",
+}
+
+PROBE = """
+import sys, time, json
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+{code}
+print(json.dumps(time.perf_counter() - started))
+"""
+
+def run_step(code, env, cwd):
+    output = subprocess.run([sys.executable, '-c', PROBE.format(root=ROOT, code=code)], cwd=cwd, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def side_effects(tmp, db_path):
+    """קבצים שנוצרו בתיקיית העבודה ובמסד"""
+    created = [name for name in ('data', 'crypto_class.log') if os.path.exists(os.path.join(tmp, name))]
+    if os.path.exists(db_path):
+        created.append(os.path.basename(db_path))
+    return created
+
+def main():
+    parser = argparse.ArgumentParser(description="בנצ'מרק זמן עלייה")
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'שלב':<26} {'חציון (ms)':>11} {'מירבי (ms)':>11}  תופעות לוואי")
+    for name, code in STEPS.items():
+        timings = []
+        created = set()
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory() as tmp:
+                db_path = os.path.join(tmp, 'bench.db')
+                env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", PYTHONPATH=ROOT, WEBHOOK_URL="")
+                # בלי טוקן היבוא חייב להצליח; create_app() צריך טוקן (ה-Application לא פונה לטלגרם)
+                if name == 'create_app()':
+                    env['BOT_TOKEN'] = "123456:bench"
+                else:
+                    env.pop('BOT_TOKEN', None)
+                timings.append(run_step(code, env, tmp))
+                created.update(side_effects(tmp, db_path))
+        timings.sort()
+        print(f"{name:<26} {timings[len(timings) // 2] * 1000:>11.1f} {timings[-1] * 1000:>11.1f}  "
+              f"{', '.join(sorted(created)) or 'אין'}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+בנצ'מרק עקומת הרמות - חיפוש רמה בודד (הטבלאות הישנות מול bisect), חישוב רמות במנה
+(מסלול וקטורי) ו-recompute_user_levels על מסד SQLite זמני
+
+שימוש: python benchmarks/bench_levels.py [--users N] [--lookups N] [--batch-size N]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+
+from database.engine import create_db_engine
+from database.models import Base, Session, User
+from database import levels
+
+def legacy_level(experience):
+    """update_user_level לפני עקומת הרמות - הטבלה נבנית מחדש ונסרקת בכל קריאה"""
+    level_thresholds = [0, 100, 300, 600, 1000, 1500, 2100, 2800,
+                        3600, 4500, 5500, 6600, 7800, 9100, 10500]
+    new_level = 1
+    for i, threshold in enumerate(level_thresholds[1:], 1):
+        if experience >= threshold:
+            new_level = i + 1
+        else:
+            break
+    return new_level
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="בנצ'מרק עקומת הרמות")
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=1000000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    values = [rng.randint(0, 20000) for _ in range(args.lookups)]
+
+    legacy, legacy_time = timed(lambda: [legacy_level(value) for value in values])
+    single, single_time = timed(lambda: [levels.level_for_experience(value) for value in values])
+    bulk, bulk_time = timed(levels.levels_for_experience, values)
+    assert legacy == single == bulk
+
+    engine_name = "NumPy" if levels.numpy is not None else "array + bisect"
+    print(f"🔢 {args.lookups:,} חישובי רמה:")
+    print(f"   טבלה ישנה (סריקה):  {legacy_time * 1000:8.1f}ms")
+    print(f"   bisect (בודד):       {single_time * 1000:8.1f}ms")
+    print(f"   מנה ({engine_name}): {bulk_time * 1000:8.1f}ms")
+
+    from database.queries import recompute_user_levels
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        Session.configure(bind=engine)
+
+        now = datetime.now()
+        with engine.begin() as conn:
+            conn.execute(insert(User), [
+                {
+                    'telegram_id': 1000 + i,
+                    'first_name': f'user{i}',
+                    'experience': rng.randint(0, 20000),
+                    'level': 1,
+                    'next_level_exp': 100,
+                    'referral_code': f'R{i:07d}',
+                    'created_at': now,
+                }
+                for i in range(args.users)
+            ])
+
+        result, elapsed = timed(recompute_user_levels, args.batch_size)
+        print(f"\n🔄 recompute_user_levels: {result['changed']:,}/{result['users']:,} משתמשים עודכנו "
+              f"ב-{elapsed:.2f} שניות ({result['users'] / elapsed:,.0f} משתמשים לשנייה)")
+
+        result, elapsed = timed(recompute_user_levels, args.batch_size)
+        print(f"🔁 הרצה חוזרת (אין שינויים): {result['changed']:,} עודכנו ב-{elapsed:.2f} שניות")
+        engine.dispose()
+
+if __name__ == '__main__':
+    main()
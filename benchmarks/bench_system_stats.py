@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+בנצ'מרק get_system_stats / get_today_stats / get_checkin_data - מספר שאילתות וזמן תגובה
+יוצר מסד SQLite זמני עם 10,000 משתמשים ו-1,000,000 רשומות נוכחות, ומחשב את
+טבלת המדדים היומיים (daily_rollups) כמו ב-python -m database.maintenance rollups
+
+שימוש: python benchmarks/bench_system_stats.py [--users N] [--attendance N] [--runs N]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, insert
+
+from database.engine import create_db_engine
+from database.models import Base, Session, User, Attendance, Task, TaskCompletion, Referral
+from database.models import TaskStatus, TaskFrequency, TaskType
+
+def populate(engine, users, attendance_rows, batch_size=50000):
+    """מילוי מסד הנתונים בנתונים סינתטיים"""
+    today = date.today()
+    now = datetime.now()
+    rng = random.Random(42)
+
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {
+                'telegram_id': 1000 + i,
+                'first_name': f'user{i}',
+                'tokens': rng.randint(0, 5000),
+                'level': rng.randint(1, 10),
+                'experience': rng.randint(0, 10000),
+                'referral_code': f'R{i:07d}',
+                'created_at': now - timedelta(days=rng.randint(0, 365)),
+            }
+            for i in range(users)
+        ])
+        conn.execute(insert(Task), [
+            {
+                'name': f'task{i}',
+                'task_type': TaskType.OTHER,
+                'frequency': TaskFrequency.DAILY,
+                'tokens_reward': 1,
+            }
+            for i in range(20)
+        ])
+        conn.execute(insert(Referral), [
+            {'referrer_id': 1000 + i, 'referred_id': 1001 + i, 'referral_code': f'R{i:07d}'}
+            for i in range(0, users - 1, 10)
+        ])
+
+    # נוכחות - כל משתמש מקבל רצף ימים ייחודי כדי לשמור על המפתח (משתמש, תאריך)
+    days_per_user = max(attendance_rows // users, 1)
+    batch = []
+    with engine.begin() as conn:
+        for i in range(users):
+            for d in range(days_per_user):
+                batch.append({
+                    'telegram_id': 1000 + i,
+                    'date': today - timedelta(days=d),
+                    'tokens_earned': 1,
+                })
+                if len(batch) >= batch_size:
+                    conn.execute(insert(Attendance), batch)
+                    batch = []
+        if batch:
+            conn.execute(insert(Attendance), batch)
+
+        conn.execute(insert(TaskCompletion), [
+            {
+                'telegram_id': 1000 + rng.randrange(users),
+                'task_id': rng.randint(1, 20),
+                'tokens_earned': 1,
+                'status': TaskStatus.COMPLETED,
+                'completed_at': now - timedelta(days=rng.randint(0, 90)),
+            }
+            for _ in range(users * 5)
+        ])
+
+def main():
+    parser = argparse.ArgumentParser(description="בנצ'מרק get_system_stats")
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--attendance', type=int, default=1000000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    from database.queries import get_system_stats, get_today_stats, get_checkin_data, backfill_daily_rollups
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        Session.configure(bind=engine)
+
+        print(f"🔧 יוצר {args.users:,} משתמשים ו-{args.attendance:,} רשומות נוכחות...")
+        started = time.perf_counter()
+        populate(engine, args.users, args.attendance)
+        print(f"✅ הנתונים נוצרו ב-{time.perf_counter() - started:.1f} שניות")
+
+        started = time.perf_counter()
+        days = backfill_daily_rollups()
+        print(f"✅ מדדים יומיים ל-{days} ימים חושבו ב-{time.perf_counter() - started:.1f} שניות")
+
+        statements = []
+        event.listen(engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *a: statements.append(statement))
+
+        # בלי המטמון - מודדים את השאילתות עצמן
+        readers = {
+            'get_system_stats': get_system_stats.uncached,
+            'get_today_stats': get_today_stats.uncached,
+            'get_checkin_data(30)': lambda: get_checkin_data(30),
+        }
+        print()
+        for name, reader in readers.items():
+            timings = []
+            for _ in range(args.runs):
+                statements.clear()
+                started = time.perf_counter()
+                reader()
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            print(f"📊 {name}: {len(statements)} שאילתות | חציון {timings[len(timings) // 2] * 1000:.1f}ms"
+                  f" | מירבי {timings[-1] * 1000:.1f}ms")
+
+        stats = get_system_stats.uncached()
+        print(f"👥 משתמשים: {stats['total_users']:,} | 📅 צ'ק-אינים: {stats['total_checkins']:,}")
+
+if __name__ == '__main__':
+    main()
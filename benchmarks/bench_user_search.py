@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+בנצ'מרק חיפוש משתמשים - אינדקס החיפוש מול ILIKE '%q%' על ארבע עמודות
+כל backend נמדד על אותם חיפושים: שם, שם משתמש, שתי מילים, תחילית מזהה ומילה קצרה
+
+שימוש: python benchmarks/bench_user_search.py [--users N] [--database-url URL]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, or_, cast, String
+
+from database.engine import create_db_engine
+from database.models import Base, Session, User
+from database.migrations import upgrade_schema
+from database import search
+
+FIRST_NAMES = ["דני", "נועה", "יוסי", "מיכל", "Alex", "Maria", "David", "Sarah", "אורי", "תמר", "John", "Lior"]
+LAST_NAMES = ["כהן", "לוי", "מזרחי", "Smith", "Johnson", "פרץ", "Brown", "ביטון", "Garcia", "אברהם"]
+
+def populate(engine, users):
+    rng = random.Random(3)
+    telegram_ids = rng.sample(range(10 ** 8, 10 ** 10), users)
+    rows = []
+    for i in range(users):
+        first = rng.choice(FIRST_NAMES)
+        last = rng.choice(LAST_NAMES)
+        rows.append({
+            'telegram_id': telegram_ids[i],
+            'first_name': first,
+            'last_name': last,
+            'username': f"{first.lower()}_{last.lower()}{i}" if i % 3 else None,
+            'tokens': rng.randrange(500),
+            'referral_code': f"S{i}",
+        })
+    with engine.begin() as conn:
+        for start in range(0, len(rows), 10000):
+            conn.execute(insert(User), rows[start:start + 10000])
+    return rows
+
+def ilike_search(session, query, limit=20):
+    """החיפוש הקודם - לא יכול להשתמש באינדקס"""
+    return session.query(User.id).filter(or_(
+        User.first_name.ilike(f"%{query}%"),
+        User.last_name.ilike(f"%{query}%"),
+        User.username.ilike(f"%{query}%"),
+        cast(User.telegram_id, String).ilike(f"%{query}%")
+    )).limit(limit).all()
+
+def measure(func, repeats=20):
+    func()
+    started = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - started) / repeats * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="בנצ'מרק חיפוש משתמשים")
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--database-url', default=None, help="מסד ריק לבדיקה (ברירת מחדל: SQLite זמני)")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        Session.configure(bind=engine)
+        rows = populate(engine, args.users)
+        started = time.perf_counter()
+        upgrade_schema(engine)
+        print(f"🔧 {args.users} משתמשים, בניית אינדקס: {time.perf_counter() - started:.1f} שניות")
+
+        sample = rows[len(rows) // 2]
+        queries = {
+            'שם': "מיכל",
+            'שם משתמש': sample['username'] or "sarah_brown",
+            'שתי מילים': "david smith",
+            'תחילית מזהה': str(sample['telegram_id'])[:6],
+            'מילה קצרה': "jo",
+        }
+
+        session = Session()
+        try:
+            backends = [search.get_search_backend(session), search.NgramSearchBackend()]
+            print(f"\n{'חיפוש':<14} {'ILIKE (ms)':>11}" + "".join(f" {b.name + ' (ms)':>14}" for b in backends))
+            for label, query in queries.items():
+                line = f"{label:<14} {measure(lambda: ilike_search(session, query)):>11.2f}"
+                for backend in backends:
+                    search._backends[str(engine.url)] = backend
+                    line += f" {measure(lambda: search.search_user_ids(session, query)):>14.2f}"
+                print(line)
+        finally:
+            session.close()
+
+if __name__ == '__main__':
+    main()
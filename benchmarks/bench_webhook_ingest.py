@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+בנצ'מרק קליטת webhook - עדכונים לשנייה דרך נקודת /webhook של Flask
+ה-Application עובד מול Bot API מקומי (ללא רשת), וה-handler מדמה עבודה עם השהיה
+
+שימוש: python benchmarks/bench_webhook_ingest.py [--updates N] [--threads N] [--handler-ms N]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.ext import Application, MessageHandler, filters
+from telegram.request import BaseRequest
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+class LocalBotAPI(BaseRequest):
+    """Bot API מדומה - getMe ו-sendMessage נענים מיד"""
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return 5
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit('/', 1)[-1]
+        if endpoint == 'getMe':
+            result = BOT_USER
+        else:
+            params = request_data.parameters if request_data else {}
+            result = {"message_id": 1, "date": int(time.time()),
+                      "chat": {"id": int(params.get('chat_id', 1)), "type": "private"},
+                      "text": params.get('text', '')}
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+def build_application(handler_delay, concurrency):
+    """Application עם handler שמדמה עבודה (שאילתה) ושולח תשובה"""
+    application = (Application.builder()
+                   .token("1:bench")
+                   .request(LocalBotAPI())
+                   .get_updates_request(LocalBotAPI())
+                   .concurrent_updates(concurrency)
+                   .build())
+
+    async def handle(update, context):
+        await asyncio.sleep(handler_delay)
+        await update.message.reply_text("ok")
+
+    application.add_handler(MessageHandler(filters.TEXT, handle))
+    return application
+
+def make_update(update_id):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": 1000 + update_id % 50, "type": "private"},
+            "from": {"id": 1000 + update_id % 50, "is_bot": False, "first_name": "u"},
+            "text": "hello",
+        },
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="בנצ'מרק קליטת webhook")
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=4, help="threads של שרת ה-WSGI")
+    parser.add_argument('--handler-ms', type=float, default=20)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    # ה-Application של הבנצ'מרק במקום create_bot() - מסד זמני כדי לא לגעת ב-data/
+    tmp = tempfile.mkdtemp()
+    os.environ.setdefault("BOT_TOKEN", "1:bench")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+
+    import logging
+    from bot import main as bot_main
+    from bot.ingestion import WebhookIngestor
+    logging.disable(logging.WARNING)
+
+    bot_main.bot_app = build_application(args.handler_ms / 1000, args.concurrency)
+    bot_main._ingestor = WebhookIngestor(bot_main.bot_app)
+    client = bot_main.flask_app.test_client()
+
+    def post(update_id):
+        started = time.perf_counter()
+        response = client.post('/webhook', json=make_update(update_id))
+        return response.status_code, time.perf_counter() - started
+
+    client.post('/webhook', json=make_update(0))  # הפעלת ה-Application
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        results = list(executor.map(post, range(1, args.updates + 1)))
+    accepted_in = time.perf_counter() - started
+
+    while bot_main._ingestor.metrics()["backlog"]:
+        time.sleep(0.01)
+    processed_in = time.perf_counter() - started
+
+    latencies = sorted(latency for _, latency in results)
+    metrics = bot_main._ingestor.metrics()
+    bot_main._ingestor.stop()
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    ok = sum(1 for status, _ in results if status == 200)
+    print(f"📨 {ok}/{args.updates} עדכונים התקבלו (200) ב-{accepted_in:.2f} שניות "
+          f"({args.updates / accepted_in:.0f} לשנייה)")
+    print(f"⏱️ זמן תגובה: חציון {latencies[len(latencies) // 2] * 1000:.2f}ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms")
+    print(f"✅ כל העדכונים שהתקבלו טופלו תוך {processed_in:.2f} שניות ({ok / processed_in:.0f} לשנייה)")
+    print(f"📊 עומק תור מירבי: {metrics['max_backlog_seen']} | נדחו: {metrics['rejected']} | "
+          f"נכשלו: {metrics['failed']}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+בדיקת עומס - שרת ה-ASGI (uvicorn bot.asgi:app) מול תהליך ה-web של ה-Procfile
+(gunicorn "bot.main:create_app()", עם --workers/--threads כמו ב-railway.json)
+
+שני השרתים עולים מול Bot API מקומי מדומה ומסד SQLite זמני, ולכל נקודת קצה
+נמדדים בקשות לשנייה וזמן תגובה p50/p99.
+
+שימוש: python benchmarks/load_test_web.py [--requests N] [--concurrency N] [--workers N] [--threads N]
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import httpx
+import uvicorn
+
+BENCH_TOKEN = "123456:bench"
+
+# ========== Bot API מדומה ==========
+
+async def fake_bot_api(scope, receive, send):
+    """עונה על getMe ועל כל שליחת הודעה כמו api.telegram.org"""
+    if scope['type'] != 'http':
+        return
+    while (await receive()).get('more_body'):
+        pass
+    method = scope['path'].rsplit('/', 1)[-1]
+    if method == 'getMe':
+        result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+    elif method == 'setWebhook':
+        result = True
+    else:
+        result = {"message_id": 1, "date": int(time.time()), "chat": {"id": 1, "type": "private"}, "text": ""}
+    body = json.dumps({"ok": True, "result": result}).encode()
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': body})
+
+def serve_fake_bot_api(port):
+    uvicorn.run(fake_bot_api, host='127.0.0.1', port=port, log_level='warning')
+
+# ========== שרתים ==========
+
+def start_server(command, env):
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, start_new_session=True)
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=15)
+    except Exception:
+        os.killpg(process.pid, signal.SIGKILL)
+
+async def wait_until_ready(base_url, timeout=60):
+    async with httpx.AsyncClient() as client:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{base_url}/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"השרת ב-{base_url} לא עלה")
+
+# ========== עומס ==========
+
+def make_update(update_id):
+    user = {"id": 900000 + update_id % 500, "is_bot": False, "first_name": "load"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()),
+            "chat": {"id": user["id"], "type": "private"}, "from": user,
+            "text": "/balance", "entities": [{"type": "bot_command", "offset": 0, "length": 8}],
+        },
+    }
+
+async def wait_for_drain(base_url, timeout=120):
+    """המתנה עד שכל העדכונים שהתקבלו טופלו - כדי שהשלב הבא לא יימדד על שרת עמוס"""
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        deadline = time.monotonic() + timeout
+        idle_polls = 0
+        while time.monotonic() < deadline and idle_polls < 10:
+            metrics = (await client.get('/webhook/metrics')).json()
+            idle_polls = idle_polls + 1 if not metrics.get('backlog') else 0
+            await asyncio.sleep(0.1)
+
+async def load(base_url, method, path, requests, concurrency):
+    """requests בקשות עם concurrency לקוחות במקביל - מחזיר (בקשות לשנייה, p50, p99, שגיאות)"""
+    latencies = []
+    errors = {}
+    counter = iter(range(requests))
+
+    async def worker(client):
+        for n in counter:
+            started = time.perf_counter()
+            try:
+                if method == 'POST':
+                    response = await client.post(path, json=make_update(n + 1))
+                else:
+                    response = await client.get(path)
+                if response.status_code >= 400:
+                    errors[response.status_code] = errors.get(response.status_code, 0) + 1
+            except httpx.HTTPError as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return (requests / elapsed, latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000, errors)
+
+ENDPOINTS = [
+    ('POST', '/webhook'),
+    ('GET', '/health'),
+    ('GET', '/api/stats'),
+    ('GET', '/api/leaderboard'),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description="בדיקת עומס ASGI מול Procfile")
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--port', type=int, default=8701)
+    parser.add_argument('--serve-fake-bot-api', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_fake_bot_api:
+        serve_fake_bot_api(args.port)
+        return
+
+    tmp = tempfile.mkdtemp()
+    env = dict(os.environ,
+               BOT_TOKEN=BENCH_TOKEN,
+               WEBHOOK_URL="",
+               TELEGRAM_BASE_URL=f"http://127.0.0.1:{args.port}",
+               DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+               PYTHONPATH=ROOT)
+
+    # אתחול המסד פעם אחת לפני שהתהליכים עולים
+    subprocess.run([sys.executable, '-c', 'from database.db import ensure_database_initialized; ensure_database_initialized()'], cwd=ROOT, env=env,
+                   stdout=subprocess.DEVNULL, check=True)
+    fake_api = start_server([sys.executable, os.path.abspath(__file__), '--serve-fake-bot-api',
+                             '--port', str(args.port)], env)
+
+    servers = {
+        'procfile (gunicorn + Flask)': [
+            'gunicorn', 'bot.main:create_app()', f'--workers={args.workers}', f'--threads={args.threads}',
+            f'--bind=127.0.0.1:{args.port + 1}'
+        ],
+        'asgi (uvicorn bot.asgi:app)': [
+            'uvicorn', 'bot.asgi:app', '--workers', str(args.workers), '--host', '127.0.0.1',
+            '--port', str(args.port + 2), '--log-level', 'warning'
+        ],
+    }
+
+    results = {}
+    for offset, (name, command) in enumerate(servers.items(), 1):
+        base_url = f"http://127.0.0.1:{args.port + offset}"
+        process = start_server(command, env)
+        try:
+            asyncio.run(wait_until_ready(base_url))
+            # חימום - הפעלת ה-Application בכל תהליך ומילוי המטמון
+            asyncio.run(load(base_url, 'POST', '/webhook', args.concurrency * 2, args.concurrency))
+            asyncio.run(wait_for_drain(base_url))
+            for method, path in ENDPOINTS:
+                results[(name, path)] = asyncio.run(load(base_url, method, path, args.requests, args.concurrency))
+                asyncio.run(wait_for_drain(base_url))
+        finally:
+            stop_server(process)
+    stop_server(fake_api)
+
+    print(f"\n📊 {args.requests} בקשות לכל נקודה, {args.concurrency} לקוחות במקביל, {args.workers} תהליכים\n")
+    print(f"{'שרת':<30} {'נקודה':<18} {'בקשות/שנייה':>12} {'p50 (ms)':>10} {'p99 (ms)':>10}  שגיאות")
+    for (name, path), (rps, p50, p99, errors) in results.items():
+        errors = ", ".join(f"{code}: {count}" for code, count in errors.items()) or "0"
+        print(f"{name:<30} {path:<18} {rps:>12.0f} {p50:>10.1f} {p99:>10.1f}  {errors}")
+
+if __name__ == '__main__':
+    main()
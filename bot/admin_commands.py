@@ -5,66 +5,34 @@
 """
 
 import logging
-import asyncio
 from datetime import datetime
-from database.queries import (
-    get_user, get_all_users, get_top_users, get_system_stats,
-    add_tokens_to_user, reset_user_checkin, broadcast_message_to_all
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from database.async_queries import (
+    count_users, get_users_keyset_page, search_users, get_top_users, get_system_stats,
+    create_broadcast_job, cancel_broadcast_job
 )
+from bot import services
+from bot.services import is_admin
+from bot.commands import respond
+from bot.broadcast import get_broadcast_engine
 
 logger = logging.getLogger(__name__)
 
-# רשימת אדמינים (ניתן גם להגדיר ב-env)
-ADMIN_IDS = [224223270]  # החלף ל-telegram_id שלך
-
-def is_admin(user_id):
-    """בדיקה אם משתמש הוא אדמין"""
-    return user_id in ADMIN_IDS
+# ========== פקודות משותפות (bot/services.py) ==========
 
 async def admin_panel(update, context):
     """פאנל ניהול למנהלי המערכת"""
-    try:
-        user = update.effective_user
-        
-        # בדוק אם המשתמש הוא אדמין
-        if not is_admin(user.id):
-            await update.message.reply_text(
-                "❌ **אין לך הרשאות ניהול!**\n\n"
-                "רק מנהלי המערכת יכולים להשתמש בפקודה זו.",
-                parse_mode="Markdown"
-            )
-            return
-        
-        # קבל סטטיסטיקות מערכת
-        stats = get_system_stats()
-        
-        response = (
-            "👑 **פאנל ניהול - Crypto-Class**\n\n"
-            "📊 **סטטיסטיקות מערכת:**\n"
-            f"• 👥 משתמשים: {stats.get('total_users', 0):,}\n"
-            f"• 📅 פעילים היום: {stats.get('active_today', 0):,}\n"
-            f"• 💰 טוקנים כוללים: {stats.get('total_tokens', 0):,}\n\n"
-            "⚙️ **פקודות ניהול:**\n"
-            "• `/admin_stats` - סטטיסטיקות מפורטות\n"
-            "• `/admin_users` - ניהול משתמשים\n"
-            "• `/admin_broadcast` - שליחת הודעה לכולם\n"
-            "• `/add_tokens <user_id> <amount>` - הוספת טוקנים\n"
-            "• `/reset_checkin <user_id>` - איפוס צ'ק-אין\n\n"
-            "🌐 **דשבורד אתר:**\n"
-            "• אתר: https://school-production-4d9d.up.railway.app\n"
-            "• דשבורד מורה: /teacher\n"
-            "• סטטיסטיקות: /stats\n\n"
-            "🆔 **מזהה האדמין שלך:** {user.id}"
-        )
-        
-        await update.message.reply_text(response, parse_mode="Markdown")
-        
-    except Exception as e:
-        logger.error(f"❌ שגיאה בפקודת admin: {e}")
-        await update.message.reply_text(
-            "❌ אירעה שגיאה בגישה לפאנל הניהול.",
-            parse_mode="Markdown"
-        )
+    await respond(update, context, services.admin_panel)
+
+async def add_tokens(update, context):
+    """הוספת טוקנים למשתמש"""
+    await respond(update, context, services.add_tokens)
+
+async def reset_checkin(update, context):
+    """איפוס צ'ק-אין למשתמש"""
+    await respond(update, context, services.reset_checkin)
+
+# ========== פקודות אדמין ==========
 
 async def admin_stats(update, context):
     """סטטיסטיקות מפורטות למערכת"""
@@ -77,9 +45,8 @@ async def admin_stats(update, context):
             return
         
         # קבל סטטיסטיקות
-        stats = get_system_stats()
-        top_users = get_top_users(5, 'tokens')
-        all_users = get_all_users()
+        stats = await get_system_stats()
+        top_users = await get_top_users(5, 'tokens')
         
         response = (
             "📊 **סטטיסטיקות מפורטות - Crypto-Class**\n\n"
@@ -93,10 +60,9 @@ async def admin_stats(update, context):
             name = top_user.first_name or top_user.username or f"משתמש {top_user.telegram_id}"
             response += f"{i}. {name} - {top_user.tokens:,} טוקנים\n"
         
-        # חישוב ממוצע טוקנים
-        if all_users:
-            avg_tokens = sum(u.tokens for u in all_users) / len(all_users)
-            response += f"\n📈 **ממוצע טוקנים למשתמש:** {avg_tokens:.1f}"
+        # ממוצע טוקנים - מחושב במסד יחד עם שאר הסטטיסטיקות
+        if stats.get('total_users'):
+            response += f"\n📈 **ממוצע טוקנים למשתמש:** {stats.get('avg_tokens', 0):.1f}"
         
         response += f"\n\n⏰ **זמן מערכת:** {datetime.now().strftime('%H:%M:%S %d/%m/%Y')}"
         
@@ -106,8 +72,45 @@ async def admin_stats(update, context):
         logger.error(f"❌ שגיאה בפקודת admin_stats: {e}")
         await update.message.reply_text("❌ שגיאה בטעינת סטטיסטיקות.")
 
+# משתמשים בכל דף של /admin_users
+ADMIN_USERS_PAGE_SIZE = 10
+
+def users_page_message(page, total_users):
+    """טקסט ומקלדת (הקודם / הבא) לדף ברשימת המשתמשים"""
+    order = page['order']
+    response = (
+        "👥 **רשימת משתמשים - Crypto-Class**\n\n"
+        f"📋 **סה\"כ משתמשים:** {total_users}\n"
+        f"🔃 **מיון:** {'לפי טוקנים' if order == 'tokens' else 'החדשים קודם'}\n\n"
+    )
+    
+    for user_obj in page['users']:
+        name = user_obj.first_name or user_obj.username or f"משתמש {user_obj.telegram_id}"
+        created = user_obj.created_at.strftime('%d/%m/%Y') if user_obj.created_at else "לא ידוע"
+        response += (
+            f"• **{name}**\n"
+            f"   🆔: {user_obj.telegram_id}\n"
+            f"   💰: {user_obj.tokens:,} טוקנים\n"
+            f"   📅: {created}\n\n"
+        )
+    
+    response += (
+        "\n⚙️ **פקודות ניהול משתמשים:**\n"
+        "• `/admin_users tokens` - מיון לפי טוקנים\n"
+        "• `/add_tokens <user_id> <amount> [reason]` - הוספת טוקנים\n"
+        "• `/reset_checkin <user_id>` - איפוס צ'ק-אין\n"
+    )
+    
+    # המצביע עובר ב-callback_data (עד 64 בתים) - אין צורך לשמור מצב בשרת
+    buttons = []
+    if page['prev_cursor']:
+        buttons.append(InlineKeyboardButton("→ הקודם", callback_data=f"admin_users:{order}:p:{page['prev_cursor']}"))
+    if page['next_cursor']:
+        buttons.append(InlineKeyboardButton("הבא ←", callback_data=f"admin_users:{order}:n:{page['next_cursor']}"))
+    return response, InlineKeyboardMarkup([buttons]) if buttons else None
+
 async def admin_users(update, context):
-    """רשימת משתמשים למערכת"""
+    """רשימת משתמשים למערכת - דף ראשון, עם כפתורי דפדוף"""
     try:
         user = update.effective_user
         
@@ -116,46 +119,47 @@ async def admin_users(update, context):
             await update.message.reply_text("❌ אין לך הרשאות ניהול.")
             return
         
-        # קבל את כל המשתמשים
-        all_users = get_all_users()
+        total_users = await count_users()
         
-        if not all_users:
+        if not total_users:
             await update.message.reply_text("📭 אין משתמשים רשומים במערכת.")
             return
         
-        response = (
-            "👥 **רשימת משתמשים - Crypto-Class**\n\n"
-            f"📋 **סה\"כ משתמשים:** {len(all_users)}\n\n"
-        )
+        order = context.args[0] if context.args else 'created'
+        page = await get_users_keyset_page(order, limit=ADMIN_USERS_PAGE_SIZE)
+        response, keyboard = users_page_message(page, total_users)
         
-        # הצג 10 משתמשים ראשונים
-        for i, user_obj in enumerate(all_users[:10], 1):
-            name = user_obj.first_name or user_obj.username or f"משתמש {user_obj.telegram_id}"
-            created = user_obj.created_at.strftime('%d/%m/%Y') if user_obj.created_at else "לא ידוע"
-            response += (
-                f"{i}. **{name}**\n"
-                f"   🆔: {user_obj.telegram_id}\n"
-                f"   💰: {user_obj.tokens:,} טוקנים\n"
-                f"   📅: {created}\n\n"
-            )
+        await update.message.reply_text(response, parse_mode="Markdown", reply_markup=keyboard)
         
-        if len(all_users) > 10:
-            response += f"\n... ועוד {len(all_users) - 10} משתמשים."
+    except Exception as e:
+        logger.error(f"❌ שגיאה בפקודת admin_users: {e}")
+        await update.message.reply_text("❌ שגיאה בטעינת רשימת משתמשים.")
+
+async def admin_users_page(update, context):
+    """מעבר לדף הבא / הקודם ברשימת המשתמשים (callback: admin_users:<order>:<n|p>:<cursor>)"""
+    query = update.callback_query
+    try:
+        if not is_admin(query.from_user.id):
+            await query.answer("❌ אין לך הרשאות ניהול.")
+            return
+        await query.answer()
         
-        response += (
-            "\n⚙️ **פקודות ניהול משתמשים:**\n"
-            "• `/add_tokens <user_id> <amount>` - הוספת טוקנים\n"
-            "• `/reset_checkin <user_id>` - איפוס צ'ק-אין\n"
-        )
+        _, order, direction, cursor = query.data.split(':', 3)
+        if direction == 'n':
+            page = await get_users_keyset_page(order, after=cursor, limit=ADMIN_USERS_PAGE_SIZE)
+        else:
+            page = await get_users_keyset_page(order, before=cursor, limit=ADMIN_USERS_PAGE_SIZE)
         
-        await update.message.reply_text(response, parse_mode="Markdown")
+        if not page['users']:
+            return
+        response, keyboard = users_page_message(page, await count_users())
+        await query.edit_message_text(response, parse_mode="Markdown", reply_markup=keyboard)
         
     except Exception as e:
-        logger.error(f"❌ שגיאה בפקודת admin_users: {e}")
-        await update.message.reply_text("❌ שגיאה בטעינת רשימת משתמשים.")
+        logger.error(f"❌ שגיאה בדפדוף משתמשים: {e}")
 
-async def admin_broadcast(update, context):
-    """שליחת הודעה לכל המשתמשים"""
+async def admin_search(update, context):
+    """חיפוש משתמש לפי שם, שם משתמש או תחילית מזהה"""
     try:
         user = update.effective_user
         
@@ -164,56 +168,38 @@ async def admin_broadcast(update, context):
             await update.message.reply_text("❌ אין לך הרשאות ניהול.")
             return
         
-        # בדוק אם יש טקסט בהודעה
         if not context.args:
             await update.message.reply_text(
-                "📢 **שליחת הודעה לכולם**\n\n"
-                "שימוש: `/admin_broadcast <הודעה>`\n\n"
-                "דוגמה: `/admin_broadcast הודעה חשובה לכולם!`",
+                "🔍 **חיפוש משתמשים**\n\n"
+                "שימוש: `/admin_search <שם / @username / תחילת מזהה>`",
                 parse_mode="Markdown"
             )
             return
         
-        message = " ".join(context.args)
+        query = " ".join(context.args)
+        results = await search_users(query, ADMIN_USERS_PAGE_SIZE)
+        if not results:
+            await update.message.reply_text(f"🔍 לא נמצאו משתמשים עבור: {query}")
+            return
         
-        # שליחה למשתמש הנוכחי
-        await update.message.reply_text(
-            f"📢 **מתחיל לשלוח הודעה לכולם...**\n\n"
-            f"📝 **ההודעה:**\n{message}\n\n"
-            f"⏳ נא להמתין...",
-            parse_mode="Markdown"
-        )
+        response = f"🔍 **תוצאות חיפוש:** {query}\n\n"
+        for user_obj in results:
+            name = " ".join(part for part in (user_obj.first_name, user_obj.last_name) if part) or f"משתמש {user_obj.telegram_id}"
+            username = f" (@{user_obj.username})" if user_obj.username else ""
+            response += (
+                f"• **{name}**{username}\n"
+                f"   🆔: `{user_obj.telegram_id}`\n"
+                f"   💰: {user_obj.tokens:,} טוקנים | ⭐ רמה {user_obj.level}\n\n"
+            )
         
-        # שליחה לכל המשתמשים (במקרה אמיתי, יש לעשות זאת ברקע)
-        users = get_all_users()
-        success_count = 0
-        fail_count = 0
-        
-        for user_obj in users:
-            try:
-                await context.bot.send_message(
-                    chat_id=user_obj.telegram_id,
-                    text=f"📢 **הודעה מהמערכת:**\n\n{message}",
-                    parse_mode="Markdown"
-                )
-                success_count += 1
-            except Exception as e:
-                logger.error(f"❌ שגיאה בשליחה למשתמש {user_obj.telegram_id}: {e}")
-                fail_count += 1
-        
-        await update.message.reply_text(
-            f"✅ **שליחת הודעה הושלמה!**\n\n"
-            f"✅ נשלח בהצלחה ל: {success_count} משתמשים\n"
-            f"❌ נכשל בשליחה ל: {fail_count} משתמשים",
-            parse_mode="Markdown"
-        )
+        await update.message.reply_text(response, parse_mode="Markdown")
         
     except Exception as e:
-        logger.error(f"❌ שגיאה בפקודת admin_broadcast: {e}")
-        await update.message.reply_text("❌ שגיאה בשליחת הודעה לכולם.")
+        logger.error(f"❌ שגיאה בפקודת admin_search: {e}")
+        await update.message.reply_text("❌ שגיאה בחיפוש משתמשים.")
 
-async def add_tokens(update, context):
-    """הוספת טוקנים למשתמש"""
+async def admin_broadcast(update, context):
+    """שליחת הודעה לכל המשתמשים"""
     try:
         user = update.effective_user
         
@@ -222,50 +208,45 @@ async def add_tokens(update, context):
             await update.message.reply_text("❌ אין לך הרשאות ניהול.")
             return
         
-        # בדוק את הפרמטרים
-        if len(context.args) != 2:
+        # בדוק אם יש טקסט בהודעה
+        if not context.args:
             await update.message.reply_text(
-                "💰 **הוספת טוקנים למשתמש**\n\n"
-                "שימוש: `/add_tokens <user_id> <amount>`\n\n"
-                "דוגמה: `/add_tokens 123456789 100`",
+                "📢 **שליחת הודעה לכולם**\n\n"
+                "שימוש: `/admin_broadcast <הודעה>`\n\n"
+                "דוגמה: `/admin_broadcast הודעה חשובה לכולם!`",
                 parse_mode="Markdown"
             )
             return
         
-        try:
-            target_user_id = int(context.args[0])
-            amount = int(context.args[1])
-        except ValueError:
-            await update.message.reply_text("❌ מזהה משתמש או כמות לא חוקיים.")
-            return
+        message = " ".join(context.args)
         
-        # הוסף טוקנים
-        success, new_balance = add_tokens_to_user(target_user_id, amount)
+        # הודעת ההתקדמות - מתעדכנת במהלך השידור (וגם בודקת שה-Markdown של ההודעה תקין)
+        status_message = await update.message.reply_text(
+            f"📢 **מתחיל לשלוח הודעה לכולם...**\n\n"
+            f"📝 **ההודעה:**\n{message}\n\n"
+            f"⏳ נא להמתין...",
+            parse_mode="Markdown"
+        )
         
-        if success:
-            target_user = get_user(target_user_id)
-            user_name = target_user.first_name if target_user else f"משתמש {target_user_id}"
-            
-            await update.message.reply_text(
-                f"✅ **טוקנים נוספו בהצלחה!**\n\n"
-                f"👤 **משתמש:** {user_name}\n"
-                f"🆔 **מזהה:** {target_user_id}\n"
-                f"➕ **נוספו:** {amount:,} טוקנים\n"
-                f"💰 **יתרה חדשה:** {new_balance:,} טוקנים",
-                parse_mode="Markdown"
-            )
-        else:
-            await update.message.reply_text(
-                "❌ לא ניתן להוסיף טוקנים למשתמש זה.\n"
-                "ייתכן שהמשתמש לא קיים."
-            )
+        # השידור נשמר במסד ונשלח ברקע - הפקודה לא ממתינה לסיומו
+        job_id, total = await create_broadcast_job(
+            message, user.id, status_message.chat_id, status_message.message_id
+        )
+        if job_id is None:
+            await status_message.edit_text("❌ שגיאה ביצירת השידור.")
+            return
+        if not total:
+            await status_message.edit_text("📭 אין משתמשים רשומים במערכת.")
+            return
+        
+        get_broadcast_engine(context.application).launch(job_id)
         
     except Exception as e:
-        logger.error(f"❌ שגיאה בפקודת add_tokens: {e}")
-        await update.message.reply_text("❌ שגיאה בהוספת טוקנים.")
+        logger.error(f"❌ שגיאה בפקודת admin_broadcast: {e}")
+        await update.message.reply_text("❌ שגיאה בשליחת הודעה לכולם.")
 
-async def reset_checkin(update, context):
-    """איפוס צ'ק-אין למשתמש"""
+async def admin_broadcast_cancel(update, context):
+    """ביטול שידור פעיל"""
     try:
         user = update.effective_user
         
@@ -274,42 +255,20 @@ async def reset_checkin(update, context):
             await update.message.reply_text("❌ אין לך הרשאות ניהול.")
             return
         
-        # בדוק את הפרמטרים
-        if len(context.args) != 1:
+        if len(context.args) != 1 or not context.args[0].isdigit():
             await update.message.reply_text(
-                "🔄 **איפוס צ'ק-אין למשתמש**\n\n"
-                "שימוש: `/reset_checkin <user_id>`\n\n"
-                "דוגמה: `/reset_checkin 123456789`",
+                "🛑 **ביטול שידור**\n\n"
+                "שימוש: `/admin_broadcast_cancel <מזהה שידור>`",
                 parse_mode="Markdown"
             )
             return
         
-        try:
-            target_user_id = int(context.args[0])
-        except ValueError:
-            await update.message.reply_text("❌ מזהה משתמש לא חוקי.")
-            return
-        
-        # אפס צ'ק-אין
-        success = reset_user_checkin(target_user_id)
-        
-        if success:
-            target_user = get_user(target_user_id)
-            user_name = target_user.first_name if target_user else f"משתמש {target_user_id}"
-            
-            await update.message.reply_text(
-                f"✅ **צ'ק-אין אופס בהצלחה!**\n\n"
-                f"👤 **משתמש:** {user_name}\n"
-                f"🆔 **מזהה:** {target_user_id}\n"
-                f"🔄 **ניתן כעת לבצע צ'ק-אין יומי חדש**",
-                parse_mode="Markdown"
-            )
+        job_id = int(context.args[0])
+        if await cancel_broadcast_job(job_id):
+            await update.message.reply_text(f"🛑 שידור #{job_id} בוטל - השליחה תיעצר תוך כמה שניות.")
         else:
-            await update.message.reply_text(
-                "❌ לא ניתן לאפס צ'ק-אין למשתמש זה.\n"
-                "ייתכן שהמשתמש לא קיים."
-            )
+            await update.message.reply_text(f"❌ שידור #{job_id} לא נמצא או שכבר הסתיים.")
         
     except Exception as e:
-        logger.error(f"❌ שגיאה בפקודת reset_checkin: {e}")
-        await update.message.reply_text("❌ שגיאה באיפוס צ'ק-אין.")
+        logger.error(f"❌ שגיאה בפקודת admin_broadcast_cancel: {e}")
+        await update.message.reply_text("❌ שגיאה בביטול השידור.")
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+שרת ASGI - אותו אתר ואותו webhook, על לולאת האירועים של ה-Application של הבוט
+
+/webhook, /set_webhook ו-/health רצים ישירות על הלולאה (בלי thread לכל בקשה);
+כל שאר הנתיבים (דפי HTML, API, קבצים סטטיים) עוברים ל-flask_app דרך מתאם WSGI→ASGI
+(a2wsgi), כך שיש מימוש אחד בלבד לאתר.
+
+הפעלה: uvicorn bot.asgi:app --host 0.0.0.0 --port $PORT --workers 2
+מסד הנתונים וה-Application של הבוט עולים ב-lifespan.startup (create_bot), לא בעת היבוא.
+"""
+
+import json
+import asyncio
+import logging
+from datetime import datetime
+
+from a2wsgi import WSGIMiddleware
+
+from bot.main import flask_app, create_bot, WEBHOOK_URL
+from bot.ingestion import WebhookIngestor
+from database.async_queries import run_query
+
+logger = logging.getLogger(__name__)
+
+ingestor = None
+
+# האתר של Flask - רץ ב-thread pool של המתאם
+wsgi_app = WSGIMiddleware(flask_app)
+
+# ========== בקשה ותשובה ==========
+
+class Request:
+    """בקשת HTTP מתוך ה-scope של ASGI"""
+
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.body = body
+
+    def json(self):
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            return None
+
+class Response:
+    def __init__(self, body=b'', status=200, content_type='text/html; charset=utf-8', headers=None):
+        self.body = body.encode() if isinstance(body, str) else body
+        self.status = status
+        self.headers = [(b'content-type', content_type.encode())]
+        for name, value in (headers or {}).items():
+            self.headers.append((name.lower().encode(), value.encode()))
+
+    async def send(self, send):
+        await send({'type': 'http.response.start', 'status': self.status, 'headers': self.headers})
+        await send({'type': 'http.response.body', 'body': self.body})
+
+def json_response(data, status=200, headers=None):
+    return Response(json.dumps(data, ensure_ascii=False, default=str), status,
+                    'application/json', headers)
+
+# ========== נקודות קצה ==========
+
+async def webhook(request):
+    """נקודת כניסה ל-webhook - העדכון עובר ל-Application על אותה לולאה"""
+    if ingestor is None:
+        return json_response({"status": "error", "message": "Bot not initialized"}, 500)
+
+    data = request.json()
+    if not data:
+        return json_response({"status": "error", "message": "Invalid update"}, 400)
+
+    if not ingestor.submit(data):
+        logger.warning("⚠️ תור העדכונים מלא - טלגרם ישלח את העדכון שוב")
+        return json_response({"status": "busy"}, 503, {"Retry-After": "1"})
+    return json_response({"status": "ok"})
+
+async def webhook_metrics(request):
+    if ingestor is None:
+        return json_response({"running": False})
+    return json_response(ingestor.metrics())
+
+async def set_webhook(request):
+    """הגדרת webhook לבוט"""
+    if not WEBHOOK_URL:
+        return json_response({
+            "success": False,
+            "message": "WEBHOOK_URL לא מוגדר בסביבה",
+            "suggestion": "הגדר את WEBHOOK_URL להפעלת webhook"
+        }, 400)
+    if ingestor is None or ingestor.application is None:
+        return json_response({"success": False, "message": "הבוט לא מאותחל"}, 503)
+    webhook_url = f"{WEBHOOK_URL}/webhook"
+    try:
+        await ingestor.application.bot.set_webhook(webhook_url)
+        logger.info(f"✅ Webhook הוגדר: {webhook_url}")
+        return json_response({"success": True, "message": "Webhook הוגדר בהצלחה", "webhook_url": webhook_url})
+    except Exception as e:
+        logger.error(f"❌ שגיאה בהגדרת webhook: {e}")
+        return json_response({"success": False, "message": f"שגיאה בהגדרת webhook: {str(e)}"}, 500)
+
+def _ping_database():
+    from sqlalchemy import text
+    from database.db import Session
+    session = Session()
+    try:
+        session.execute(text("SELECT 1"))
+    finally:
+        session.close()
+
+async def health(request):
+    """בדיקת בריאות המערכת"""
+    health_status = {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "bot": "active" if ingestor and ingestor.running else "inactive",
+        "database": "connected",
+        "webhook": bool(WEBHOOK_URL),
+        "version": "3.0.0",
+        "server": "asgi",
+        "features": ["web", "bot", "database", "webhook"]
+    }
+    try:
+        await run_query(_ping_database)
+    except Exception as e:
+        health_status["database"] = f"error: {str(e)}"
+        health_status["status"] = "degraded"
+    return json_response(health_status)
+
+ROUTES = {
+    '/webhook': (webhook, ('POST',)),
+    '/webhook/metrics': (webhook_metrics, ('GET',)),
+    '/set_webhook': (set_webhook, ('GET',)),
+    '/health': (health, ('GET',)),
+}
+
+# ========== אפליקציית ASGI ==========
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+async def _lifespan(receive, send):
+    """עליית התהליך והפעלת ה-Application של הבוט עם עליית השרת, ועצירתו עם הכיבוי"""
+    global ingestor
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                bot_app = await asyncio.get_running_loop().run_in_executor(None, create_bot)
+                if bot_app and ingestor is None:
+                    ingestor = WebhookIngestor(bot_app)
+                if ingestor:
+                    await ingestor.attach()
+                await send({'type': 'lifespan.startup.complete'})
+            except Exception as e:
+                logger.error(f"❌ שגיאה בהפעלת הבוט: {e}")
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+        elif message['type'] == 'lifespan.shutdown':
+            if ingestor and ingestor.running:
+                await ingestor.detach()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    """נקודת הכניסה של שרת ה-ASGI"""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    handler, methods = ROUTES.get(scope['path'].rstrip('/') or '/', (None, ()))
+    if handler is None:
+        await wsgi_app(scope, receive, send)
+        return
+
+    request = Request(scope, await _read_body(receive))
+    if request.method not in methods:
+        response = Response("Method Not Allowed", 405, 'text/plain')
+    else:
+        try:
+            response = await handler(request)
+        except Exception as e:
+            logger.error(f"❌ שגיאה בטיפול בבקשה {request.path}: {e}")
+            response = json_response({"status": "error", "message": str(e)}, 500)
+    await response.send(send)
+
+__all__ = ['app', 'ingestor']
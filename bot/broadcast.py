@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+מנוע שידור הודעות לכל המשתמשים - Crypto-Class
+
+השידור נשמר בטבלאות broadcast_jobs / broadcast_deliveries ונשלח ברקע על לולאת
+האירועים של הבוט, כך שפקודת /admin_broadcast חוזרת מיד ולא חוסמת פקודות אחרות:
+• קצב השליחה מוגבל ב-token bucket (ברירת מחדל 30 הודעות לשנייה - המגבלה של טלגרם).
+  המגבלה היא לכל תהליך, ולכן השידורים רצים בתהליך אחד בכל פעם - claim_broadcast_job
+  לא נותן לתהליך אחר לתפוס שידור כל עוד ההחזקה של התהליך המשדר בתוקף
+• מספר קבוע של שליחות במקביל
+• RetryAfter עוצר את כל השליחות לזמן שטלגרם ביקש ואז ממשיך
+• ההתקדמות נשמרת אחרי כל מנה - אחרי הפעלה מחדש השידור ממשיך מאותה נקודה
+• האדמין רואה את ההתקדמות בהודעה אחת שמתעדכנת
+"""
+
+import os
+import time
+import socket
+import asyncio
+import logging
+import contextvars
+from datetime import datetime
+
+from telegram.error import RetryAfter, Forbidden, BadRequest, TelegramError
+
+from database.async_queries import (
+    get_broadcast_job, get_claimable_broadcast_jobs, claim_broadcast_job,
+    get_pending_deliveries, record_broadcast_deliveries, finish_broadcast_job,
+    release_broadcast_job
+)
+
+logger = logging.getLogger(__name__)
+
+# הודעות לשנייה (טלגרם: כ-30 לכל הבוט) ומספר השליחות במקביל
+BROADCAST_RATE = float(os.environ.get("BROADCAST_RATE", 30))
+BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", 8))
+# נמענים בכל מנה - אחרי כל מנה ההתקדמות נשמרת במסד
+BROADCAST_BATCH_SIZE = int(os.environ.get("BROADCAST_BATCH_SIZE", 200))
+# ניסיונות לנמען בשגיאת רשת (RetryAfter לא נספר)
+BROADCAST_MAX_ATTEMPTS = int(os.environ.get("BROADCAST_MAX_ATTEMPTS", 3))
+# כל כמה שניות מתעדכנת הודעת ההתקדמות אצל האדמין
+BROADCAST_PROGRESS_INTERVAL = float(os.environ.get("BROADCAST_PROGRESS_INTERVAL", 5))
+# תהליך שלא חידש את ההחזקה בשידור תוך הזמן הזה נחשב כמת, ותהליך אחר ממשיך את השידור
+BROADCAST_LEASE_SECONDS = int(os.environ.get("BROADCAST_LEASE_SECONDS", 120))
+
+def broadcast_text(text):
+    """נוסח ההודעה שנשלחת לכל משתמש"""
+    return f"📢 **הודעה מהמערכת:**\n\n{text}"
+
+class TokenBucket:
+    """מגביל קצב אסינכרוני - rate אסימונים לשנייה, עד capacity ברצף (בתוך התהליך)"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """עצירת כל הממתינים (RetryAfter מטלגרם)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+def _retry_after_seconds(error):
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+
+class BroadcastEngine:
+    """מריץ את השידורים הפתוחים על לולאת ה-Application - אחד לכל תהליך, ורק תהליך אחד משדר בכל פעם"""
+
+    def __init__(self, application, rate=BROADCAST_RATE, concurrency=BROADCAST_CONCURRENCY,
+                 batch_size=BROADCAST_BATCH_SIZE):
+        self.application = application
+        self.bucket = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._jobs = {}
+        self._watcher = None
+        self._stopping = False
+
+    # ========== מחזור חיים ==========
+
+    def start(self):
+        """התחלת מעקב אחרי שידורים פתוחים (גם כאלה שנקטעו בהפעלה קודמת)"""
+        self._stopping = False
+        if self._watcher is None:
+            self._watcher = self._create_task(self._watch())
+
+    async def stop(self, timeout=10):
+        """עצירה בסוף המנה הנוכחית ושחרור השידורים לתהליך הבא"""
+        self._stopping = True
+        if self._watcher:
+            self._watcher.cancel()
+            self._watcher = None
+        tasks = list(self._jobs.values())
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+
+    def launch(self, job_id):
+        """הרצת שידור ברקע - אם אינו רץ כבר בתהליך הזה"""
+        if self._stopping or job_id in self._jobs:
+            return
+        task = self._create_task(self._run(job_id))
+        self._jobs[job_id] = task
+        task.add_done_callback(lambda _: self._jobs.pop(job_id, None))
+
+    def _create_task(self, coroutine):
+        # הקשר ריק - השידור לא יורש את יחידת העבודה של ה-handler שהפעיל אותו
+        return asyncio.get_running_loop().create_task(coroutine, context=contextvars.Context())
+
+    async def _watch(self):
+        while True:
+            try:
+                for job_id in await get_claimable_broadcast_jobs(BROADCAST_LEASE_SECONDS):
+                    self.launch(job_id)
+            except Exception as e:
+                logger.error(f"❌ שגיאה בבדיקת שידורים פתוחים: {e}")
+            await asyncio.sleep(BROADCAST_LEASE_SECONDS / 2)
+
+    # ========== שידור ==========
+
+    async def _run(self, job_id):
+        if not await claim_broadcast_job(job_id, self.owner, BROADCAST_LEASE_SECONDS):
+            return
+        job = await get_broadcast_job(job_id)
+        text = broadcast_text(job['text'])
+        sent, failed = job['sent'], job['failed']
+        logger.info(f"📢 שידור {job_id}: מתחיל ({sent + failed}/{job['total']} כבר טופלו)")
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        last_report = 0
+        after_id = 0
+        released = False
+        try:
+            while not self._stopping:
+                batch = await get_pending_deliveries(job_id, after_id, self.batch_size)
+                if not batch:
+                    await finish_broadcast_job(job_id, self.owner)
+                    released = True
+                    logger.info(f"✅ שידור {job_id} הסתיים: {sent} נשלחו, {failed} נכשלו")
+                    await self._report(job, sent, failed, 'completed')
+                    return
+                after_id = batch[-1][0]
+
+                results = await asyncio.gather(*(
+                    self._deliver(semaphore, delivery_id, telegram_id, text)
+                    for delivery_id, telegram_id in batch
+                ))
+                sent += sum(1 for r in results if r['status'] == 'sent')
+                failed += sum(1 for r in results if r['status'] == 'failed')
+
+                if not await record_broadcast_deliveries(job_id, self.owner, results):
+                    released = True
+                    logger.info(f"🛑 שידור {job_id} בוטל או עבר לתהליך אחר")
+                    current = await get_broadcast_job(job_id)
+                    if current and current['status'] == 'cancelled':
+                        await self._report(job, sent, failed, 'cancelled')
+                    return
+
+                if time.monotonic() - last_report >= BROADCAST_PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    await self._report(job, sent, failed, 'running')
+        except Exception as e:
+            logger.error(f"❌ שגיאה בשידור {job_id}: {e}")
+        finally:
+            # כיבוי או שגיאה - תהליך אחר (או ההפעלה הבאה) ימשיך מהמנה שלא נשמרה
+            if not released:
+                await release_broadcast_job(job_id, self.owner)
+
+    async def _deliver(self, semaphore, delivery_id, telegram_id, text):
+        """שליחה לנמען אחד - מחזיר את מצב המסירה לשמירה במסד"""
+        attempts = 0
+        error = None
+        async with semaphore:
+            while attempts < BROADCAST_MAX_ATTEMPTS:
+                await self.bucket.acquire()
+                try:
+                    await self.application.bot.send_message(chat_id=telegram_id, text=text, parse_mode="Markdown")
+                    return {'id': delivery_id, 'status': 'sent', 'attempts': attempts + 1,
+                            'error': None, 'sent_at': datetime.now()}
+                except RetryAfter as e:
+                    # חריגה מהקצב - כל השליחות ממתינות, והניסיון לא נספר
+                    self.bucket.pause(_retry_after_seconds(e))
+                    continue
+                except (Forbidden, BadRequest) as e:
+                    # המשתמש חסם את הבוט / צ'אט לא קיים - אין טעם לנסות שוב
+                    attempts += 1
+                    error = str(e)
+                    break
+                except TelegramError as e:
+                    attempts += 1
+                    error = str(e)
+                    await asyncio.sleep(2 ** attempts)
+        return {'id': delivery_id, 'status': 'failed', 'attempts': attempts,
+                'error': (error or '')[:200], 'sent_at': None}
+
+    async def _report(self, job, sent, failed, status):
+        """עדכון הודעת ההתקדמות אצל האדמין"""
+        if not job['status_chat_id'] or not job['status_message_id']:
+            return
+        total = job['total']
+        done = sent + failed
+        titles = {
+            'running': "⏳ **שולח הודעה לכולם...**",
+            'completed': "✅ **שליחת הודעה הושלמה!**",
+            'cancelled': "🛑 **השידור בוטל**",
+        }
+        text = (
+            f"{titles[status]}\n\n"
+            f"📢 **שידור #{job['id']}**\n"
+            f"✅ נשלח בהצלחה ל: {sent:,} משתמשים\n"
+            f"❌ נכשל בשליחה ל: {failed:,} משתמשים\n"
+            f"📊 התקדמות: {done:,}/{total:,} ({done * 100 // total if total else 100}%)"
+        )
+        if status == 'running':
+            text += f"\n\nלביטול: `/admin_broadcast_cancel {job['id']}`"
+        try:
+            await self.bucket.acquire()
+            await self.application.bot.edit_message_text(
+                chat_id=job['status_chat_id'], message_id=job['status_message_id'],
+                text=text, parse_mode="Markdown"
+            )
+        except RetryAfter as e:
+            self.bucket.pause(_retry_after_seconds(e))
+        except TelegramError as e:
+            logger.warning(f"⚠️ לא ניתן לעדכן את הודעת ההתקדמות של שידור {job['id']}: {e}")
+
+# ========== חיבור ל-Application ==========
+
+def get_broadcast_engine(application):
+    """מנוע השידור של ה-Application (נוצר בפעם הראשונה)"""
+    engine = application.bot_data.get('broadcast_engine')
+    if engine is None:
+        engine = application.bot_data['broadcast_engine'] = BroadcastEngine(application)
+    return engine
+
+async def start_broadcasts(application):
+    """post_init - המשך שידורים שנקטעו"""
+    get_broadcast_engine(application).start()
+
+async def stop_broadcasts(application):
+    """post_stop - עצירת השידורים בסוף המנה הנוכחית"""
+    await get_broadcast_engine(application).stop()
+
+__all__ = [
+    'BroadcastEngine', 'TokenBucket', 'broadcast_text', 'get_broadcast_engine',
+    'start_broadcasts', 'stop_broadcasts'
+]
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+קליטת עדכוני webhook - Application אחד של python-telegram-bot לכל תהליך,
+שרץ על לולאת אירועים ב-thread ייעודי לאורך כל חיי התהליך
+(או על הלולאה של שרת ה-ASGI עצמו - ראה bot/asgi.py).
+
+בקשת ה-webhook רק מעבירה את העדכון ללולאה (run_coroutine_threadsafe) ומחזירה 200 מיד.
+מספר העדכונים שממתינים לטיפול מוגבל - מעבר לגבול מוחזר 503 וטלגרם ישלח שוב מאוחר יותר.
+
+עדכון שטלגרם שולח שוב (update_id שכבר התקבל) לא מטופל פעמיים: בדיקה מהירה מול טבעת
+בזיכרון לפני הכנסה לתור, ובדיקה מול טבלת processed_updates (משותפת לכל התהליכים)
+לפני שהעדכון מגיע ל-handlers.
+"""
+
+import os
+import time
+import atexit
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import deque
+
+from telegram import Update
+
+from database.async_queries import claim_update, prune_processed_updates
+
+logger = logging.getLogger(__name__)
+
+# מספר מירבי של עדכונים שהתקבלו וטרם טופלו (ממתינים + בטיפול)
+WEBHOOK_MAX_BACKLOG = int(os.environ.get("WEBHOOK_MAX_BACKLOG", 1000))
+# זמן המתנה להפעלת / עצירת ה-Application (שניות)
+WEBHOOK_STARTUP_TIMEOUT = int(os.environ.get("WEBHOOK_STARTUP_TIMEOUT", 30))
+WEBHOOK_SHUTDOWN_TIMEOUT = int(os.environ.get("WEBHOOK_SHUTDOWN_TIMEOUT", 10))
+# מניעת כפילויות: גודל הטבעת בזיכרון, זמן שמירה בטבלה (שניות) ותדירות הניקוי (בעדכונים)
+WEBHOOK_DEDUP_SIZE = int(os.environ.get("WEBHOOK_DEDUP_SIZE", 10000))
+WEBHOOK_DEDUP_TTL = int(os.environ.get("WEBHOOK_DEDUP_TTL", 24 * 60 * 60))
+WEBHOOK_DEDUP_PRUNE_EVERY = int(os.environ.get("WEBHOOK_DEDUP_PRUNE_EVERY", 1000))
+
+class WebhookIngestor:
+    """Application קבוע על לולאת אירועים משלו, עם תור עדכונים חסום ומדדים"""
+
+    def __init__(self, application, max_backlog=WEBHOOK_MAX_BACKLOG, dedup_size=WEBHOOK_DEDUP_SIZE):
+        self.application = application
+        self.max_backlog = max_backlog
+        self.loop = None
+        self._thread = None
+        self._lifecycle_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._started_at = None
+        self._tasks = set()
+
+        # update_id אחרונים שהתקבלו בתהליך - הוותיק נפלט כשהטבעת מלאה
+        self._recent = deque(maxlen=dedup_size)
+        self._recent_ids = set()
+
+        # מדדים
+        self._backlog = 0
+        self._active = 0
+        self._max_backlog_seen = 0
+        self.accepted = 0
+        self.processed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.duplicates = 0
+
+    # ========== מחזור חיים ==========
+
+    @property
+    def running(self):
+        return self.loop is not None and self.loop.is_running()
+
+    def start(self):
+        """הפעלת הלולאה וה-Application (initialize + start) - פעם אחת לכל תהליך"""
+        with self._lifecycle_lock:
+            if self.running:
+                return
+
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._run_loop, name="ptb-webhook", daemon=True)
+            self._thread.start()
+
+            try:
+                self.run(self._startup(), timeout=WEBHOOK_STARTUP_TIMEOUT)
+            except Exception:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                self._thread.join(timeout=WEBHOOK_SHUTDOWN_TIMEOUT)
+                self.loop = None
+                raise
+
+            self._started_at = time.time()
+            atexit.register(self.stop)
+            logger.info(f"✅ קליטת webhook פעילה (עד {self.max_backlog} עדכונים ממתינים)")
+
+    async def attach(self):
+        """הפעלה על לולאת האירועים הנוכחית (שרת ASGI) במקום thread ייעודי"""
+        self.loop = asyncio.get_running_loop()
+        await self._startup()
+        self._started_at = time.time()
+        logger.info(f"✅ קליטת webhook פעילה על לולאת השרת (עד {self.max_backlog} עדכונים ממתינים)")
+
+    async def detach(self):
+        """עצירה כשה-Application רץ על לולאת השרת"""
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=WEBHOOK_SHUTDOWN_TIMEOUT)
+        await self._shutdown()
+        self.loop = None
+        logger.info("🛑 קליטת webhook נעצרה")
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        self.loop.close()
+
+    # ה-hooks של ה-builder (post_init / post_stop / post_shutdown) נקראים כמו ב-run_polling
+
+    async def _startup(self):
+        await self.application.initialize()
+        if self.application.post_init:
+            await self.application.post_init(self.application)
+        await self.application.start()
+
+    async def _shutdown(self):
+        if self.application.running:
+            await self.application.stop()
+            if self.application.post_stop:
+                await self.application.post_stop(self.application)
+        await self.application.shutdown()
+        if self.application.post_shutdown:
+            await self.application.post_shutdown(self.application)
+
+    def stop(self):
+        """עצירה מסודרת של ה-Application והלולאה"""
+        with self._lifecycle_lock:
+            if not self.running:
+                return
+            try:
+                self.run(self._shutdown(), timeout=WEBHOOK_SHUTDOWN_TIMEOUT)
+            except Exception as e:
+                logger.error(f"❌ שגיאה בעצירת קליטת webhook: {e}")
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=WEBHOOK_SHUTDOWN_TIMEOUT)
+            self.loop = None
+            logger.info("🛑 קליטת webhook נעצרה")
+
+    def run(self, coroutine, timeout=None):
+        """הרצת coroutine על לולאת הבוט מתוך thread אחר והמתנה לתוצאה"""
+        return self._schedule(coroutine).result(timeout)
+
+    def _schedule(self, coroutine):
+        # הקשר ריק - אחרת המשימה יורשת את ה-contextvars של בקשת Flask ששלחה אותה
+        # (למשל את יחידת העבודה שלה)
+        return contextvars.Context().run(asyncio.run_coroutine_threadsafe, coroutine, self.loop)
+
+    # ========== קליטה ==========
+
+    def submit(self, data):
+        """העברת עדכון (JSON מטלגרם) לטיפול - מחזיר False אם התור מלא.
+        עדכון כפול נזרק ומוחזר True - טלגרם יקבל 200 ויפסיק לשלוח אותו"""
+        update_id = data.get('update_id') if isinstance(data, dict) else None
+        with self._lock:
+            if update_id in self._recent_ids:
+                self.duplicates += 1
+                return True
+            if self._backlog >= self.max_backlog:
+                # לא נרשם בטבעת - הניסיון החוזר של טלגרם צריך להתקבל
+                self.rejected += 1
+                return False
+            self._remember(update_id)
+            self._backlog += 1
+            self.accepted += 1
+            self._max_backlog_seen = max(self._max_backlog_seen, self._backlog)
+
+        try:
+            if self._thread is None:
+                # כבר רצים על הלולאה של ה-Application (ASGI)
+                task = self.loop.create_task(self._dispatch(data, update_id))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            else:
+                self._schedule(self._dispatch(data, update_id))
+        except Exception:
+            with self._lock:
+                self._recent_ids.discard(update_id)
+            self._done()
+            raise
+        return True
+
+    def _remember(self, update_id):
+        if update_id is None:
+            return
+        if len(self._recent) == self._recent.maxlen:
+            self._recent_ids.discard(self._recent[0])
+        self._recent.append(update_id)
+        self._recent_ids.add(update_id)
+
+    async def _claim(self, update_id):
+        """רישום העדכון בטבלה המשותפת - False אם תהליך אחר (או ריצה קודמת) כבר קיבל אותו"""
+        if update_id is None:
+            return True
+        try:
+            claimed = await claim_update(update_id)
+        except Exception:
+            # עדיף טיפול כפול נדיר מאשר עדכון שאבד - ה-handlers עצמם אידמפוטנטיים ככל האפשר
+            return True
+        if claimed and update_id % WEBHOOK_DEDUP_PRUNE_EVERY == 0:
+            deleted = await prune_processed_updates(WEBHOOK_DEDUP_TTL)
+            if deleted:
+                logger.info(f"🧹 נמחקו {deleted} עדכונים ישנים מטבלת הכפילויות")
+        return claimed
+
+    async def _dispatch(self, data, update_id):
+        """פענוח העדכון והמתנה למקום פנוי במעבד העדכונים של PTB (concurrent_updates)"""
+        try:
+            if not await self._claim(update_id):
+                with self._lock:
+                    self.duplicates += 1
+                return
+            update = Update.de_json(data, self.application.bot)
+            await self.application.update_processor.process_update(update, self._process(update))
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logger.error(f"❌ שגיאה בטיפול בעדכון: {e}")
+        finally:
+            self._done()
+
+    async def _process(self, update):
+        with self._lock:
+            self._active += 1
+        try:
+            await self.application.process_update(update)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _done(self):
+        with self._lock:
+            self._backlog -= 1
+            self.processed += 1
+
+    # ========== מדדים ==========
+
+    def metrics(self):
+        """עומק התור ומוני העדכונים של התהליך הנוכחי"""
+        with self._lock:
+            return {
+                "running": self.running,
+                "pid": os.getpid(),
+                "uptime_seconds": round(time.time() - self._started_at) if self._started_at else 0,
+                "queue_depth": self._backlog - self._active,
+                "in_progress": self._active,
+                "backlog": self._backlog,
+                "max_backlog": self.max_backlog,
+                "max_backlog_seen": self._max_backlog_seen,
+                "accepted": self.accepted,
+                "processed": self.processed,
+                "rejected": self.rejected,
+                "failed": self.failed,
+                "duplicates": self.duplicates,
+            }
+
+__all__ = ['WebhookIngestor', 'WEBHOOK_MAX_BACKLOG', 'WEBHOOK_DEDUP_SIZE', 'WEBHOOK_DEDUP_TTL']
@@ -2,13 +2,18 @@
 """
 Crypto-Class - מערכת מלאה משולבת
 גרסה 3.0.0 - מבוסס webhook בלבד, ללא polling
+
+היבוא של המודול לא יוצר חיבור למסד ולא את ה-Application של הבוט - העלייה עצמה ב-create_app():
+gunicorn "bot.main:create_app()"
 """
 
 import os
 import sys
+import socket
 import logging
-from datetime import datetime
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for
+import threading
+from datetime import datetime, time as dt_time
+from flask import Flask, request, jsonify, render_template, session, redirect, url_for, g
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
 
@@ -16,44 +21,80 @@ from telegram.ext import Application, CommandHandler, MessageHandler, filters, C
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# הגדרת לוגים
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('crypto_class.log')
-    ]
-)
 logger = logging.getLogger(__name__)
 
+def configure_logging():
+    """הגדרת לוגים - ל-stdout ולקובץ crypto_class.log (רק אם עוד לא הוגדרו)"""
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO,
+        handlers=[
+            logging.StreamHandler(sys.stdout),
+            logging.FileHandler('crypto_class.log')
+        ]
+    )
+
 # ========== הגדרות מערכת ==========
 BOT_TOKEN = os.environ.get("BOT_TOKEN")
-if not BOT_TOKEN:
-    logger.error("❌ BOT_TOKEN לא מוגדר!")
-    sys.exit(1)
 
 PORT = int(os.environ.get("PORT", 5000))
 WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "").rstrip('/')
 TEACHER_PASSWORD = os.environ.get("TEACHER_PASSWORD", "admin123")
 SECRET_KEY = os.environ.get("SECRET_KEY", "crypto-class-secret-key-2026-change-this")
+# מספר העדכונים שמטופלים במקביל (ברירת המחדל של PTB היא אחד אחרי השני)
+CONCURRENT_UPDATES = int(os.environ.get("CONCURRENT_UPDATES", 16))
+# מספר התוצאות בחיפוש משתמשים באתר
+SEARCH_RESULTS_LIMIT = 50
+# שרת Bot API חלופי (למשל שרת מקומי) - ברירת מחדל: api.telegram.org
+TELEGRAM_BASE_URL = os.environ.get("TELEGRAM_BASE_URL", "").rstrip('/')
 
 # ========== יבוא מודולים פנימיים ==========
 try:
     from database.db import ensure_database_initialized
     from database.queries import (
         get_top_users, get_system_stats, get_today_stats,
-        get_streak_stats, get_activity_stats
+        get_streak_stats, get_activity_stats, get_api_stats,
+        get_users_keyset_page, search_users
     )
-    logger.info("✅ מודולי מסד נתונים נטענו")
+    from database.async_queries import rollover_streaks, reconcile_token_ledger, claim_scheduled_job
 except ImportError as e:
     logger.error(f"❌ שגיאה בטעינת מודולי מסד נתונים: {e}")
     sys.exit(1)
 
 # ========== יצירת Flask app ==========
-flask_app = Flask(__name__)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATES_DIR = os.path.join(PROJECT_ROOT, 'templates')
+STATIC_DIR = os.path.join(PROJECT_ROOT, 'static')
+
+flask_app = Flask(__name__, template_folder=TEMPLATES_DIR, static_folder=STATIC_DIR)
 flask_app.secret_key = SECRET_KEY
 
+@flask_app.template_filter('intcomma')
+def intcomma(value):
+    """מספר עם מפרידי אלפים (גם כ-filter בתבניות)"""
+    try:
+        return f"{int(value):,}"
+    except (TypeError, ValueError):
+        return str(value)
+
+# ========== יחידת עבודה לכל בקשה ==========
+from database.unit_of_work import begin_unit_of_work, end_unit_of_work
+
+@flask_app.before_request
+def open_unit_of_work():
+    """סשן מסד נתונים אחד לכל בקשה - נפתח בפועל רק בשאילתה הראשונה"""
+    g.db_unit_of_work = begin_unit_of_work()
+
+@flask_app.teardown_request
+def close_unit_of_work(error=None):
+    """commit אחד בסוף הבקשה"""
+    token = g.pop('db_unit_of_work', None)
+    if token is not None:
+        try:
+            end_unit_of_work(token, error)
+        except Exception as e:
+            logger.error(f"❌ שגיאה בסגירת יחידת עבודה: {e}")
+
 # ========== אתחול מסד נתונים ==========
 def initialize_database():
     """אתחול מסד הנתונים בעת הפעלה"""
@@ -69,20 +110,49 @@ try:
     from bot.commands import (
         start, checkin, balance, referral, my_referrals,
         leaderboard, level, profile, contact, help_command, 
-        website, admin_panel, add_tokens, reset_checkin,
-        handle_callback_query
+        website, handle_callback_query
+    )
+    from bot.admin_commands import (
+        admin_panel, add_tokens, reset_checkin,
+        admin_stats, admin_users, admin_users_page, admin_search, admin_broadcast, admin_broadcast_cancel
     )
-    logger.info("✅ פקודות הבוט נטענו")
+    from bot.broadcast import start_broadcasts, stop_broadcasts
 except ImportError as e:
     logger.error(f"❌ שגיאה ביבוא פקודות: {e}")
     sys.exit(1)
 
+# ========== משימות מתוזמנות ==========
+# כל worker מתזמן את המשימות, ורק מי שתפס את ההרצה של היום במסד מריץ אותה.
+# הסריקות רצות ב-thread pool של database.async_queries ולא חוסמות את לולאת האירועים
+JOB_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+async def streak_rollover_job(context: ContextTypes.DEFAULT_TYPE):
+    """משימה יומית - איפוס רצפים שנשברו במהלך הלילה"""
+    if not await claim_scheduled_job('streak_rollover', JOB_OWNER):
+        return
+    await rollover_streaks()
+
+async def ledger_reconcile_job(context: ContextTypes.DEFAULT_TYPE):
+    """משימה יומית - בדיקת יתרות המשתמשים מול יומן הטוקנים (דיווח בלבד)"""
+    if not await claim_scheduled_job('ledger_reconcile', JOB_OWNER):
+        return
+    result = await reconcile_token_ledger()
+    if result['mismatched']:
+        logger.warning(f"⚠️ יומן הטוקנים: {result['mismatched']} פערים מתוך {result['users']} משתמשים "
+                       f"(python -m database.maintenance ledger): {result['samples'][:5]}")
+    else:
+        logger.info(f"✅ יומן הטוקנים תואם את היתרות של {result['users']} משתמשים")
+
 # ========== אתחול הבוט ==========
 def setup_bot():
     """הגדרת הבוט והוספת handlers"""
     try:
         # יצירת Application
-        application = Application.builder().token(BOT_TOKEN).build()
+        builder = (Application.builder().token(BOT_TOKEN).concurrent_updates(CONCURRENT_UPDATES)
+                   .post_init(start_broadcasts).post_stop(stop_broadcasts))
+        if TELEGRAM_BASE_URL:
+            builder = builder.base_url(f"{TELEGRAM_BASE_URL}/bot").base_file_url(f"{TELEGRAM_BASE_URL}/file/bot")
+        application = builder.build()
         
         # הוספת handlers לפקודות
         application.add_handler(CommandHandler("start", start))
@@ -99,8 +169,14 @@ def setup_bot():
         application.add_handler(CommandHandler("admin", admin_panel))
         application.add_handler(CommandHandler("add_tokens", add_tokens))
         application.add_handler(CommandHandler("reset_checkin", reset_checkin))
+        application.add_handler(CommandHandler("admin_stats", admin_stats))
+        application.add_handler(CommandHandler("admin_users", admin_users))
+        application.add_handler(CommandHandler("admin_search", admin_search))
+        application.add_handler(CommandHandler("admin_broadcast", admin_broadcast))
+        application.add_handler(CommandHandler("admin_broadcast_cancel", admin_broadcast_cancel))
         
         # הוספת handler ל-callback queries
+        application.add_handler(CallbackQueryHandler(admin_users_page, pattern=r'^admin_users:'))
         application.add_handler(CallbackQueryHandler(handle_callback_query))
         
         # טיפול בשגיאות
@@ -116,14 +192,56 @@ def setup_bot():
         
         application.add_error_handler(error_handler)
         
+        # איפוס רצפים יומי (דורש python-telegram-bot[job-queue] - ב-requirements.txt)
+        if application.job_queue:
+            application.job_queue.run_daily(streak_rollover_job, time=dt_time(0, 5))
+            application.job_queue.run_daily(ledger_reconcile_job, time=dt_time(3, 0))
+        else:
+            logger.error("❌ JobQueue לא זמין - איפוס הרצפים ובדיקת יומן הטוקנים היומיים לא תוזמנו. "
+                         "התקן python-telegram-bot[job-queue] או הרץ python -m database.maintenance streaks ידנית")
+        
         logger.info("✅ הבוט אותחל עם כל הפקודות")
         return application
     except Exception as e:
         logger.error(f"❌ שגיאה באתחול הבוט: {e}")
         return None
 
-# אתחול הבוט
-bot_app = setup_bot()
+# ========== app factory ==========
+bot_app = None
+_bot_created = False
+_startup_lock = threading.Lock()
+
+def create_bot():
+    """עליית התהליך - לוגים, אתחול מסד הנתונים וה-Application של הבוט (פעם אחת לתהליך)"""
+    global bot_app, _bot_created
+    with _startup_lock:
+        if not _bot_created:
+            configure_logging()
+            if not BOT_TOKEN:
+                logger.error("❌ BOT_TOKEN לא מוגדר!")
+                raise RuntimeError("BOT_TOKEN לא מוגדר")
+            initialize_database()
+            bot_app = setup_bot()
+            _bot_created = True
+    return bot_app
+
+def create_app():
+    """app factory לשרת ה-WSGI - אפליקציית Flask אחרי עליית התהליך"""
+    create_bot()
+    return flask_app
+
+# ========== קליטת עדכונים ==========
+from bot.ingestion import WebhookIngestor
+
+_ingestor = None
+
+def get_ingestor():
+    """ה-Application הקבוע של התהליך - מופעל בבקשה הראשונה (אחרי ה-fork של gunicorn)"""
+    global _ingestor
+    if _ingestor is None:
+        _ingestor = WebhookIngestor(bot_app)
+    _ingestor.start()
+    return _ingestor
 
 # ========== הגדרת Webhook ==========
 @flask_app.route('/set_webhook', methods=['GET'])
@@ -140,7 +258,7 @@ def set_webhook():
         webhook_url = f"{WEBHOOK_URL}/webhook"
         
         # הגדר את webhook
-        bot_app.bot.set_webhook(webhook_url)
+        get_ingestor().run(bot_app.bot.set_webhook(webhook_url), timeout=30)
         
         logger.info(f"✅ Webhook הוגדר: {webhook_url}")
         return jsonify({
@@ -162,22 +280,27 @@ def webhook():
         if bot_app is None:
             return jsonify({"status": "error", "message": "Bot not initialized"}), 500
         
-        # עיבוד העדכון
-        update = Update.de_json(request.get_json(force=True), bot_app.bot)
+        data = request.get_json(force=True, silent=True)
+        if not data:
+            return jsonify({"status": "error", "message": "Invalid update"}), 400
         
-        # השתמש ב-ThreadPoolExecutor כדי להריץ את ה-update
-        import concurrent.futures
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future = executor.submit(
-                lambda: bot_app.update_queue.put_nowait(update)
-            )
-            future.result(timeout=5)
+        # העברה ללולאת הבוט ותשובה מיידית - הטיפול עצמו ממשיך ברקע
+        if not get_ingestor().submit(data):
+            logger.warning("⚠️ תור העדכונים מלא - טלגרם ישלח את העדכון שוב")
+            return jsonify({"status": "busy"}), 503, {"Retry-After": "1"}
         
         return jsonify({"status": "ok"}), 200
     except Exception as e:
         logger.error(f"❌ שגיאה בעיבוד webhook: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@flask_app.route('/webhook/metrics')
+def webhook_metrics():
+    """עומק תור העדכונים ומונים של התהליך הנוכחי"""
+    if _ingestor is None:
+        return jsonify({"running": False})
+    return jsonify(_ingestor.metrics())
+
 # ========== דפי אתר ==========
 @flask_app.route('/')
 def index():
@@ -240,9 +363,10 @@ def health_check():
         
         # בדיקת מסד נתונים
         try:
+            from sqlalchemy import text
             from database.db import Session
             session = Session()
-            session.execute("SELECT 1")
+            session.execute(text("SELECT 1"))
             session.close()
         except Exception as e:
             health_status["database"] = f"error: {str(e)}"
@@ -256,6 +380,50 @@ def health_check():
             "timestamp": datetime.now().isoformat()
         }), 500
 
+# ========== API ==========
+def leaderboard_json(users, category):
+    """טבלת המובילים בפורמט JSON"""
+    return {
+        'status': 'success',
+        'category': category,
+        'data': [
+            {
+                'position': position,
+                'telegram_id': user.telegram_id,
+                'name': user.first_name or user.username or f"משתמש {user.telegram_id}",
+                'tokens': user.tokens,
+                'level': user.level,
+                'streak': user.current_streak or 0,
+            }
+            for position, user in enumerate(users, 1)
+        ]
+    }
+
+def leaderboard_args(args):
+    """פרמטרי השאילתה של /api/leaderboard"""
+    category = args.get('category', 'tokens')
+    try:
+        limit = min(max(int(args.get('limit', 10)), 1), 100)
+    except ValueError:
+        limit = 10
+    return limit, category
+
+@flask_app.route('/api/stats')
+def api_stats():
+    """סטטיסטיקות מערכת (JSON)"""
+    return jsonify(get_api_stats())
+
+@flask_app.route('/api/today')
+def api_today():
+    """פעילות היום (JSON)"""
+    return jsonify({'status': 'success', 'data': get_today_stats()})
+
+@flask_app.route('/api/leaderboard')
+def api_leaderboard():
+    """טבלת מובילים (JSON)"""
+    limit, category = leaderboard_args(request.args)
+    return jsonify(leaderboard_json(get_top_users(limit, category), category))
+
 @flask_app.route('/teacher/login', methods=['GET', 'POST'])
 def teacher_login():
     """כניסת מורה"""
@@ -296,6 +464,47 @@ def teacher_dashboard():
         logger.error(f"❌ שגיאה בטעינת דשבורד מורה: {e}")
         return render_template('error.html', error="שגיאה בטעינת הדשבורד")
 
+@flask_app.route('/teacher/users')
+def teacher_users():
+    """רשימת משתמשים למורה - דפדוף keyset (?order=created|tokens&after=...|before=...)"""
+    if not session.get('teacher_logged_in'):
+        return redirect(url_for('teacher_login'))
+    
+    try:
+        page = get_users_keyset_page(
+            request.args.get('order', 'created'),
+            after=request.args.get('after'),
+            before=request.args.get('before')
+        )
+        stats = get_system_stats()
+        return render_template('teacher/teacher_users.html',
+                             users=page['users'],
+                             page=page,
+                             stats=stats,
+                             intcomma=intcomma)
+    except Exception as e:
+        logger.error(f"❌ שגיאה בטעינת רשימת משתמשים: {e}")
+        return render_template('error.html', error="שגיאה בטעינת רשימת המשתמשים")
+
+@flask_app.route('/search/users')
+def search_users_page():
+    """חיפוש משתמשים למורה (?q=שם / שם משתמש / תחילית מזהה)"""
+    if not session.get('teacher_logged_in'):
+        return redirect(url_for('teacher_login'))
+    
+    try:
+        query = request.args.get('q', '').strip()
+        users = search_users(query, SEARCH_RESULTS_LIMIT) if query else []
+        stats = get_system_stats()
+        return render_template('teacher/teacher_users.html',
+                             users=users,
+                             query=query,
+                             stats=stats,
+                             intcomma=intcomma)
+    except Exception as e:
+        logger.error(f"❌ שגיאה בחיפוש משתמשים: {e}")
+        return render_template('error.html', error="שגיאה בחיפוש משתמשים")
+
 @flask_app.route('/teacher/logout')
 def teacher_logout():
     """יציאת מורה"""
@@ -305,14 +514,17 @@ def teacher_logout():
 # ========== הרצת המערכת ==========
 def main():
     """הרצה ראשית של כל המערכת"""
-    # אתחול מסד נתונים
-    initialize_database()
+    # לוגים, מסד נתונים ובוט
+    try:
+        create_app()
+    except RuntimeError:
+        sys.exit(1)
     
     # הגדר webhook אם קיים URL
     if WEBHOOK_URL and bot_app:
         webhook_url = f"{WEBHOOK_URL}/webhook"
         try:
-            bot_app.bot.set_webhook(webhook_url)
+            get_ingestor().run(bot_app.bot.set_webhook(webhook_url), timeout=30)
             logger.info(f"✅ Webhook הוגדר: {webhook_url}")
         except Exception as e:
             logger.error(f"❌ שגיאה בהגדרת webhook: {e}")
@@ -0,0 +1,771 @@
+#!/usr/bin/env python3
+"""
+שכבת השירות של פקודות הבוט - Crypto-Class
+כל פקודה מחושבת כאן פעם אחת ומחזירה Reply (טקסט + כפתורים) בלי תלות בספריית הטלגרם.
+bot/commands.py ו-bot/admin_commands.py (Update/context של python-telegram-bot) ו-bot/commands_sync.py
+(message, bot) הם מתאמים דקים שבונים CommandRequest ושולחים את ה-Reply
+"""
+
+import logging
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from database.async_queries import (
+    get_user, register_user, checkin_user, get_top_users, get_total_referrals,
+    get_referred_users, get_system_stats, get_activity_count, get_today_stats,
+    get_available_tasks, get_user_daily_history, add_tokens_to_user,
+    reset_user_checkin, get_user_rank, unit_of_work
+)
+from database.queries import effective_streak
+from database.levels import level_progress
+
+logger = logging.getLogger(__name__)
+
+# ========== הגדרות קבועות ==========
+
+# בונוסים לפי יום רצוף
+STREAK_BONUS = {
+    3: 5,    # יום שלישי רצוף: +5 טוקנים
+    7: 10,   # שבוע רצוף: +10 טוקנים
+    14: 20,  # שבועיים רצופים: +20 טוקנים
+    30: 50   # חודש רצוף: +50 טוקנים
+}
+
+# תיאורי רמות
+LEVEL_DESCRIPTIONS = {
+    1: "🌱 מתחיל - אתה בתחילת הדרך! המשך לצבור טוקנים.",
+    2: "🚀 לומד - אתה מתקדם יפה. המשך כך!",
+    3: "💪 פעיל - אתה תורם לקהילה. מעולה!",
+    4: "🌟 מתמיד - התמדה מרשימה. המשך להתקדם!",
+    5: "🏅 מתקדם - הגעת לחצי הדרך. כל הכבוד!",
+    6: "💎 מוביל - אתה בין המובילים. ממשיך למצוינות!",
+    7: "👑 אלוף - אתה בפסגה. שמור על ההובלה!",
+    8: "🚀 מאסטר - רמת מאסטר. אתה מודל לחיקוי!",
+    9: "🌌 גורו - רמת גורו. ידע וניסיון עצומים!",
+    10: "⚡ אליל - הרמה הגבוהה ביותר. אתה אגדה!"
+}
+
+# פרטי מנהל המערכת
+ADMIN_INFO = {
+    "name": "אוסיף אונגר",
+    "telegram": "@osifeu",
+    "phone": "0584203384",
+    "email": "osif.programmer@gmail.com",
+    "response_time": "24-48 שעות"
+}
+
+# רשימת אדמינים
+ADMIN_IDS = [224223270]  # החלף ל-telegram_id שלך
+
+WEBSITE_URL = "https://school-production-4d9d.up.railway.app"
+
+NOT_REGISTERED_TEXT = (
+    "❌ **אתה לא רשום במערכת!**\n\n"
+    "שלח /start כדי להירשם."
+)
+NOT_ADMIN_TEXT = "❌ אין לך הרשאות ניהול."
+
+# ========== בקשה ותשובה ==========
+
+class Button(NamedTuple):
+    """כפתור inline - קישור (url) או callback"""
+    text: str
+    url: Optional[str] = None
+    callback_data: Optional[str] = None
+
+class Reply(NamedTuple):
+    """תוצאת פקודה - המתאם שולח אותה בדרך שלו"""
+    text: str
+    buttons: tuple = ()  # שורות של Button
+    parse_mode: Optional[str] = 'Markdown'
+
+class CommandRequest(NamedTuple):
+    """פרטי הפקודה שהמתאם אסף מהעדכון"""
+    user: object  # משתמש טלגרם (id, first_name, username, last_name)
+    args: tuple = ()
+    update_id: Optional[int] = None
+    bot_username: Optional[str] = None
+
+async def execute(service, request):
+    """הרצת פקודה - שגיאה נרשמת בלוג והופכת לתשובת שגיאה אחידה"""
+    try:
+        return await service(request)
+    except Exception as e:
+        command = service.__name__.removesuffix('_command')
+        logger.error(f"❌ שגיאה בפקודת {command}: {e}")
+        return Reply(
+            f"❌ **שגיאה בפקודה /{command}**\n\n"
+            "אנא נסה שוב מאוחר יותר או פנה למנהל המערכת עם /contact."
+        )
+
+# ========== פונקציות עזר ==========
+
+def is_admin(user_id):
+    """בדיקה אם משתמש הוא אדמין"""
+    return user_id in ADMIN_IDS
+
+def display_name(user_obj):
+    """שם להצגה של משתמש מהמסד"""
+    return user_obj.first_name or user_obj.username or f"משתמש {user_obj.telegram_id}"
+
+def format_number(num: int) -> str:
+    """פורמט מספר עם פסיקים"""
+    return f"{num:,}"
+
+def create_progress_bar(progress: int, total: int, length: int = 10) -> str:
+    """יצירת סרגל התקדמות ויזואלי"""
+    filled = min(int((progress / total) * length), length) if total > 0 else 0
+    bar = "▓" * filled + "░" * (length - filled)
+    percentage = (progress / total * 100) if total > 0 else 0
+    return f"{bar} {percentage:.1f}%"
+
+def get_day_name(day) -> str:
+    """קבלת שם היום בעברית"""
+    days = ["שני", "שלישי", "רביעי", "חמישי", "שישי", "שבת", "ראשון"]
+    return days[day.weekday()]
+
+def get_level_info(level: int) -> Optional[dict]:
+    """קבלת תיאור רמה"""
+    description = LEVEL_DESCRIPTIONS.get(level)
+    if not description:
+        return None
+    return {'level': level, 'description': description}
+
+# ========== פקודות בסיסיות ==========
+
+async def start(request):
+    """פקודת התחלה - רישום/התחברות משתמש"""
+    user = request.user
+    logger.info(f"🚀 קבלת /start ממשתמש: {user.id} ({user.first_name})")
+
+    # קוד ההפניה מהקישור (/start <קוד>) - register_user מזכה את המזמין ואת המצטרף
+    referral_param = request.args[0] if request.args else None
+
+    # יחידת כתיבה - הקריאה הראשונה כבר פותחת את טרנזקציית הכתיבה של register_user
+    async with unit_of_work(write=True):
+        existing_user = await get_user(user.id)
+        if not existing_user:
+            registered = await register_user(
+                telegram_id=user.id,
+                username=user.username,
+                first_name=user.first_name,
+                last_name=user.last_name,
+                referral_code=referral_param
+            )
+            new_user = await get_user(user.id) if registered else None
+
+    if existing_user:
+        joined = existing_user.created_at.strftime('%d/%m/%Y') if existing_user.created_at else 'לא ידוע'
+        return Reply(
+            f"🎉 **ברוך השב, {user.first_name}!** 👋\n\n"
+            f"📍 כבר רשום במערכת Crypto-Class\n"
+            f"📅 תאריך הצטרפות: {joined}\n\n"
+            f"📋 **פקודות זמינות:**\n"
+            f"└── /checkin - צ'ק-אין יומי\n"
+            f"└── /balance - יתרת טוקנים\n"
+            f"└── /referral - קוד הפניה שלך\n"
+            f"└── /leaderboard - טבלת מובילים\n"
+            f"└── /level - הרמה שלך\n"
+            f"└── /help - עזרה והדרכה\n\n"
+            f"🚀 **מה עכשיו?**\n"
+            f"השתמש ב-/checkin כדי לקבל את הטוקן היומי שלך!"
+        )
+
+    if not new_user:
+        return Reply(
+            "❌ **אירעה שגיאה בזמן הרישום**\n\n"
+            "אנא נסה שוב מאוחר יותר או פנה למנהל המערכת עם /contact."
+        )
+
+    logger.info(f"✅ משתמש נרשם: {user.id} עם קוד הפניה: {new_user.referral_code}")
+    return Reply(
+        f"🎉 **ברוך הבא ל-Crypto-Class!** 🚀\n\n"
+        f"✅ **נרשמת בהצלחה למערכת!**\n"
+        f"└── 👤 שם: {user.first_name}\n"
+        f"└── 🆔 מזהה: {user.id}\n"
+        f"└── 📅 תאריך: {datetime.now().strftime('%d/%m/%Y')}\n"
+        f"└── 🔐 קוד הפניה: `{new_user.referral_code}`\n"
+        f"└── 🎁 מתנת הצטרפות: {format_number(new_user.tokens)} טוקנים\n\n"
+        f"📋 **פקודות זמינות:**\n"
+        f"└── /checkin - צ'ק-אין יומי (מקבל טוקן)\n"
+        f"└── /balance - בדיקת יתרת טוקנים\n"
+        f"└── /referral - קוד ההפניה שלך\n"
+        f"└── /my_referrals - המוזמנים שלך\n"
+        f"└── /leaderboard - טבלת מובילים\n"
+        f"└── /level - הרמה והניסיון שלך\n\n"
+        f"💰 **מערכת הטוקנים:**\n"
+        f"└── צ'ק-אין יומי: 1 טוקן\n"
+        f"└── הזמנת חבר: 10 טוקנים\n"
+        f"└── רצף יומי: עד 50 טוקנים\n\n"
+        f"🚀 **התחל עם:**\n"
+        f"/checkin - כדי לצבור טוקנים!\n"
+        f"/referral - כדי להזמין חברים!"
+    )
+
+async def checkin(request):
+    """צ'ק-אין יומי - קבלת טוקן יומי"""
+    user = request.user
+    logger.info(f"📅 קבלת /checkin ממשתמש: {user.id}")
+
+    # הצ'ק-אין וקריאת המשתמש המעודכן בסשן אחד
+    async with unit_of_work():
+        success, message = await checkin_user(user.id, update_id=request.update_id)
+        db_user = await get_user(user.id)
+
+    if not db_user:
+        return Reply(NOT_REGISTERED_TEXT)
+
+    if not success:
+        return Reply(f"❌ **{message}**\n\nנסה שוב מחר עם /checkin!")
+
+    # בדוק בונוסי רצף
+    streak_days = effective_streak(db_user.current_streak, db_user.last_checkin)
+    bonus_tokens = 0
+    for streak_day, bonus in STREAK_BONUS.items():
+        if streak_days >= streak_day and streak_days % streak_day == 0:
+            bonus_tokens = bonus
+            break
+
+    level, progress, total, next_level = level_progress(db_user.experience)
+
+    response = (
+        f"✅ **צ'ק-אין מוצלח!** 🎉\n\n"
+        f"{message}\n\n"
+        f"📊 **פרטים:**\n"
+        f"└── 💰 יתרה מעודכנת: **{format_number(db_user.tokens)} טוקנים** 🪙\n"
+        f"└── 🔥 רצף נוכחי: {streak_days} ימים\n"
+    )
+
+    if bonus_tokens > 0:
+        response += f"└── 🎁 בונוס רצף: +{bonus_tokens} טוקנים!\n\n"
+    else:
+        response += f"└── 🎯 לרמה הבאה: עוד {format_number(next_level - (db_user.experience or 0))} נקודות ניסיון\n\n"
+
+    response += (
+        f"📈 **המשך להתמיד!**\n"
+        f"חזור מחר ל-/checkin כדי לשמור על הרצף!"
+        f"\n\n🏆 **רמה {level}:**\n{create_progress_bar(progress, total)}"
+    )
+    return Reply(response)
+
+async def balance(request):
+    """הצגת יתרת הטוקנים של המשתמש"""
+    user = request.user
+    logger.info(f"💰 קבלת /balance ממשתמש: {user.id}")
+
+    async with unit_of_work():
+        db_user = await get_user(user.id)
+        if db_user:
+            total_referrals = await get_total_referrals(user.id)
+
+    if not db_user:
+        return Reply(NOT_REGISTERED_TEXT)
+
+    balance = db_user.tokens
+    experience = db_user.experience or 0
+    level, progress, total, next_level = level_progress(experience)
+    streak_days = effective_streak(db_user.current_streak, db_user.last_checkin)
+
+    return Reply(
+        f"💰 **פרטי חשבון - {user.first_name}**\n\n"
+        f"📊 **יתרה נוכחית:**\n"
+        f"└── 🪙 טוקנים: **{format_number(balance)}**\n"
+        f"└── 🏦 ערך כולל: **{format_number(balance * 100)} נקודות**\n\n"
+        f"🏆 **רמה והתקדמות:**\n"
+        f"└── 📈 רמה: {level}\n"
+        f"└── 📊 ניסיון ברמה: {format_number(progress)}/{format_number(total)}\n"
+        f"└── 🎯 עד רמה {level+1}: {format_number(next_level - experience)} נקודות ניסיון\n"
+        f"└── {create_progress_bar(progress, total)}\n\n"
+        f"📈 **סטטיסטיקות:**\n"
+        f"└── 🔥 רצף יומי: {streak_days} ימים\n"
+        f"└── 👥 מוזמנים: {total_referrals}\n"
+        f"└── 💰 טוקנים מהפניות: {format_number(total_referrals * 10)}\n\n"
+        f"💡 **טיפ:** השתמש ב-/checkin כל יום כדי לשמור על הרצף ולקבל בונוסים!"
+    )
+
+async def referral(request):
+    """הצגת קוד ההפניה של המשתמש"""
+    user = request.user
+    logger.info(f"📱 קבלת /referral ממשתמש: {user.id}")
+
+    async with unit_of_work():
+        db_user = await get_user(user.id)
+        if db_user:
+            total_referrals = await get_total_referrals(user.id)
+
+    if not db_user:
+        return Reply(NOT_REGISTERED_TEXT)
+
+    referral_code = db_user.referral_code
+    referral_link = f"https://t.me/{request.bot_username}?start={referral_code}"
+
+    response = (
+        f"👤 **קוד ההפניה שלך**\n\n"
+        f"📱 **קוד אישי:**\n"
+        f"`{referral_code}`\n\n"
+        f"🔗 **קישור להזמנה:**\n"
+        f"`{referral_link}`\n\n"
+        f"📊 **סטטיסטיקות הפניות:**\n"
+        f"└── 👥 משתמשים שהזמנת: **{total_referrals}**\n"
+        f"└── 💰 טוקנים שהרווחת: **{format_number(total_referrals * 10)}**\n"
+        f"└── 🎯 יעד הבא: 5 חברים (50 טוקנים)\n\n"
+        f"📚 **איך להזמין חברים:**\n"
+        f"1. שלח לחבר את הקישור למעלה\n"
+        f"2. או בקש ממנו לשלוח: /start {referral_code}\n"
+        f"3. קבל 10 טוקנים על כל חבר שמצטרף!\n\n"
+        f"💡 **טיפ:** שתף בקבוצות לימוד לקבל יותר הפניות!"
+    )
+    buttons = ((
+        Button("📤 שתף קישור", url=f"tg://msg?text={referral_link}"),
+        Button("📊 המוזמנים שלי", callback_data="my_referrals"),
+    ),)
+    return Reply(response, buttons)
+
+async def my_referrals(request):
+    """הצגת רשימת המוזמנים של המשתמש"""
+    user = request.user
+    logger.info(f"👥 קבלת /my_referrals ממשתמש: {user.id}")
+
+    async with unit_of_work():
+        db_user = await get_user(user.id)
+        if db_user:
+            referrals = await get_referred_users(user.id)
+            total_referrals = await get_total_referrals(user.id)
+
+    if not db_user:
+        return Reply(NOT_REGISTERED_TEXT)
+
+    if not referrals:
+        return Reply(
+            f"📊 **סטטיסטיקות הפניות של {user.first_name}**\n\n"
+            f"👥 **מוזמנים:** 0\n"
+            f"💰 **טוקנים מהפניות:** 0\n"
+            f"🎯 **יעד הבא:** הזמן חבר אחד (10 טוקנים)\n\n"
+            f"📱 **עדיין לא הזמנת חברים.**\n"
+            f"השתמש ב-/referral כדי לקבל את קוד ההפניה שלך!\n\n"
+            f"💡 כל חבר מזמין שווה 10 טוקנים!"
+        )
+
+    today = datetime.now().date()
+    recent_referrals = sum(1 for ref in referrals if ref.created_at and ref.created_at.date() == today)
+
+    response = (
+        f"📊 **סטטיסטיקות הפניות של {user.first_name}**\n\n"
+        f"👥 **סך הכל מוזמנים:** {total_referrals}\n"
+        f"💰 **טוקנים מהפניות:** {format_number(total_referrals * 10)}\n"
+        f"📈 **הוזמנו היום:** {recent_referrals}\n\n"
+        f"📋 **רשימת המוזמנים:**\n"
+    )
+
+    # הצגת 5 מוזמנים אחרונים
+    for i, ref in enumerate(referrals[:5], 1):
+        ref_date = ref.created_at.strftime('%d/%m/%Y') if ref.created_at else "תאריך לא ידוע"
+        days_ago = ""
+        if ref.created_at:
+            delta = today - ref.created_at.date()
+            if delta.days == 0:
+                days_ago = "היום"
+            elif delta.days == 1:
+                days_ago = "אתמול"
+            else:
+                days_ago = f"לפני {delta.days} ימים"
+        response += f"{i}. {display_name(ref)} - {ref_date} ({days_ago})\n"
+
+    if len(referrals) > 5:
+        response += f"\n... ועוד {len(referrals) - 5} מוזמנים"
+
+    response += "\n\n💡 **הזמן עוד חברים וקבל עוד טוקנים!**"
+    return Reply(response)
+
+async def leaderboard(request):
+    """טבלת המובילים - המשתמשים עם הכי הרבה טוקנים"""
+    user = request.user
+    logger.info(f"🏆 קבלת /leaderboard ממשתמש: {user.id}")
+
+    # Top 10 מגיע מהמטמון של טבלת המובילים
+    top_users = await get_top_users(limit=10, order_by='tokens')
+
+    if not top_users:
+        return Reply(
+            "🏆 **טבלת המובילים**\n\n"
+            "אין עדיין נתונים. היה הראשון שצובר טוקנים! 💪\n\n"
+            "🚀 שלח /checkin כדי להתחיל לצבור טוקנים!"
+        )
+
+    response = "🏆 **טבלת המובילים - Top 10**\n\n"
+
+    # סמלים לפי מיקום
+    medals = ["🥇", "🥈", "🥉", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"]
+
+    for medal, top_user in zip(medals, top_users):
+        name = display_name(top_user)
+        # קיצור שם אם ארוך מדי
+        if len(name) > 15:
+            name = name[:12] + "..."
+        # סמל מיוחד אם זה המשתמש הנוכחי
+        user_indicator = " 👈" if top_user.telegram_id == user.id else ""
+        response += f"{medal} {name}: {format_number(top_user.tokens)} טוקנים{user_indicator}\n"
+
+    # המיקום של המשתמש הנוכחי (מדויק גם מחוץ ל-Top 100)
+    rank = await get_user_rank(user.id, 'tokens', top_n=10)
+    if rank:
+        response += f"\n📊 **המיקום שלך:** #{rank['position']} עם {format_number(rank['value'])} טוקנים\n"
+        if rank['gap_to_top'] is not None:
+            response += f"🎯 **ל-Top 10 חסרים:** {format_number(rank['gap_to_top'])} טוקנים\n"
+
+    response += "\n💪 **התחרה עם החברים וטפס למעלה!**"
+    return Reply(response)
+
+async def level(request):
+    """הצגת הרמה וההתקדמות של המשתמש"""
+    user = request.user
+    logger.info(f"🏅 קבלת /level ממשתמש: {user.id}")
+
+    async with unit_of_work():
+        db_user = await get_user(user.id)
+        if db_user:
+            total_users = (await get_system_stats()).get('total_users', 0)
+            activity_today = await get_activity_count()
+            rank = await get_user_rank(user.id)
+
+    if not db_user:
+        return Reply(NOT_REGISTERED_TEXT)
+
+    experience = db_user.experience or 0
+    level, progress, total, next_level = level_progress(experience)
+    level_info = get_level_info(level)
+    next_level_info = get_level_info(level + 1)
+    streak_days = effective_streak(db_user.current_streak, db_user.last_checkin)
+
+    response = (
+        f"🏆 **פרופיל משתמש - {user.first_name}**\n\n"
+        f"📊 **נתונים כלליים:**\n"
+        f"└── 💰 טוקנים: **{format_number(db_user.tokens)}**\n"
+        f"└── 🏅 רמה נוכחית: **{level}**\n"
+        f"└── ⭐ ניסיון: **{format_number(experience)}**\n"
+        f"└── 🔥 רצף יומי: **{streak_days} ימים**\n\n"
+        f"📈 **התקדמות ברמה:**\n"
+        f"└── {create_progress_bar(progress, total)}\n"
+        f"└── 📊 התקדמות: {format_number(progress)}/{format_number(total)} נקודות ניסיון\n"
+        f"└── 🎯 עד לרמה {level+1}: {format_number(next_level - experience)} נקודות ניסיון\n\n"
+    )
+
+    if level_info:
+        response += f"📋 **רמה {level}:** {level_info['description']}\n\n"
+    if next_level_info:
+        response += f"🚀 **רמה {level+1}:** {next_level_info['description']}\n\n"
+
+    # מוטיבציה לפי הרמה
+    if level < 3:
+        response += "🌱 **מתחיל** - עבודה טובה! כל יום צ'ק-אין מקרב אותך לרמה הבאה.\n"
+    elif level < 6:
+        response += "🚀 **מתקדם** - מעולה! אתה בדרך להצלחה.\n"
+    elif level < 9:
+        response += "💎 **מנוסה** - מדהים! אתה אחד המובילים.\n"
+    else:
+        response += "👑 **אלוף** - פנטסטי! אתה בפסגה.\n"
+
+    response += (
+        f"\n📊 **סטטיסטיקות מערכת:**\n"
+        f"└── 👥 משתמשים רשומים: {format_number(total_users)}\n"
+        f"└── 📈 פעילים היום: {activity_today}\n"
+        f"└── 🏆 המיקום שלך: #{rank['position'] if rank else 0}\n\n"
+        f"💪 **השתמש ב-/checkin כל יום כדי להתקדם!**"
+    )
+    return Reply(response)
+
+async def profile(request):
+    """הצגת פרופיל מלא של המשתמש"""
+    user = request.user
+    logger.info(f"👤 קבלת /profile ממשתמש: {user.id}")
+
+    async with unit_of_work():
+        db_user = await get_user(user.id)
+        if db_user:
+            total_referrals = await get_total_referrals(user.id)
+            # היסטוריית נוכחות (7 ימים אחרונים) מהסטטיסטיקות היומיות
+            attendance_history = await get_user_daily_history(user.id, 7)
+
+    if not db_user:
+        return Reply(NOT_REGISTERED_TEXT)
+
+    level, progress, total, _ = level_progress(db_user.experience)
+    streak_days = effective_streak(db_user.current_streak, db_user.last_checkin)
+    joined = db_user.created_at.strftime('%d/%m/%Y') if db_user.created_at else 'לא ידוע'
+
+    response = (
+        f"👤 **פרופיל משתמש מלא**\n\n"
+        f"**👤 פרטים אישיים:**\n"
+        f"└── שם: {user.first_name}\n"
+        f"└── משתמש: @{user.username or 'ללא'}\n"
+        f"└── 🆔 מזהה: {user.id}\n"
+        f"└── 📅 הצטרף: {joined}\n\n"
+
+        f"**💰 כלכלה:**\n"
+        f"└── 🪙 טוקנים: {format_number(db_user.tokens)}\n"
+        f"└── 🏅 רמה: {level}\n"
+        f"└── 📊 ניסיון ברמה: {format_number(progress)}/{format_number(total)}\n"
+        f"└── 🔥 רצף יומי: {streak_days} ימים\n\n"
+
+        f"**👥 רשת:**\n"
+        f"└── 👥 מוזמנים: {total_referrals}\n"
+        f"└── 💰 טוקנים מהפניות: {format_number(total_referrals * 10)}\n"
+        f"└── 🔗 קוד הפניה: `{db_user.referral_code}`\n\n"
+    )
+
+    if attendance_history:
+        response += "**📅 נוכחות 7 ימים אחרונים:**\n"
+        for record in attendance_history:
+            checkin_status = "✅" if record['checked_in'] else "❌"
+            response += f"└── {get_day_name(record['date'])} ({record['date'].strftime('%d/%m')}): {checkin_status}\n"
+    else:
+        response += "**📅 נוכחות:** אין היסטוריה זמינה\n"
+
+    response += "\n💡 **השתמש ב-/checkin כל יום כדי לשפר את הפרופיל שלך!**"
+    return Reply(response)
+
+async def tasks(request):
+    """הצגת המשימות הזמינות"""
+    user = request.user
+    logger.info(f"📋 קבלת /tasks ממשתמש: {user.id}")
+
+    async with unit_of_work():
+        db_user = await get_user(user.id)
+        if db_user:
+            available_tasks = await get_available_tasks(user.id)
+
+    if not db_user:
+        return Reply(NOT_REGISTERED_TEXT)
+
+    if not available_tasks:
+        response = (
+            "📋 **משימות זמינות**\n\n"
+            "כרגע אין משימות זמינות.\n\n"
+            "💡 **משימות יומיות אוטומטיות:**\n"
+            "└── 📅 צ'ק-אין יומי - 1 טוקן\n"
+            "└── 🔥 7 ימים רצופים - 10 טוקנים\n"
+            "└── 🗓️ 30 ימים רצופים - 50 טוקנים\n\n"
+            "🔔 משימות חדשות יופיעו כאן בקרוב!"
+        )
+    else:
+        response = "📋 **משימות זמינות**\n\n"
+        for i, task in enumerate(available_tasks[:5], 1):
+            response += f"{i}. **{task.name}**\n"
+            response += f"   └── 🎁 פרס: {task.tokens_reward} טוקנים\n"
+            response += f"   └── 📝 {task.description or ''}\n\n"
+
+        if len(available_tasks) > 5:
+            response += f"... ועוד {len(available_tasks) - 5} משימות\n\n"
+
+        response += "💡 **בצע משימות וקבל טוקנים נוספים!**"
+
+    buttons = ((
+        Button("✅ סיימתי משימה", callback_data="complete_task"),
+        Button("📊 משימות שלי", callback_data="my_tasks"),
+    ),)
+    return Reply(response, buttons)
+
+async def contact(request):
+    """הצגת פרטי קשר עם המנהל"""
+    return Reply(
+        f"📞 **צור קשר עם המנהל**\n\n"
+        f"**👤 פרטי מנהל:**\n"
+        f"└── שם: {ADMIN_INFO['name']}\n"
+        f"└── 📱 טלגרם: {ADMIN_INFO['telegram']}\n"
+        f"└── 📞 טלפון: {ADMIN_INFO['phone']}\n"
+        f"└── 📧 אימייל: {ADMIN_INFO['email']}\n\n"
+
+        f"**🕒 זמני תגובה:**\n"
+        f"└── {ADMIN_INFO['response_time']}\n\n"
+
+        f"**💬 ניתן לפנות בנושאים:**\n"
+        f"• 🛠️ תמיכה טכנית\n"
+        f"• ❓ שאלות על המערכת\n"
+        f"• 💡 הצעות לשיפור\n"
+        f"• 🐛 דיווח על בעיות\n"
+        f"• 🤝 שיתופי פעולה\n\n"
+
+        f"**✉️ נשמח לעזור בכל שאלה!**\n\n"
+        f"📧 **דרכי התקשרות מועדפות:**\n"
+        f"1. הודעה פרטית בטלגרם\n"
+        f"2. שיחת טלפון\n"
+        f"3. אימייל"
+    )
+
+async def help_command(request):
+    """הצגת הודעת עזרה עם כל הפקודות"""
+    return Reply(
+        f"🆘 **עזרה והדרכה - Crypto-Class**\n\n"
+
+        f"**📚 רשימת הפקודות המלאה:**\n\n"
+
+        f"**👤 פקודות בסיסיות:**\n"
+        f"└── /start - הרשמה והתחלת שימוש\n"
+        f"└── /help - תפריט זה\n"
+        f"└── /contact - פרטי קשר עם מנהל\n\n"
+
+        f"**💰 כלכלת טוקנים:**\n"
+        f"└── /checkin - צ'ק-אין יומי (טוקן + בונוסים)\n"
+        f"└── /balance - הצגת יתרת טוקנים\n"
+        f"└── /level - הרמה וההתקדמות שלך\n"
+        f"└── /profile - פרופיל משתמש מלא\n\n"
+
+        f"**👥 רשת והפניות:**\n"
+        f"└── /referral - קוד ההפניה שלך\n"
+        f"└── /my_referrals - המוזמנים שלך\n\n"
+
+        f"**🏆 תחרות ולידרבורד:**\n"
+        f"└── /leaderboard - טבלת המובילים\n"
+        f"└── /stats - סטטיסטיקות מערכת\n\n"
+
+        f"**📋 משימות:**\n"
+        f"└── /tasks - משימות זמינות\n\n"
+
+        f"**🌐 אתר המערכת:**\n"
+        f"└── /website - קישור לאתר\n\n"
+
+        f"**🎯 איך להצליח במערכת:**\n"
+        f"1. שלח /start כדי להירשם\n"
+        f"2. שלח /checkin כל יום (רצף=בונוסים)\n"
+        f"3. הזמן חברים עם /referral\n"
+        f"4. עקוב אחר ההתקדמות עם /level\n"
+        f"5. תחרה עם אחרים ב-/leaderboard\n\n"
+
+        f"**💰 מערכת הטוקנים:**\n"
+        f"└── צ'ק-אין יומי: 1 טוקן\n"
+        f"└── הזמנת חבר: 10 טוקנים\n"
+        f"└── רצף 7 ימים: 10 טוקנים\n"
+        f"└── רצף 30 ימים: 50 טוקנים\n\n"
+
+        f"**❓ בעיות טכניות?** שלח /contact"
+    )
+
+async def website(request):
+    """שליחת קישור לאתר המערכת"""
+    response = (
+        f"🌐 **אתר המערכת - Crypto-Class**\n\n"
+
+        f"**🔗 קישור לאתר:**\n"
+        f"{WEBSITE_URL}\n\n"
+
+        f"**📊 באתר תוכל למצוא:**\n"
+        f"• 📈 סטטיסטיקות מערכת בזמן אמת\n"
+        f"• 🏆 טבלאות מובילים מפורטות\n"
+        f"• 👨‍🏫 דשבורד ניהול למורים\n"
+        f"• 💪 בדיקת בריאות המערכת\n"
+        f"• 📊 גרפים ומגמות\n"
+        f"• 🔍 חיפוש משתמשים מתקדם\n\n"
+
+        f"**💻 גש לאתר למידע נוסף!**\n\n"
+        f"💡 האתר מעודכן בזמן אמת עם הנתונים מהבוט."
+    )
+    return Reply(response, ((Button("🌐 כניסה לאתר", url=WEBSITE_URL),),))
+
+# ========== פקודות מנהל ==========
+
+async def admin_panel(request):
+    """פאנל ניהול למנהלי המערכת"""
+    user = request.user
+    if not is_admin(user.id):
+        return Reply(
+            "❌ **אין לך הרשאות ניהול!**\n\n"
+            "רק מנהלי המערכת יכולים להשתמש בפקודה זו."
+        )
+
+    logger.info(f"🔧 מנהל נכנס לפאנל: {user.id}")
+
+    # שתי הקריאות מגיעות מהמטמון של הסטטיסטיקות
+    stats = await get_system_stats()
+    today_stats = await get_today_stats()
+
+    return Reply(
+        "👑 **פאנל ניהול - Crypto-Class**\n\n"
+        "📊 **סטטיסטיקות מערכת:**\n"
+        f"• 👥 משתמשים: {format_number(stats.get('total_users', 0))}\n"
+        f"• 📅 פעילים היום: {format_number(today_stats.get('active_users_today', 0))}\n"
+        f"• 🔥 צ'ק-אין היום: {format_number(today_stats.get('checkins_today', 0))}\n"
+        f"• 💰 טוקנים כוללים: {format_number(stats.get('total_tokens', 0))}\n\n"
+        "⚙️ **פקודות ניהול:**\n"
+        "• `/admin_stats` - סטטיסטיקות מפורטות\n"
+        "• `/admin_users` - ניהול משתמשים\n"
+        "• `/admin_search <שם / מזהה>` - חיפוש משתמש\n"
+        "• `/admin_broadcast` - שליחת הודעה לכולם\n"
+        "• `/admin_broadcast_cancel <id>` - ביטול שידור\n"
+        "• `/add_tokens <user_id> <amount>` - הוספת טוקנים\n"
+        "• `/reset_checkin <user_id>` - איפוס צ'ק-אין\n\n"
+        "🌐 **דשבורד אתר:**\n"
+        f"• אתר: {WEBSITE_URL}\n"
+        "• דשבורד מורה: /teacher\n"
+        "• סטטיסטיקות: /stats\n\n"
+        f"🆔 **מזהה האדמין שלך:** {user.id}"
+    )
+
+async def add_tokens(request):
+    """הוספת טוקנים למשתמש (למנהל בלבד)"""
+    if not is_admin(request.user.id):
+        return Reply(NOT_ADMIN_TEXT, parse_mode=None)
+
+    try:
+        target_user_id, amount = int(request.args[0]), int(request.args[1])
+    except (IndexError, ValueError):
+        return Reply(
+            "💰 **הוספת טוקנים למשתמש**\n\n"
+            "שימוש: `/add_tokens <user_id> <amount> [reason]`\n"
+            "הסיבה נשמרת ביומן הטוקנים (ברירת מחדל: מזהה האדמין)\n\n"
+            "דוגמה: `/add_tokens 123456789 100 זכייה בתחרות`"
+        )
+    reason = " ".join(request.args[2:]) or f"admin {request.user.id}"
+
+    async with unit_of_work():
+        success, new_balance, _ = await add_tokens_to_user(target_user_id, amount, reason)
+        target_user = await get_user(target_user_id) if success else None
+
+    if not success:
+        return Reply(
+            "❌ לא ניתן להוסיף טוקנים למשתמש זה.\n"
+            "ייתכן שהמשתמש לא קיים.",
+            parse_mode=None
+        )
+
+    return Reply(
+        f"✅ **טוקנים נוספו בהצלחה!**\n\n"
+        f"👤 **משתמש:** {display_name(target_user)}\n"
+        f"🆔 **מזהה:** {target_user_id}\n"
+        f"➕ **נוספו:** {format_number(amount)} טוקנים\n"
+        f"💰 **יתרה חדשה:** {format_number(new_balance)} טוקנים"
+    )
+
+async def reset_checkin(request):
+    """איפוס צ'ק-אין למשתמש (למנהל בלבד)"""
+    if not is_admin(request.user.id):
+        return Reply(NOT_ADMIN_TEXT, parse_mode=None)
+
+    if len(request.args) != 1 or not request.args[0].lstrip('-').isdigit():
+        return Reply(
+            "🔄 **איפוס צ'ק-אין למשתמש**\n\n"
+            "שימוש: `/reset_checkin <user_id>`\n\n"
+            "דוגמה: `/reset_checkin 123456789`"
+        )
+    target_user_id = int(request.args[0])
+
+    async with unit_of_work():
+        success, message = await reset_user_checkin(target_user_id)
+        target_user = await get_user(target_user_id) if success else None
+
+    if not success:
+        return Reply(f"❌ לא ניתן לאפס צ'ק-אין למשתמש זה.\n{message}", parse_mode=None)
+
+    return Reply(
+        f"✅ **צ'ק-אין אופס בהצלחה!**\n\n"
+        f"👤 **משתמש:** {display_name(target_user)}\n"
+        f"🆔 **מזהה:** {target_user_id}\n"
+        f"🔄 **ניתן כעת לבצע צ'ק-אין יומי חדש**"
+    )
+
+__all__ = [
+    'Button', 'Reply', 'CommandRequest', 'execute',
+    'is_admin', 'ADMIN_IDS',
+    'start', 'checkin', 'balance', 'referral', 'my_referrals', 'leaderboard',
+    'level', 'profile', 'tasks', 'contact', 'help_command', 'website',
+    'admin_panel', 'add_tokens', 'reset_checkin'
+]
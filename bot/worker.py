@@ -6,7 +6,11 @@ Worker process לבוט - מריץ את הבוט בפולינג (לגיבוי)
 import os
 import sys
 import logging
-from bot.main import setup_bot
+
+# python bot/worker.py (כמו ב-Procfile) - שורש הפרויקט ב-PATH
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.main import create_bot
 
 # הגדרת לוגים
 logging.basicConfig(
@@ -19,8 +23,11 @@ def main():
     """הרצת worker בפולינג"""
     logger.info("🚀 מפעיל worker בפולינג...")
     
-    # אתחול הבוט
-    bot_app = setup_bot()
+    # אתחול מסד הנתונים והבוט
+    try:
+        bot_app = create_bot()
+    except RuntimeError:
+        sys.exit(1)
     if bot_app:
         try:
             bot_app.run_polling(allowed_updates=None, drop_pending_updates=True)
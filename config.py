@@ -10,7 +10,8 @@ class Config:
     WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "").rstrip('/')
     TEACHER_PASSWORD = os.environ.get("TEACHER_PASSWORD", "admin123")
     SECRET_KEY = os.environ.get("SECRET_KEY", "crypto-class-secret-key-2026")
-    DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///crypto_class.db")
+    # ריק - קובץ SQLite מקומי ב-data/attendance.db (database/engine.py)
+    DATABASE_URL = os.environ.get("DATABASE_URL", "")
     USE_POLLING = os.environ.get("USE_POLLING", "false").lower() == "true"
     
     @classmethod
@@ -28,3 +29,16 @@ class Config:
             raise ValueError("שגיאות בהגדרות: " + ", ".join(errors))
         
         return True
+
+def get_app_info():
+    """פרטי האפליקציה להצגה (init_db.py)"""
+    from sqlalchemy.engine import make_url
+    from bot import __version__, __author__
+    from database.engine import get_database_url
+    
+    return {
+        'name': 'Crypto-Class',
+        'version': __version__,
+        'author': __author__,
+        'database_path': make_url(get_database_url()).render_as_string(hide_password=True),
+    }
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+ממשק אסינכרוני לשאילתות מסד הנתונים - עבור handlers של python-telegram-bot
+כל פונקציה ב-queries זמינה כאן בשם זהה כ-coroutine שרצה ב-thread pool מוגבל,
+כך ששאילתה איטית לא עוצרת את לולאת האירועים
+"""
+
+import os
+import asyncio
+import functools
+import contextvars
+import logging
+import threading
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from . import queries
+from .unit_of_work import get_current_session, begin_unit_of_work, detach_unit_of_work, finish_session
+
+logger = logging.getLogger(__name__)
+
+# מספר השאילתות שרצות במקביל - לא יותר מגודל מאגר החיבורים
+DB_MAX_WORKERS = int(os.environ.get("DB_MAX_WORKERS", 8))
+
+_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="db")
+
+# לכל יחידת עבודה thread משלה לכל אורכה. יחידה מחזיקה טרנזקציה (ונעילות) בין שאילתה
+# לשאילתה - אם השאילתה הבאה שלה הייתה ממתינה בתור המשותף מאחורי threads שממתינים
+# לאותן נעילות, אף אחד לא היה מתקדם עד ה-timeout
+_unit_executor = contextvars.ContextVar('crypto_class_unit_executor', default=None)
+_idle_unit_executors = []
+_idle_lock = threading.Lock()
+
+def _acquire_unit_executor():
+    with _idle_lock:
+        if _idle_unit_executors:
+            return _idle_unit_executors.pop()
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-unit")
+
+def _release_unit_executor(executor):
+    with _idle_lock:
+        if len(_idle_unit_executors) < DB_MAX_WORKERS:
+            _idle_unit_executors.append(executor)
+            return
+    executor.shutdown(wait=False)
+
+async def run_query(func, *args, **kwargs):
+    """הרצת פונקציית מסד נתונים חוסמת ב-thread pool והמתנה לתוצאה"""
+    loop = asyncio.get_running_loop()
+    executor = _unit_executor.get() or _executor
+    # העתקת ההקשר כדי שיחידת העבודה הפעילה תהיה זמינה גם ב-thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(context.run, func, *args, **kwargs))
+
+@asynccontextmanager
+async def unit_of_work(write=False):
+    """יחידת עבודה לעדכון טלגרם - כל השאילתות בתוך הבלוק חולקות סשן אחד ו-commit אחד.
+    השאילתות בתוך הבלוק צריכות לרוץ בזו אחר זו (לא ב-gather) כי סשן אינו thread-safe.
+    write - יחידה שכותבת (טרנזקציית כתיבה מהשאילתה הראשונה, BEGIN IMMEDIATE ב-SQLite)"""
+    if get_current_session() is not None:
+        yield get_current_session()
+        return
+
+    executor = _acquire_unit_executor()
+    executor_token = _unit_executor.set(executor)
+    token = begin_unit_of_work(write)
+    try:
+        yield get_current_session()
+    except BaseException as e:
+        await run_query(finish_session, detach_unit_of_work(token), e)
+        raise
+    else:
+        await run_query(finish_session, detach_unit_of_work(token))
+    finally:
+        _unit_executor.reset(executor_token)
+        _release_unit_executor(executor)
+
+def _make_async(func):
+    """עטיפת פונקציה סינכרונית כ-coroutine עם אותה חתימה"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_query(func, *args, **kwargs)
+    return wrapper
+
+# גרסה אסינכרונית לכל פונקציה שמיוצאת מ-queries
+for _name in queries.__all__:
+    globals()[_name] = _make_async(getattr(queries, _name))
+
+# ========== סריקה בזרם ==========
+# גנרטורים לא יכולים לרוץ ב-thread pool כמו שהם - כל מנה נשלפת בנפרד ב-run_query
+
+async def iter_users(columns=('telegram_id',), batch_size=queries.USER_STREAM_BATCH_SIZE):
+    """async for על כל המשתמשים, מנה אחר מנה (ראה queries.iter_users)"""
+    after_id = 0
+    while True:
+        page = await run_query(queries.get_users_page, after_id, batch_size, columns)
+        if not page:
+            return
+        for row in page:
+            yield row
+        after_id = page[-1].id
+
+async def broadcast_message_to_all(batch_size=queries.USER_STREAM_BATCH_SIZE):
+    """מזהי הטלגרם של כל משתמשי המערכת לשידור - async for"""
+    async for row in iter_users(('telegram_id',), batch_size):
+        yield row.telegram_id
+
+def shutdown(wait=True):
+    """סגירת ה-thread pool בעת כיבוי"""
+    _executor.shutdown(wait=wait)
+    with _idle_lock:
+        while _idle_unit_executors:
+            _idle_unit_executors.pop().shutdown(wait=wait)
+
+__all__ = list(queries.__all__) + ['run_query', 'unit_of_work', 'shutdown', 'DB_MAX_WORKERS']
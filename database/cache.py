@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+שכבת מטמון לקריאות דשבורד וטבלאות מובילים
+TTL לכל מפתח, פינוי LRU לפי גודל, וביטול מפורש לפי מרחב שמות
+
+ברירת המחדל היא מטמון בזיכרון התהליך. כאשר CACHE_URL מוגדר (redis://...)
+כל תהליכי gunicorn חולקים את אותו מטמון ואת אותן גרסאות ביטול.
+"""
+
+import os
+import time
+import pickle
+import logging
+import threading
+import functools
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = int(os.environ.get("CACHE_MAX_SIZE", 1024))
+
+# ========== Backends ==========
+
+class MemoryCacheBackend:
+    """מטמון בזיכרון התהליך עם TTL ופינוי LRU"""
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """מחזיר (נמצא, ערך)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_version(self, namespace):
+        return self._versions.get(namespace, 0)
+
+    def bump_version(self, namespace):
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+            return self._versions[namespace]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+class RedisCacheBackend:
+    """מטמון משותף ב-Redis - כל התהליכים רואים את אותם ערכים ואותן גרסאות"""
+
+    def __init__(self, url, prefix="crypto_class:"):
+        if redis is None:
+            raise ImportError("חבילת redis לא מותקנת - התקן עם: pip install redis")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return False, None
+        return True, pickle.loads(raw)
+
+    def set(self, key, value, ttl):
+        self.client.setex(self.prefix + key, max(int(ttl), 1), pickle.dumps(value))
+
+    def get_version(self, namespace):
+        raw = self.client.get(f"{self.prefix}version:{namespace}")
+        return int(raw) if raw else 0
+
+    def bump_version(self, namespace):
+        return self.client.incr(f"{self.prefix}version:{namespace}")
+
+    def clear(self):
+        for key in self.client.scan_iter(f"{self.prefix}*"):
+            self.client.delete(key)
+
+# ========== בחירת backend ==========
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_cache_backend():
+    """ה-backend הפעיל - Redis אם CACHE_URL מוגדר, אחרת זיכרון מקומי"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                cache_url = os.environ.get("CACHE_URL", "")
+                if cache_url:
+                    try:
+                        _backend = RedisCacheBackend(cache_url)
+                        logger.info("✅ מטמון משותף (Redis) הופעל")
+                    except Exception as e:
+                        logger.error(f"❌ שגיאה בחיבור למטמון משותף, עובר למטמון מקומי: {e}")
+                if _backend is None:
+                    _backend = MemoryCacheBackend()
+    return _backend
+
+def configure_cache(backend):
+    """החלפת ה-backend (למשל backend משותף מותאם אישית)"""
+    global _backend
+    _backend = backend
+
+# ========== API ==========
+
+def cached(namespace, ttl):
+    """דקורטור - שמירת תוצאת הפונקציה לפי הארגומנטים, עד ttl שניות או עד ביטול המרחב"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            backend = get_cache_backend()
+            try:
+                version = backend.get_version(namespace)
+                key = f"{namespace}:{version}:{args!r}:{sorted(kwargs.items())!r}"
+                found, value = backend.get(key)
+                if found:
+                    return value
+            except Exception as e:
+                logger.error(f"❌ שגיאה בקריאה מהמטמון: {e}")
+                return func(*args, **kwargs)
+
+            value = func(*args, **kwargs)
+            try:
+                backend.set(key, value, ttl)
+            except Exception as e:
+                logger.error(f"❌ שגיאה בכתיבה למטמון: {e}")
+            return value
+
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+def invalidate(*namespaces):
+    """ביטול כל הערכים השמורים במרחבי השמות (נקרא אחרי כתיבה למסד הנתונים)"""
+    backend = get_cache_backend()
+    for namespace in namespaces:
+        try:
+            backend.bump_version(namespace)
+        except Exception as e:
+            logger.error(f"❌ שגיאה בביטול מטמון {namespace}: {e}")
+
+def clear_cache():
+    """ניקוי כל המטמון"""
+    get_cache_backend().clear()
+
+__all__ = [
+    'MemoryCacheBackend', 'RedisCacheBackend',
+    'get_cache_backend', 'configure_cache',
+    'cached', 'invalidate', 'clear_cache'
+]
@@ -88,26 +88,15 @@ def get_system_health():
         session.close()
 
 def ensure_database_initialized():
-    """אתחול מסד נתונים אם לא מאותחל"""
+    """אתחול מסד נתונים אם לא מאותחל - נקרא במפורש בעליית התהליך (create_app / worker / init_db.py),
+    לא בעת יבוא המודול. מסד שכבר בגרסת האתחול הנוכחית עולה בשאילתה אחת"""
+    from .queries import BOOTSTRAP_VERSION
     try:
-        # בדיקה אם מסד הנתונים כבר מאותחל
-        session = Session()
-        user_count = session.query(User).count()
-        session.close()
-        
-        if user_count == 0:
-            print("🔧 מאתחל מסד נתונים חדש...")
-            init_database()
+        if init_database():
+            print(f"🔧 מסד הנתונים אותחל לגרסה {BOOTSTRAP_VERSION}")
             return True
-        else:
-            print(f"✅ מסד נתונים כבר מאותחל: {user_count} משתמשים")
-            return False
+        print(f"✅ מסד נתונים כבר מאותחל (גרסה {BOOTSTRAP_VERSION})")
+        return False
     except Exception as e:
-        print(f"❌ שגיאה בבדיקת אתחול מסד נתונים: {e}")
-        # נסה לאתחל בכל מקרה
-        init_database()
-        return True
-
-# אתחול אוטומטי בעת יבוא המודול
-if __name__ != "__main__":
-    ensure_database_initialized()
+        print(f"❌ שגיאה באתחול מסד נתונים: {e}")
+        raise
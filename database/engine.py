@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+יצירת מנוע מסד הנתונים לפי DATABASE_URL
+PostgreSQL בפרודקשן, SQLite מקומי כברירת מחדל - עם הגדרות מאגר חיבורים ו-pragmas
+"""
+
+import os
+import logging
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# מסד ה-SQLite המקומי כאשר DATABASE_URL לא מוגדר
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'attendance.db')
+
+# הגדרות מאגר החיבורים
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 4))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_ECHO = os.environ.get("DB_ECHO", "false").lower() == "true"
+
+# הגדרות SQLite
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 15000))
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 64 * 1024 * 1024))
+# DEFERRED - קריאות לא תופסות את נעילת הכתיבה ורצות במקביל לכותב (WAL)
+SQLITE_BEGIN_MODE = os.environ.get("SQLITE_BEGIN_MODE", "DEFERRED").upper()
+
+# אפשרות הרצה למסלולי כתיבה: IMMEDIATE תופס את נעילת הכתיבה בתחילת הטרנזקציה וממתין לה
+# לפי busy_timeout, במקום להיכשל עם "database is locked" כשקריאה מנסה להפוך לכתיבה באמצע.
+# ב-PostgreSQL האפשרות מתעלמת
+WRITE_EXECUTION_OPTIONS = {'sqlite_begin': 'IMMEDIATE'}
+
+def get_database_url():
+    """כתובת מסד הנתונים - Config.DATABASE_URL או קובץ SQLite מקומי"""
+    url = (Config.DATABASE_URL or "").strip()
+    if not url:
+        os.makedirs(os.path.dirname(DEFAULT_DB_PATH), exist_ok=True)
+        return f'sqlite:///{DEFAULT_DB_PATH}'
+
+    # Railway/Heroku מספקים postgres:// ש-SQLAlchemy 2 לא מכיר
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+def _setup_sqlite(engine):
+    """pragmas לכל חיבור SQLite חדש, ושליטה על BEGIN במקום מנהל ההתקן
+    (DEFERRED כברירת מחדל, IMMEDIATE לחיבורים עם WRITE_EXECUTION_OPTIONS)"""
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # מנהל ההתקן של sqlite3 לא ישלח BEGIN בעצמו - נשלח אותו ב-begin למטה
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def do_begin(conn):
+        mode = conn.get_execution_options().get('sqlite_begin', SQLITE_BEGIN_MODE)
+        conn.exec_driver_sql(f"BEGIN {mode}")
+
+def write_engine(engine):
+    """המנוע עם אפשרויות הכתיבה - engine.begin() שלו פותח טרנזקציית כתיבה (מאגר החיבורים משותף)"""
+    return engine.execution_options(**WRITE_EXECUTION_OPTIONS)
+
+def create_db_engine(url=None, **overrides):
+    """יצירת מנוע לפי הכתובת (ברירת מחדל: Config.DATABASE_URL) עם הגדרות המאגר מהסביבה"""
+    url = make_url(url or get_database_url())
+    options = {'echo': DB_ECHO}
+
+    if url.get_backend_name() == 'sqlite':
+        in_memory = url.database in (None, '', ':memory:')
+        options['connect_args'] = {
+            'check_same_thread': False,
+            'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000,
+        }
+        if not in_memory:
+            options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                           pool_timeout=DB_POOL_TIMEOUT)
+    else:
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+
+    options.update(overrides)
+    engine = create_engine(url, **options)
+
+    if engine.dialect.name == 'sqlite':
+        _setup_sqlite(engine)
+
+    logger.info(f"✅ מנוע מסד נתונים: {engine.dialect.name} ({url.render_as_string(hide_password=True)})")
+    return engine
+
+__all__ = ['DEFAULT_DB_PATH', 'WRITE_EXECUTION_OPTIONS', 'get_database_url', 'create_db_engine', 'write_engine']
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+עקומת הרמות של Crypto-Class - מקור יחיד לחישובי רמה
+הרמה נקבעת לפי נקודות הניסיון (User.experience); גם העדכון במסד (update_user_level)
+וגם התצוגה בבוט משתמשים בפונקציות כאן
+
+הספים מחושבים פעם אחת בטעינת המודול (tuple שלא משתנה) והחיפוש הוא bisect - O(log n).
+לחישוב מחדש של הרמות של הרבה משתמשים (recompute_user_levels) יש מסלול וקטורי:
+numpy.searchsorted אם NumPy מותקן, ואחרת bisect על array של המנה
+"""
+
+from array import array
+from bisect import bisect_right
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# ניסיון מינימלי לכל רמה - רמה 1 מתחילה ב-0 (עולה ממש)
+LEVEL_THRESHOLDS = (0, 100, 300, 600, 1000, 1500, 2100, 2800,
+                    3600, 4500, 5500, 6600, 7800, 9100, 10500)
+MAX_LEVEL = len(LEVEL_THRESHOLDS)
+
+# הניסיון לרמה הבאה לפי רמה (אינדקס level - 1) - ברמה המירבית פי 1.5 מהסף האחרון
+NEXT_LEVEL_EXPERIENCE = LEVEL_THRESHOLDS[1:] + (int(LEVEL_THRESHOLDS[-1] * 1.5),)
+
+_THRESHOLDS_ARRAY = numpy.array(LEVEL_THRESHOLDS, dtype=numpy.int64) if numpy is not None else None
+
+def level_for_experience(experience):
+    """הרמה שמתאימה לכמות הניסיון"""
+    # מספר הספים שהניסיון הגיע אליהם הוא הרמה; ניסיון שלילי נשאר ברמה 1
+    return max(bisect_right(LEVEL_THRESHOLDS, experience or 0), 1)
+
+def next_level_experience(level):
+    """הניסיון שנדרש לרמה הבאה"""
+    return NEXT_LEVEL_EXPERIENCE[min(max(level, 1), MAX_LEVEL) - 1]
+
+def level_progress(experience):
+    """(רמה, התקדמות ברמה, גודל הרמה, ניסיון לרמה הבאה)"""
+    experience = experience or 0
+    level = level_for_experience(experience)
+    level_min = LEVEL_THRESHOLDS[level - 1]
+    next_level_min = NEXT_LEVEL_EXPERIENCE[level - 1]
+    return level, experience - level_min, next_level_min - level_min, next_level_min
+
+def levels_for_experience(experiences):
+    """הרמות של רצף ערכי ניסיון בבת אחת - רשימת int באותו סדר (None נחשב 0)"""
+    values = array('q', (experience or 0 for experience in experiences))
+    if numpy is not None:
+        levels = numpy.searchsorted(_THRESHOLDS_ARRAY, numpy.frombuffer(values, dtype=numpy.int64), side='right')
+        return numpy.maximum(levels, 1).tolist()
+    thresholds, search = LEVEL_THRESHOLDS, bisect_right
+    return [search(thresholds, experience) or 1 for experience in values]
+
+__all__ = [
+    'LEVEL_THRESHOLDS', 'MAX_LEVEL', 'NEXT_LEVEL_EXPERIENCE',
+    'level_for_experience', 'next_level_experience', 'level_progress',
+    'levels_for_experience'
+]
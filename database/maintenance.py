@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+פקודות תחזוקה למסד הנתונים - חישובים מחדש מתוך ההיסטוריה
+
+שימוש:
+    python -m database.maintenance rollups [--since YYYY-MM-DD] [--until YYYY-MM-DD] [--overwrite]
+    python -m database.maintenance daily-stats
+    python -m database.maintenance streaks
+    python -m database.maintenance ledger [--fix]
+    python -m database.maintenance levels [--batch-size N]
+"""
+
+import sys
+import logging
+import argparse
+from datetime import date
+
+from .queries import (
+    backfill_daily_rollups, backfill_user_daily_stats, backfill_user_streaks, reconcile_token_ledger,
+    recompute_user_levels, USER_STREAM_BATCH_SIZE
+)
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"תאריך לא תקין: {value} (YYYY-MM-DD)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m database.maintenance', description="תחזוקת מסד הנתונים")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    rollups = commands.add_parser('rollups', help="חישוב טבלת המדדים היומיים (daily_rollups) מההיסטוריה")
+    rollups.add_argument('--since', type=_parse_date, help="מהתאריך (כולל)")
+    rollups.add_argument('--until', type=_parse_date, help="עד התאריך (כולל)")
+    rollups.add_argument('--overwrite', action='store_true',
+                         help="חישוב מחדש גם של ימים שכבר נספרו (בונוסי רמה והענקות ידניות יאבדו)")
+
+    commands.add_parser('daily-stats', help="חישוב user_daily_stats (שורה לכל משתמש ויום) מההיסטוריה")
+    commands.add_parser('streaks', help="חישוב רצפי הצ'ק-אין של כל המשתמשים מהיסטוריית הנוכחות")
+
+    ledger = commands.add_parser('ledger', help="בדיקת יתרות המשתמשים מול יומן הטוקנים")
+    ledger.add_argument('--fix', action='store_true', help="רישום רשומת תיקון לכל פער")
+
+    levels = commands.add_parser('levels', help="חישוב מחדש של רמות המשתמשים לפי עקומת הרמות (database/levels.py)")
+    levels.add_argument('--batch-size', type=int, default=USER_STREAM_BATCH_SIZE, help="משתמשים בכל מנה")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    if args.command == 'rollups':
+        days = backfill_daily_rollups(args.since, args.until, overwrite=args.overwrite)
+        print(f"✅ מדדים יומיים חושבו עבור {days} ימים")
+    elif args.command == 'daily-stats':
+        rows = backfill_user_daily_stats()
+        print(f"✅ סטטיסטיקות יומיות חושבו: {rows} שורות")
+    elif args.command == 'streaks':
+        users = backfill_user_streaks()
+        print(f"✅ רצפים חושבו עבור {users} משתמשים")
+    elif args.command == 'ledger':
+        result = reconcile_token_ledger(fix=args.fix)
+        for sample in result['samples']:
+            print(f"⚠️ {sample['telegram_id']}: יתרה {sample['tokens']}, סכום היומן {sample['ledger_total']}, "
+                  f"יתרה אחרונה ביומן {sample['last_balance']}")
+        print(f"{'✅' if not result['mismatched'] else '⚠️'} נבדקו {result['users']} משתמשים: "
+              f"{result['mismatched']} פערים, {result['fixed']} תוקנו")
+        return 1 if result['mismatched'] and not args.fix else 0
+    elif args.command == 'levels':
+        result = recompute_user_levels(batch_size=args.batch_size)
+        if result['error']:
+            print(f"❌ החישוב נעצר אחרי {result['users']} משתמשים ({result['changed']} עודכנו): {result['error']}")
+            return 1
+        print(f"✅ רמות חושבו מחדש עבור {result['users']} משתמשים: {result['changed']} עודכנו")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
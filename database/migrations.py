@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+עדכון סכמה למסדי נתונים קיימים
+create_all יוצר טבלאות חדשות בלבד ולא מוסיף עמודות או אינדקסים לטבלאות קיימות -
+כל שינוי כזה במודלים נכנס כמיגרציה חדשה בסוף MIGRATIONS.
+
+כל מיגרציה רצה פעם אחת ונרשמת ב-schema_migrations עם checksum של השלבים שלה;
+מיגרציה שכבר רצה ושלביה שונו מאז נחשבת לשגיאה (מוסיפים מיגרציה חדשה במקום לערוך).
+השלבים אידמפוטנטיים - מסד שכבר קיבל את השינוי (create_all, או עדכון ידני) רק נרשם,
+ומיגרציה שנכשלה באמצע פשוט רצה שוב מההתחלה.
+"""
+
+import json
+import hashlib
+import logging
+from datetime import datetime
+
+from sqlalchemy import inspect, text, select, insert, func, MetaData
+
+logger = logging.getLogger(__name__)
+
+class MigrationError(RuntimeError):
+    """מיגרציה שכבר רצה שונתה, או שלב שלא ניתן להריץ בניב הנוכחי"""
+
+# ========== שלבי מיגרציה ==========
+
+class AddColumn:
+    """הוספת עמודה לטבלה קיימת (ALTER TABLE ADD COLUMN - זהה ב-SQLite וב-PostgreSQL)"""
+
+    def __init__(self, table, column, ddl):
+        self.table, self.column, self.ddl = table, column, ddl
+
+    def describe(self):
+        return ['add_column', self.table, self.column, self.ddl]
+
+    def apply(self, engine, changed):
+        # הבדיקה וההוספה על אותו חיבור - חיבור נוסף היה ממתין לנעילת הכתיבה של זה
+        with engine.begin() as conn:
+            inspector = inspect(conn)
+            if not inspector.has_table(self.table):
+                return False
+            if self.column in {c['name'] for c in inspector.get_columns(self.table)}:
+                return False
+            conn.execute(text(f"ALTER TABLE {self.table} ADD COLUMN {self.column} {self.ddl}"))
+        logger.info(f"✅ עמודה נוספה: {self.table}.{self.column}")
+        return True
+
+class CreateTable:
+    """טבלה חדשה שהוגדרה במודל - create_all יוצר אותה רק כשהאתחול רץ, ומסד מעודכן לא מגיע אליו"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def describe(self):
+        return ['create_table', self.table]
+
+    def apply(self, engine, changed):
+        from .models import Base
+        with engine.begin() as conn:
+            if inspect(conn).has_table(self.table):
+                return False
+            Base.metadata.tables[self.table].create(conn)
+        logger.info(f"✅ טבלה נוצרה: {self.table}")
+        return True
+
+class CreateIndex:
+    """יצירת אינדקס שהוגדר במודל - ב-PostgreSQL עם CONCURRENTLY (בלי לנעול כתיבות לטבלה)"""
+
+    def __init__(self, table, name):
+        self.table, self.name = table, name
+
+    def describe(self):
+        return ['create_index', self.table, self.name]
+
+    def apply(self, engine, changed):
+        from .models import Base
+        index = next(ix for ix in Base.metadata.tables[self.table].indexes if ix.name == self.name)
+        return create_index(engine, index)
+
+class RebuildTable:
+    """שינוי שאין לו ALTER ב-SQLite (סוג עמודה, אילוץ, מחיקת עמודה) - בנייה מחדש של הטבלה לפי המודל;
+    ב-PostgreSQL רצות במקום זאת פקודות ה-ALTER שב-postgres"""
+
+    def __init__(self, table, postgres=()):
+        self.table, self.postgres = table, list(postgres)
+
+    def describe(self):
+        return ['rebuild_table', self.table, self.postgres]
+
+    def apply(self, engine, changed):
+        if engine.dialect.name == 'sqlite':
+            return rebuild_sqlite_table(engine, self.table)
+        if not self.postgres:
+            raise MigrationError(f"אין פקודות PostgreSQL לבנייה מחדש של {self.table}")
+        with engine.begin() as conn:
+            for statement in self.postgres:
+                conn.execute(text(statement))
+        return True
+
+class Backfill:
+    """חישוב נתונים מההיסטוריה בפונקציה של database.queries
+
+    ברירת מחדל - רק אם שלב קודם באותה מיגרציה שינה את הסכמה (במסד חדש אין מה לחשב);
+    if_empty - כשהטבלה הנגזרת ריקה במסד שכבר יש בו משתמשים"""
+
+    def __init__(self, function, if_empty=None, **kwargs):
+        self.function, self.if_empty, self.kwargs = function, if_empty, kwargs
+
+    def describe(self):
+        return ['backfill', self.function, self.if_empty, self.kwargs]
+
+    def apply(self, engine, changed):
+        if self.if_empty is not None:
+            if not _needs_backfill(engine, self.if_empty):
+                return False
+        elif not changed:
+            return False
+        from . import queries
+        getattr(queries, self.function)(**self.kwargs)
+        return True
+
+class Migration:
+    """מיגרציה ממוספרת - רשימת שלבים שרצים לפי הסדר"""
+
+    def __init__(self, id, name, steps):
+        self.id, self.name, self.steps = id, name, steps
+
+    @property
+    def checksum(self):
+        payload = json.dumps([step.describe() for step in self.steps], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def __repr__(self):
+        return f"<Migration {self.id:04d} {self.name}>"
+
+# ========== המיגרציות ==========
+
+# להוסיף רק בסוף, עם המספר הבא - אין לערוך מיגרציה שכבר שוחררה
+MIGRATIONS = [
+    Migration(1, 'users_streak_columns', [
+        AddColumn('users', 'current_streak', 'INTEGER DEFAULT 0'),
+        AddColumn('users', 'longest_streak', 'INTEGER DEFAULT 0'),
+        # מילוי ראשוני של רצפים מתוך היסטוריית הנוכחות
+        Backfill('backfill_user_streaks'),
+    ]),
+    Migration(2, 'attendance_update_id', [
+        AddColumn('attendance', 'update_id', 'BIGINT'),
+        CreateIndex('attendance', 'uq_attendance_update_id'),
+    ]),
+    Migration(3, 'user_daily_stats_checkins_referrals', [
+        AddColumn('user_daily_stats', 'checkins', 'INTEGER DEFAULT 0'),
+        AddColumn('user_daily_stats', 'referrals', 'INTEGER DEFAULT 0'),
+        # המילוי כותב ב-ON CONFLICT (telegram_id, date)
+        CreateIndex('user_daily_stats', 'uq_user_daily_stats_user_date'),
+        # השורות הקיימות נכתבו רק בצ'ק-אין (בלי משימות ועם רצף 1) - חישוב מחדש מההיסטוריה
+        Backfill('backfill_user_daily_stats'),
+    ]),
+    Migration(4, 'daily_rollups_backfill', [
+        Backfill('backfill_daily_rollups', if_empty='daily_rollups'),
+    ]),
+    Migration(5, 'token_ledger_opening_balances', [
+        # יתרת פתיחה לכל משתמש קיים
+        Backfill('reconcile_token_ledger', if_empty='token_ledger', fix=True),
+    ]),
+    Migration(6, 'tasks_name_unique', [
+        CreateIndex('tasks', 'uq_tasks_name'),
+    ]),
+    Migration(7, 'scheduled_job_runs', [
+        CreateTable('scheduled_job_runs'),
+    ]),
+]
+
+LATEST_MIGRATION = max(migration.id for migration in MIGRATIONS)
+
+# ========== הרצה ==========
+
+def get_applied_migrations(conn):
+    """{מספר: (שם, checksum)} של המיגרציות שכבר רצו"""
+    from .models import SchemaMigration
+    if not inspect(conn).has_table(SchemaMigration.__tablename__):
+        return {}
+    rows = conn.execute(select(SchemaMigration.id, SchemaMigration.name, SchemaMigration.checksum))
+    return {row.id: (row.name, row.checksum) for row in rows}
+
+def get_latest_applied_migration(conn):
+    """מספר המיגרציה האחרונה שרצה (0 אם אין) - שאילתה אחת, לבדיקה מהירה בעליית התהליך"""
+    from .models import SchemaMigration
+    return conn.execute(select(func.max(SchemaMigration.id))).scalar() or 0
+
+def verify_migrations(applied):
+    """מיגרציה שרצה ושלביה שונו מאז - שגיאה; מיגרציה במסד שלא קיימת בקוד - אזהרה"""
+    known = {migration.id: migration for migration in MIGRATIONS}
+    for migration_id, (name, checksum) in sorted(applied.items()):
+        migration = known.get(migration_id)
+        if migration is None:
+            logger.warning(f"⚠️ מיגרציה {migration_id:04d} {name} רצה במסד אך לא קיימת בקוד")
+        elif migration.checksum != checksum:
+            raise MigrationError(
+                f"מיגרציה {migration_id:04d} {name} שונתה אחרי שרצה - יש להוסיף מיגרציה חדשה במקום"
+            )
+
+def run_migrations(engine):
+    """הרצת המיגרציות שטרם רצו לפי הסדר - מחזיר את שמותיהן"""
+    from .models import SchemaMigration
+
+    with engine.begin() as conn:
+        SchemaMigration.__table__.create(conn, checkfirst=True)
+        applied = get_applied_migrations(conn)
+    verify_migrations(applied)
+
+    ran = []
+    for migration in sorted(MIGRATIONS, key=lambda m: m.id):
+        if migration.id in applied:
+            continue
+        # כל שלב בטרנזקציה משלו - CONCURRENTLY ומילויים בסשן לא יכולים לרוץ בתוך טרנזקציה פתוחה
+        changed = False
+        for step in migration.steps:
+            changed = step.apply(engine, changed) or changed
+        with engine.begin() as conn:
+            # ב-SQLite שני תהליכים יכולים להריץ את אותה מיגרציה (השלבים אידמפוטנטיים) - נרשמת פעם אחת
+            if conn.execute(select(SchemaMigration.id).where(SchemaMigration.id == migration.id)).first():
+                continue
+            conn.execute(insert(SchemaMigration).values(
+                id=migration.id, name=migration.name, checksum=migration.checksum, applied_at=datetime.now()
+            ))
+        logger.info(f"✅ מיגרציה {migration.id:04d} {migration.name} {'הורצה' if changed else 'נרשמה'}")
+        ran.append(migration.name)
+    return ran
+
+def upgrade_schema(engine):
+    """מיגרציות שטרם רצו, אינדקסים חסרים ואינדקס החיפוש - מחזיר את שמות המיגרציות שרצו"""
+    ran = run_migrations(engine)
+    create_missing_indexes(engine)
+
+    # אינדקס החיפוש (FTS5 / pg_trgm) - אחרי שכל העמודות קיימות
+    from .search import install_search_index
+    install_search_index(engine)
+
+    return ran
+
+def _needs_backfill(engine, table):
+    """טבלה נגזרת ריקה במסד שכבר יש בו משתמשים"""
+    with engine.connect() as conn:
+        if table not in inspect(conn).get_table_names():
+            return False
+        if conn.execute(text(f"SELECT 1 FROM {table} LIMIT 1")).first():
+            return False
+        return conn.execute(text("SELECT 1 FROM users LIMIT 1")).first() is not None
+
+# ========== אינדקסים ==========
+
+def create_index(engine, index):
+    """יצירת אינדקס אם חסר - מחזיר True אם נוצר
+
+    ב-PostgreSQL עם CREATE INDEX CONCURRENTLY מחוץ לטרנזקציה, ואינדקס שנשאר INVALID
+    מבנייה שנכשלה נמחק ונבנה מחדש"""
+    table_name = index.table.name
+    columns = [c.name for c in index.columns]
+    unique = "UNIQUE " if index.unique else ""
+
+    if engine.dialect.name != 'postgresql':
+        with engine.begin() as conn:
+            if index.name in {ix['name'] for ix in inspect(conn).get_indexes(table_name)}:
+                return False
+            if index.unique:
+                _remove_duplicates(conn, table_name, columns)
+            conn.execute(text(f"CREATE {unique}INDEX {index.name} ON {table_name} ({', '.join(columns)})"))
+        logger.info(f"✅ אינדקס נוצר: {index.name}")
+        return True
+
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        valid = conn.execute(text(
+            "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+        ), {'name': index.name}).scalar()
+        if valid:
+            return False
+        if valid is not None:
+            logger.warning(f"⚠️ אינדקס {index.name} לא תקין (בנייה קודמת נכשלה) - נבנה מחדש")
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))
+        if index.unique:
+            _remove_duplicates(conn, table_name, columns)
+        conn.execute(text(
+            f"CREATE {unique}INDEX CONCURRENTLY {index.name} ON {table_name} ({', '.join(columns)})"
+        ))
+    logger.info(f"✅ אינדקס נוצר: {index.name} (CONCURRENTLY)")
+    return True
+
+def create_missing_indexes(engine):
+    """יצירת אינדקסים שהוגדרו במודלים וחסרים בטבלאות קיימות - מחזיר את שמותיהם"""
+    from .models import Base
+
+    with engine.connect() as conn:
+        tables = set(inspect(conn).get_table_names())
+
+    return [
+        index.name
+        for table in Base.metadata.sorted_tables if table.name in tables
+        for index in table.indexes if create_index(engine, index)
+    ]
+
+def _remove_duplicates(conn, table_name, columns):
+    """מחיקת שורות כפולות (משאיר את הראשונה) לפני יצירת אינדקס ייחודי
+    שורות עם NULL באחת העמודות אינן כפולות - אינדקס ייחודי מרשה כמה NULL (למשל attendance.update_id).
+    שורות בטבלאות אחרות שמפנות לכפילות (למשל task_completions.task_id) מועברות קודם לשורה שנשארת"""
+    cols = ", ".join(columns)
+    not_null = " AND ".join(f"{c} IS NOT NULL" for c in columns)
+    duplicates = (f"SELECT id FROM {table_name} WHERE {not_null} AND id NOT IN "
+                  f"(SELECT MIN(id) FROM {table_name} GROUP BY {cols})")
+
+    same_key = " AND ".join(f"keep.{c} = dup.{c}" for c in columns)
+    for child, column in _referencing_columns(conn, table_name):
+        result = conn.execute(text(
+            f"UPDATE {child} SET {column} = (SELECT MIN(keep.id) FROM {table_name} keep "
+            f"JOIN {table_name} dup ON {same_key} WHERE dup.id = {child}.{column}) "
+            f"WHERE {column} IN ({duplicates})"
+        ))
+        if result.rowcount:
+            logger.warning(f"⚠️ {result.rowcount} שורות ב-{child}.{column} הועברו מכפילויות ב-{table_name} ({cols})")
+
+    result = conn.execute(text(f"DELETE FROM {table_name} WHERE id IN ({duplicates})"))
+    if result.rowcount:
+        logger.warning(f"⚠️ נמחקו {result.rowcount} שורות כפולות מ-{table_name} ({cols})")
+
+def _referencing_columns(conn, table_name):
+    """(טבלה, עמודה) של המפתחות הזרים במודלים שמפנים ל-id של הטבלה - בטבלאות שקיימות במסד"""
+    from .models import Base
+
+    existing = set(inspect(conn).get_table_names())
+    return [
+        (table.name, fk.parent.name)
+        for table in Base.metadata.sorted_tables if table.name in existing and table.name != table_name
+        for fk in table.foreign_keys
+        if fk.column.table.name == table_name and fk.column.name == 'id'
+    ]
+
+# ========== בנייה מחדש של טבלה ב-SQLite ==========
+
+def rebuild_sqlite_table(engine, table_name):
+    """בנייה מחדש של טבלה לפי המודל (https://www.sqlite.org/lang_altertable.html#otheralter):
+    טבלה חדשה, העתקת העמודות המשותפות, מחיקת הישנה ושינוי שם - ואז האינדקסים וה-triggers מחדש"""
+    from .models import Base
+
+    model_table = Base.metadata.tables[table_name]
+    temp_name = f"_rebuild_{table_name}"
+    with engine.begin() as conn:
+        if not inspect(conn).has_table(table_name):
+            return False
+        existing_columns = {c['name'] for c in inspect(conn).get_columns(table_name)}
+        common = ", ".join(c.name for c in model_table.columns if c.name in existing_columns)
+        triggers = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = :table AND sql IS NOT NULL"
+        ), {'table': table_name}).scalars().all()
+
+        # עותק של הטבלה בלי האינדקסים - שמות האינדקסים תפוסים עד שהטבלה הישנה נמחקת
+        # (שאר הטבלאות מועתקות רק כדי שמפתחות זרים אליהן ייפתרו)
+        metadata = MetaData()
+        for table in Base.metadata.sorted_tables:
+            table.to_metadata(metadata)
+        temp_table = model_table.to_metadata(metadata, name=temp_name)
+        temp_table.indexes.clear()
+        conn.execute(text(f"DROP TABLE IF EXISTS {temp_name}"))
+        temp_table.create(conn)
+        conn.execute(text(f"INSERT INTO {temp_name} ({common}) SELECT {common} FROM {table_name}"))
+        conn.execute(text(f"DROP TABLE {table_name}"))
+        conn.execute(text(f"ALTER TABLE {temp_name} RENAME TO {table_name}"))
+
+        for index in model_table.indexes:
+            index.create(conn)
+        for trigger in triggers:
+            conn.execute(text(trigger))
+    logger.info(f"✅ טבלה נבנתה מחדש: {table_name}")
+    return True
@@ -4,20 +4,46 @@
 גרסה מעודכנת ופשוטה
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Date, DateTime, Boolean, BigInteger, ForeignKey, JSON, Enum, Text, Float
+from sqlalchemy import Column, Integer, String, Date, DateTime, Boolean, BigInteger, ForeignKey, JSON, Enum, Text, Float, Index
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
 from datetime import datetime, date
 import os
 import enum
 
-# יצירת מסד נתונים SQLite
-DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'attendance.db')
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+import threading
 
-engine = create_engine(f'sqlite:///{DB_PATH}', echo=False)
-Session = sessionmaker(bind=engine)
+from .engine import DEFAULT_DB_PATH as DB_PATH, create_db_engine
+
+_engine_lock = threading.Lock()
+
+class LazySessionmaker(sessionmaker):
+    """sessionmaker שיוצר את המנוע רק בסשן הראשון - יבוא המודלים לא פותח חיבור ולא יוצר את data/"""
+
+    def __call__(self, **local_kw):
+        if self.kw.get('bind') is None and 'bind' not in local_kw:
+            get_engine()
+        return super().__call__(**local_kw)
+
+Session = LazySessionmaker()
 Base = declarative_base()
 
+def get_engine():
+    """המנוע של Session - נוצר בקריאה הראשונה לפי DATABASE_URL (ברירת מחדל: SQLite מקומי)"""
+    engine = Session.kw.get('bind')
+    if engine is None:
+        with _engine_lock:
+            engine = Session.kw.get('bind')
+            if engine is None:
+                engine = create_db_engine()
+                Session.configure(bind=engine)
+    return engine
+
+def __getattr__(name):
+    # תאימות לאחור - models.engine יוצר את המנוע רק כשניגשים אליו
+    if name == 'engine':
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 # ===================== ENUMS =====================
 
 class TaskFrequency(enum.Enum):
@@ -45,13 +71,19 @@ class TaskStatus(enum.Enum):
 class User(Base):
     """מודל משתמש"""
     __tablename__ = 'users'
+    __table_args__ = (
+        Index('ix_users_level_experience', 'level', 'experience'),
+        # דפדוף ברשימת המשתמשים (keyset) לפי תאריך הרשמה או לפי טוקנים
+        Index('ix_users_created_at_id', 'created_at', 'id'),
+        Index('ix_users_tokens_id', 'tokens', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     telegram_id = Column(BigInteger, unique=True, nullable=False)
     username = Column(String(100))
     first_name = Column(String(100))
     last_name = Column(String(100))
-    tokens = Column(Integer, default=0)
+    tokens = Column(Integer, default=0, index=True)
     created_at = Column(DateTime, default=datetime.now)
     last_checkin = Column(Date)
     level = Column(Integer, default=1)
@@ -61,6 +93,8 @@ class User(Base):
     total_referrals = Column(Integer, default=0)
     referral_tokens = Column(Integer, default=0)
     total_experience = Column(Integer, default=0)
+    current_streak = Column(Integer, default=0, index=True)
+    longest_streak = Column(Integer, default=0)
     
     # יחסים
     attendances = relationship("Attendance", back_populates="user", cascade="all, delete-orphan")
@@ -72,12 +106,17 @@ class User(Base):
 class Attendance(Base):
     """מודל נוכחות"""
     __tablename__ = 'attendance'
+    __table_args__ = (
+        Index('uq_attendance_user_date', 'telegram_id', 'date', unique=True),
+        Index('uq_attendance_update_id', 'update_id', unique=True),
+    )
     
     id = Column(Integer, primary_key=True)
     telegram_id = Column(BigInteger, ForeignKey('users.telegram_id'), nullable=False)
-    date = Column(Date, nullable=False)
+    date = Column(Date, nullable=False, index=True)
     checkin_time = Column(DateTime, default=datetime.now)
     tokens_earned = Column(Integer, default=1)
+    update_id = Column(BigInteger)  # העדכון של טלגרם שיצר את הרשומה (למניעת כפילות)
     
     # יחסים
     user = relationship("User", back_populates="attendances")
@@ -88,6 +127,10 @@ class Attendance(Base):
 class Task(Base):
     """מודל משימה"""
     __tablename__ = 'tasks'
+    __table_args__ = (
+        # משימות ברירת המחדל נזרעות לפי השם (ON CONFLICT DO NOTHING)
+        Index('uq_tasks_name', 'name', unique=True),
+    )
     
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
@@ -110,6 +153,10 @@ class Task(Base):
 class TaskCompletion(Base):
     """מודל השלמת משימה"""
     __tablename__ = 'task_completions'
+    __table_args__ = (
+        Index('ix_task_completions_user_task_completed', 'telegram_id', 'task_id', 'completed_at'),
+        Index('ix_task_completions_status_completed', 'status', 'completed_at'),
+    )
     
     id = Column(Integer, primary_key=True)
     telegram_id = Column(BigInteger, ForeignKey('users.telegram_id'), nullable=False)
@@ -129,15 +176,20 @@ class TaskCompletion(Base):
         return f"<TaskCompletion user:{self.telegram_id} task:{self.task_id}>"
 
 class UserDailyStats(Base):
-    """סטטיסטיקות יומיות של משתמש"""
+    """סטטיסטיקות יומיות של משתמש - שורה לכל משתמש ויום, מתעדכנת בטרנזקציה של כל פעולה שמזכה אותו"""
     __tablename__ = 'user_daily_stats'
+    __table_args__ = (
+        Index('uq_user_daily_stats_user_date', 'telegram_id', 'date', unique=True),
+    )
     
     id = Column(Integer, primary_key=True)
     telegram_id = Column(BigInteger, ForeignKey('users.telegram_id'), nullable=False)
     date = Column(Date, nullable=False, default=date.today)
+    checkins = Column(Integer, default=0)
     tasks_completed = Column(Integer, default=0)
-    tokens_earned = Column(Integer, default=0)
-    streak_days = Column(Integer, default=0)
+    referrals = Column(Integer, default=0)
+    tokens_earned = Column(Integer, default=0)  # כל הטוקנים שנוספו באותו יום (כולל בונוסים והענקות)
+    streak_days = Column(Integer, default=0)  # רצף הצ'ק-אין בתוקף בסוף הפעולה האחרונה של היום
     
     # יחסים
     user = relationship("User")
@@ -145,12 +197,27 @@ class UserDailyStats(Base):
     def __repr__(self):
         return f"<UserDailyStats {self.telegram_id} on {self.date}>"
 
+class DailyRollup(Base):
+    """מדדי מערכת לכל יום - מתעדכנים בכל כתיבה, כך שהדשבורד לא סורק את ההיסטוריה"""
+    __tablename__ = 'daily_rollups'
+    
+    date = Column(Date, primary_key=True)
+    checkins = Column(Integer, default=0, nullable=False)
+    new_users = Column(Integer, default=0, nullable=False)
+    tasks_completed = Column(Integer, default=0, nullable=False)
+    new_referrals = Column(Integer, default=0, nullable=False)
+    tokens_minted = Column(Integer, default=0, nullable=False)
+    active_users = Column(Integer, default=0, nullable=False)  # משתמשים שונים עם צ'ק-אין או משימה
+    
+    def __repr__(self):
+        return f"<DailyRollup {self.date} checkins:{self.checkins} active:{self.active_users}>"
+
 class Referral(Base):
     """מודל הפניות"""
     __tablename__ = 'referrals'
     
     id = Column(Integer, primary_key=True)
-    referrer_id = Column(BigInteger, nullable=False)
+    referrer_id = Column(BigInteger, nullable=False, index=True)
     referred_id = Column(BigInteger, unique=True, nullable=False)
     referral_code = Column(String(20), nullable=False)
     created_at = Column(DateTime, default=datetime.now)
@@ -159,10 +226,116 @@ class Referral(Base):
     def __repr__(self):
         return f"<Referral {self.referrer_id} -> {self.referred_id}>"
 
+class TokenLedger(Base):
+    """יומן טוקנים - רשומה לכל שינוי ביתרה (רק הוספה, בלי עדכון או מחיקה)"""
+    __tablename__ = 'token_ledger'
+    __table_args__ = (
+        Index('ix_token_ledger_user_id', 'telegram_id', 'id'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    telegram_id = Column(BigInteger, nullable=False)
+    amount = Column(Integer, nullable=False)
+    balance_after = Column(Integer, nullable=False)  # יתרת המשתמש אחרי הרשומה
+    source = Column(String(30), nullable=False)  # checkin / task / level_up / registration / referral / admin ...
+    reference = Column(String(64))  # מזהה הפעולה שיצרה את הרשומה (השלמת משימה, תאריך צ'ק-אין, מזמין)
+    reason = Column(String(200))
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+    
+    def __repr__(self):
+        return f"<TokenLedger {self.telegram_id} {self.amount:+d} ({self.source}) -> {self.balance_after}>"
+
+class BroadcastJob(Base):
+    """שידור הודעה לכל המשתמשים - נשמר כדי שאפשר יהיה להמשיך אחרי הפעלה מחדש"""
+    __tablename__ = 'broadcast_jobs'
+    
+    id = Column(Integer, primary_key=True)
+    text = Column(Text, nullable=False)
+    created_by = Column(BigInteger, nullable=False)
+    # ההודעה אצל האדמין שמתעדכנת בהתקדמות השידור
+    status_chat_id = Column(BigInteger)
+    status_message_id = Column(BigInteger)
+    status = Column(String(20), default='pending', nullable=False, index=True)  # pending / running / completed / cancelled
+    total = Column(Integer, default=0)
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    # התהליך שמריץ את השידור כרגע, ומתי חידש את החזקתו לאחרונה
+    owner = Column(String(64))
+    heartbeat_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.now)
+    finished_at = Column(DateTime)
+    
+    def __repr__(self):
+        return f"<BroadcastJob {self.id} {self.status} {self.sent}/{self.total}>"
+
+class BroadcastDelivery(Base):
+    """מצב המסירה של שידור לנמען אחד"""
+    __tablename__ = 'broadcast_deliveries'
+    __table_args__ = (
+        Index('uq_broadcast_deliveries_job_user', 'job_id', 'telegram_id', unique=True),
+        Index('ix_broadcast_deliveries_job_status', 'job_id', 'status', 'id'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey('broadcast_jobs.id'), nullable=False)
+    telegram_id = Column(BigInteger, nullable=False)
+    status = Column(String(20), default='pending', nullable=False)  # pending / sent / failed
+    attempts = Column(Integer, default=0)
+    error = Column(String(200))
+    sent_at = Column(DateTime)
+    
+    def __repr__(self):
+        return f"<BroadcastDelivery {self.job_id} -> {self.telegram_id} {self.status}>"
+
+class ProcessedUpdate(Base):
+    """עדכוני webhook שכבר התקבלו - למניעת טיפול כפול כשטלגרם שולח עדכון שוב"""
+    __tablename__ = 'processed_updates'
+    
+    update_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    received_at = Column(DateTime, default=datetime.now, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f"<ProcessedUpdate {self.update_id}>"
+
+class ScheduledJobRun(Base):
+    """הרצות של המשימות המתוזמנות - שורה לכל משימה ויום, כך שרק תהליך אחד מריץ כל משימה"""
+    __tablename__ = 'scheduled_job_runs'
+    
+    name = Column(String(50), primary_key=True)
+    run_date = Column(Date, primary_key=True)
+    owner = Column(String(100), nullable=False)
+    started_at = Column(DateTime, default=datetime.now, nullable=False)
+    
+    def __repr__(self):
+        return f"<ScheduledJobRun {self.name} {self.run_date} {self.owner}>"
+
+class SchemaVersion(Base):
+    """גרסת האתחול של המסד (טבלאות, עמודות ונתוני ברירת מחדל) - שורה לכל רכיב"""
+    __tablename__ = 'schema_version'
+    
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, nullable=False)
+    
+    def __repr__(self):
+        return f"<SchemaVersion {self.name}={self.version}>"
+
+class SchemaMigration(Base):
+    """מיגרציות הסכמה שכבר רצו (database/migrations.py) - עם checksum של השלבים"""
+    __tablename__ = 'schema_migrations'
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(100), nullable=False)
+    checksum = Column(String(64), nullable=False)
+    applied_at = Column(DateTime, default=datetime.now, nullable=False)
+    
+    def __repr__(self):
+        return f"<SchemaMigration {self.id:04d} {self.name}>"
+
 # יצירת הטבלאות
 def create_tables():
     """יצירת כל הטבלאות במסד הנתונים"""
-    Base.metadata.create_all(engine)
+    Base.metadata.create_all(get_engine())
     print("✅ טבלאות נוצרו בהצלחה")
 
 if __name__ == "__main__":
@@ -5,171 +5,296 @@
 """
 
 import logging
-from .models import Session, User, Attendance, Task, TaskCompletion, UserDailyStats, Referral
+from .models import Session, User, Attendance, Task, TaskCompletion, UserDailyStats, Referral, ProcessedUpdate
+from .models import ScheduledJobRun
+from .models import BroadcastJob, BroadcastDelivery, DailyRollup, TokenLedger, SchemaVersion
 from .models import TaskStatus, TaskFrequency, TaskType
 from datetime import datetime, date, timedelta
 import random
 import string
-from sqlalchemy import func, desc, and_, or_
+from contextlib import contextmanager
+from sqlalchemy import func, desc, and_, or_, case, update, insert, select, literal, event, text, Integer, String
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import object_session
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.exc import SQLAlchemyError
+from .cache import cached
+from .unit_of_work import open_session, write_session, invalidate_after_commit
+from .search import search_user_ids
+from .levels import MAX_LEVEL, level_for_experience, next_level_experience, levels_for_experience
 
 logger = logging.getLogger(__name__)
 
+# מרחבי שמות במטמון - כל כותב מבטל את המרחבים שהנתונים שלהם השתנו
+STATS_CACHE = 'system_stats'
+TODAY_CACHE = 'today_stats'
+STREAK_CACHE = 'streak_stats'
+LEADERBOARD_CACHE = 'leaderboard'
+
+# זמני תפוגה (שניות)
+STATS_CACHE_TTL = 30
+LEADERBOARD_CACHE_TTL = 30
+
 # ========== פונקציות עזר ==========
 
-def generate_referral_code(length=8):
-    """יצירת קוד הפניה ייחודי עם בדיקת כפילויות"""
+def _random_referral_code(length=8):
     chars = string.ascii_uppercase + string.digits
-    while True:
-        code = ''.join(random.choice(chars) for _ in range(length))
-        # בדוק אם הקוד כבר קיים
-        session = Session()
-        try:
+    return ''.join(random.choice(chars) for _ in range(length))
+
+def generate_referral_code(length=8, session=None):
+    """יצירת קוד הפניה ייחודי עם בדיקת כפילויות
+    כאשר נקרא מתוך פונקציה עם סשן פתוח - מעבירים אותו כדי לא לפתוח חיבור נוסף"""
+    owns_session = session is None
+    if owns_session:
+        session = open_session()
+    try:
+        while True:
+            code = _random_referral_code(length)
+            # בדוק אם הקוד כבר קיים
             existing = session.query(User).filter_by(referral_code=code).first()
             if not existing:
                 return code
-        finally:
+    finally:
+        if owns_session:
             session.close()
 
+def _insert(session, model):
+    """INSERT בניב של מסד הנתונים הפעיל (סשן או חיבור) - לשימוש ב-on_conflict_do_nothing/do_update"""
+    bind = session if isinstance(session, Connection) else session.get_bind()
+    if bind.dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+def _load_user(session, telegram_id):
+    """טעינת משתמש לפי מזהה טלגרם - נטען פעם אחת לכל סשן (ולכן לכל יחידת עבודה)"""
+    users = session.info.setdefault('users', {})
+    user = users.get(telegram_id)
+    if user is None:
+        user = session.query(User).filter_by(telegram_id=telegram_id).first()
+        if user is not None:
+            users[telegram_id] = user
+    return user
+
 # ========== פונקציות אתחול ==========
 
-def init_database():
-    """אתחול מסד הנתונים עם נתונים ראשוניים"""
-    from .models import Base, engine
-    
+# גרסת נתוני ברירת המחדל - להעלות בכל שינוי בהם (שינויי סכמה נכנסים כמיגרציה ב-migrations.MIGRATIONS)
+BOOTSTRAP_VERSION = 1
+BOOTSTRAP_KEY = 'bootstrap'
+# מזהה נעילת האתחול ב-PostgreSQL (pg_advisory_lock) - worker אחד מאתחל והשאר ממתינים
+BOOTSTRAP_LOCK_ID = 7_260_001
+
+DEMO_TELEGRAM_ID = 123456789
+DEMO_EXPERIENCE = 150
+
+# משימות ברירת מחדל
+DEFAULT_TASKS = [
+    {
+        "name": "צ'ק-אין יומי",
+        "description": "התחבר כל יום וקבל טוקן",
+        "task_type": TaskType.CLASS,
+        "frequency": TaskFrequency.DAILY,
+        "tokens_reward": 1,
+        "exp_reward": 10,
+        "is_active": True
+    },
+    {
+        "name": "תרומה לפורום",
+        "description": "פרסם תשובה או שאלה בפורום הקורס",
+        "task_type": TaskType.FORUM,
+        "frequency": TaskFrequency.DAILY,
+        "tokens_reward": 3,
+        "exp_reward": 25,
+        "requires_proof": True,
+        "is_active": True
+    },
+    {
+        "name": "סיוע לתלמיד",
+        "description": "עזור לתלמיד אחר בשאלה או בעיה",
+        "task_type": TaskType.HELP,
+        "frequency": TaskFrequency.DAILY,
+        "tokens_reward": 5,
+        "exp_reward": 50,
+        "requires_proof": True,
+        "is_active": True
+    },
+    {
+        "name": "הפניה של חבר",
+        "description": "הזמן חבר חדש למערכת",
+        "task_type": TaskType.REFERRAL,
+        "frequency": TaskFrequency.ONE_TIME,
+        "tokens_reward": 10,
+        "exp_reward": 100,
+        "is_active": True
+    },
+    {
+        "name": "השתתפות בשיעור",
+        "description": "השתתף בשיעור הקבוצתי",
+        "task_type": TaskType.CLASS,
+        "frequency": TaskFrequency.WEEKLY,
+        "tokens_reward": 15,
+        "exp_reward": 75,
+        "is_active": True
+    },
+    {
+        "name": "משימת אתגר שבועי",
+        "description": "השלם את האתגר השבועי",
+        "task_type": TaskType.QUIZ,
+        "frequency": TaskFrequency.WEEKLY,
+        "tokens_reward": 25,
+        "exp_reward": 150,
+        "requires_proof": True,
+        "is_active": True
+    }
+]
+
+def get_bootstrap_version(engine=None):
+    """גרסת האתחול שרשומה במסד - 0 למסד ריק או למסד שאותחל לפני שנרשמו גרסאות"""
+    from .models import get_engine
+    engine = engine or get_engine()
     try:
-        Base.metadata.create_all(engine)
-        logger.info("✅ טבלאות נוצרו בהצלחה")
-        
-        session = Session()
+        with engine.connect() as conn:
+            return _read_bootstrap_version(conn)
+    except SQLAlchemyError:
+        # אין עדיין טבלת schema_version
+        return 0
+
+def _read_bootstrap_version(conn):
+    return conn.execute(
+        select(SchemaVersion.version).where(SchemaVersion.name == BOOTSTRAP_KEY)
+    ).scalar() or 0
+
+def is_database_current(engine=None):
+    """המסד בגרסת האתחול הנוכחית וכל המיגרציות רצו - שתי שאילתות על חיבור אחד"""
+    from .models import get_engine
+    from .migrations import LATEST_MIGRATION, get_latest_applied_migration
+    engine = engine or get_engine()
+    try:
+        with engine.connect() as conn:
+            return (_read_bootstrap_version(conn) >= BOOTSTRAP_VERSION
+                    and get_latest_applied_migration(conn) >= LATEST_MIGRATION)
+    except SQLAlchemyError:
+        # אין עדיין טבלאות גרסה
+        return False
+
+@contextmanager
+def _bootstrap_lock(engine):
+    """נעילה בין תהליכים לכל משך האתחול - ב-PostgreSQL נעילת advisory על חיבור נפרד;
+    ב-SQLite כל שלב רץ ממילא בטרנזקציית כתיבה (write_engine) שתופסת את נעילת הכתיבה"""
+    if engine.dialect.name != 'postgresql':
+        yield
+        return
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {'id': BOOTSTRAP_LOCK_ID})
+        conn.commit()
         try:
-            # משימות ברירת מחדל
-            default_tasks = [
-                {
-                    "name": "צ'ק-אין יומי",
-                    "description": "התחבר כל יום וקבל טוקן",
-                    "task_type": TaskType.CLASS,
-                    "frequency": TaskFrequency.DAILY,
-                    "tokens_reward": 1,
-                    "exp_reward": 10,
-                    "is_active": True
-                },
-                {
-                    "name": "תרומה לפורום",
-                    "description": "פרסם תשובה או שאלה בפורום הקורס",
-                    "task_type": TaskType.FORUM,
-                    "frequency": TaskFrequency.DAILY,
-                    "tokens_reward": 3,
-                    "exp_reward": 25,
-                    "requires_proof": True,
-                    "is_active": True
-                },
-                {
-                    "name": "סיוע לתלמיד",
-                    "description": "עזור לתלמיד אחר בשאלה או בעיה",
-                    "task_type": TaskType.HELP,
-                    "frequency": TaskFrequency.DAILY,
-                    "tokens_reward": 5,
-                    "exp_reward": 50,
-                    "requires_proof": True,
-                    "is_active": True
-                },
-                {
-                    "name": "הפניה של חבר",
-                    "description": "הזמן חבר חדש למערכת",
-                    "task_type": TaskType.REFERRAL,
-                    "frequency": TaskFrequency.ONE_TIME,
-                    "tokens_reward": 10,
-                    "exp_reward": 100,
-                    "is_active": True
-                },
-                {
-                    "name": "השתתפות בשיעור",
-                    "description": "השתתף בשיעור הקבוצתי",
-                    "task_type": TaskType.CLASS,
-                    "frequency": TaskFrequency.WEEKLY,
-                    "tokens_reward": 15,
-                    "exp_reward": 75,
-                    "is_active": True
-                },
-                {
-                    "name": "משימת אתגר שבועי",
-                    "description": "השלם את האתגר השבועי",
-                    "task_type": TaskType.QUIZ,
-                    "frequency": TaskFrequency.WEEKLY,
-                    "tokens_reward": 25,
-                    "exp_reward": 150,
-                    "requires_proof": True,
-                    "is_active": True
-                }
-            ]
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {'id': BOOTSTRAP_LOCK_ID})
+            conn.commit()
+
+def init_database(force=False):
+    """אתחול מסד הנתונים לגרסת האתחול הנוכחית - טבלאות, מיגרציות ונתונים ראשוניים
+    
+    כשהמסד כבר בגרסה הנוכחית וכל המיגרציות רצו לא נעשה דבר מלבד קריאת הגרסאות.
+    מחזיר True אם בוצע אתחול, False אם המסד כבר היה מעודכן."""
+    from .models import Base, get_engine
+    from .migrations import upgrade_schema
+    from .engine import write_engine
+    
+    engine = get_engine()
+    if not force and is_database_current(engine):
+        return False
+    writer = write_engine(engine)
+    
+    try:
+        with _bootstrap_lock(engine):
+            # worker אחר אולי סיים בזמן שחיכינו לנעילה
+            if not force and is_database_current(engine):
+                return False
             
-            for task_data in default_tasks:
-                existing_task = session.query(Task).filter_by(name=task_data["name"]).first()
-                if not existing_task:
-                    task = Task(**task_data)
-                    session.add(task)
-                    logger.info(f"✅ משימה נוצרה: {task_data['name']}")
+            with writer.begin() as conn:
+                Base.metadata.create_all(conn)
+            logger.info("✅ טבלאות נוצרו בהצלחה")
             
-            session.commit()
-            logger.info("✅ מסד הנתונים אותחל בהצלחה עם משימות ברירת מחדל")
+            upgrade_schema(writer)
             
-            # הוספת משתמש דמו אם אין משתמשים
-            user_count = session.query(User).count()
-            if user_count == 0:
-                demo_user = User(
-                    telegram_id=123456789,
-                    username="demo_user",
-                    first_name="משתמש",
-                    last_name="דמו",
-                    tokens=100,
-                    level=3,
-                    experience=150,
-                    next_level_exp=200,
-                    referral_code=generate_referral_code(),
-                    total_referrals=2,
-                    referral_tokens=20
-                )
-                session.add(demo_user)
-                
-                # הוספת צ'ק-אין לדמו
-                for i in range(5):
-                    checkin_date = date.today() - timedelta(days=i)
-                    attendance = Attendance(
-                        telegram_id=123456789,
-                        date=checkin_date,
-                        tokens_earned=1
+            # נתוני ברירת המחדל ושורת הגרסה - טרנזקציה אחת
+            demo_added = False
+            with writer.begin() as conn:
+                if force or _read_bootstrap_version(conn) < BOOTSTRAP_VERSION:
+                    demo_added = _seed_defaults(conn)
+                conn.execute(
+                    _insert(conn, SchemaVersion)
+                    .values(name=BOOTSTRAP_KEY, version=BOOTSTRAP_VERSION, updated_at=datetime.now())
+                    .on_conflict_do_update(
+                        index_elements=[SchemaVersion.name],
+                        set_={'version': BOOTSTRAP_VERSION, 'updated_at': datetime.now()}
                     )
-                    session.add(attendance)
-                
-                session.commit()
-                logger.info("✅ משתמש דמו נוסף עם היסטוריית צ'ק-אין")
-                
-        except Exception as e:
-            session.rollback()
-            logger.error(f"❌ שגיאה באתחול משימות: {e}")
-            raise
-        finally:
-            session.close()
+                )
             
+            if demo_added:
+                # הימים של משתמש הדמו בסטטיסטיקות היומיות ובמדדים היומיים, ויתרת הפתיחה שלו ביומן
+                backfill_user_daily_stats()
+                backfill_daily_rollups()
+                reconcile_token_ledger(fix=True)
     except Exception as e:
-        logger.error(f"❌ שגיאה ביצירת טבלאות: {e}")
+        logger.error(f"❌ שגיאה באתחול מסד הנתונים: {e}")
         raise
+    
+    logger.info(f"✅ מסד הנתונים אותחל לגרסה {BOOTSTRAP_VERSION}")
+    return True
+
+def _seed_defaults(conn):
+    """משימות ברירת המחדל, ומשתמש דמו עם היסטוריית צ'ק-אין כשאין משתמשים - מחזיר True אם הדמו נוסף"""
+    # executemany דורש את אותן עמודות בכל השורות
+    rows = [{'requires_proof': False, **task} for task in DEFAULT_TASKS]
+    tasks = conn.execute(_insert(conn, Task).on_conflict_do_nothing(), rows)
+    if tasks.rowcount > 0:
+        logger.info(f"✅ {tasks.rowcount} משימות ברירת מחדל נוצרו")
+    
+    if conn.execute(select(User.id).limit(1)).first() is not None:
+        return False
+    
+    today = date.today()
+    demo_level = level_for_experience(DEMO_EXPERIENCE)
+    conn.execute(_insert(conn, User).on_conflict_do_nothing().values(
+        telegram_id=DEMO_TELEGRAM_ID,
+        username="demo_user",
+        first_name="משתמש",
+        last_name="דמו",
+        tokens=100,
+        level=demo_level,
+        experience=DEMO_EXPERIENCE,
+        next_level_exp=next_level_experience(demo_level),
+        # הטבלה ריקה - כל קוד ייחודי
+        referral_code=_random_referral_code(),
+        total_referrals=2,
+        referral_tokens=20,
+        last_checkin=today,
+        current_streak=5,
+        longest_streak=5
+    ))
+    conn.execute(_insert(conn, Attendance).on_conflict_do_nothing(), [
+        {'telegram_id': DEMO_TELEGRAM_ID, 'date': today - timedelta(days=i), 'tokens_earned': 1}
+        for i in range(5)
+    ])
+    logger.info("✅ משתמש דמו נוסף עם היסטוריית צ'ק-אין")
+    return True
 
 # ========== פונקציות משתמשים ==========
 
 def register_user(telegram_id, username=None, first_name=None, last_name=None, referral_code=None):
     """רישום משתמש חדש עם הפניה"""
-    session = Session()
+    session = write_session()
     try:
-        existing_user = session.query(User).filter_by(telegram_id=telegram_id).first()
+        existing_user = _load_user(session, telegram_id)
         
         if existing_user:
             logger.info(f"ℹ️ משתמש {telegram_id} כבר קיים")
             return False
         
         # יצירת קוד הפניה ייחודי
-        user_referral_code = generate_referral_code()
+        user_referral_code = generate_referral_code(session=session)
         
         user = User(
             telegram_id=telegram_id,
@@ -186,6 +311,7 @@ def register_user(telegram_id, username=None, first_name=None, last_name=None, r
             created_at=datetime.now()
         )
         session.add(user)
+        referred = None
         
         # טיפול בהפניה אם קיים
         if referral_code:
@@ -208,14 +334,25 @@ def register_user(telegram_id, username=None, first_name=None, last_name=None, r
                     session.add(referral)
                     
                     # עדכון המזמין
-                    referrer.total_referrals += 1
-                    referrer.tokens += 10
-                    referrer.referral_tokens += 10
+                    _add_tokens(session, referrer, 10, total_referrals=1, referral_tokens=10)
+                    _log_tokens(session, referrer, 10, 'referral', reference=str(telegram_id))
                     
                     # הודעה למזמין
                     user.tokens += 5  # בונוס למצטרף דרך הפניה
+                    referred = referrer
+        
+        # יומן הטוקנים וסטטיסטיקות היום - בונוס ההרשמה למצטרף, וההפניה והבונוס שלה למזמין
+        _log_tokens(session, user, user.tokens, 'registration',
+                    reference=str(referred.telegram_id) if referred else None)
+        today = date.today()
+        session.flush()
+        _record_activity(session, user, today, tokens=user.tokens)
+        if referred:
+            _record_activity(session, referred, today, tokens=10, referrals=1)
+        _bump_rollup(session, today, new_users=1)
         
         session.commit()
+        invalidate_after_commit(STATS_CACHE, TODAY_CACHE, LEADERBOARD_CACHE)
         logger.info(f"✅ משתמש נרשם: {telegram_id} עם קוד הפניה: {user_referral_code}")
         return True
     except Exception as e:
@@ -225,47 +362,28 @@ def register_user(telegram_id, username=None, first_name=None, last_name=None, r
     finally:
         session.close()
 
-def checkin_user(telegram_id):
-    """צ'ק-אין יומי"""
-    session = Session()
+def checkin_user(telegram_id, update_id=None):
+    """צ'ק-אין יומי - טרנזקציה אחת ואטומית
+    
+    רשומת הנוכחות נכנסת עם INSERT ... ON CONFLICT DO NOTHING על המפתח (משתמש, תאריך),
+    ורק מי שהכניס אותה מזכה את המשתמש - בעדכון בצד השרת (tokens = tokens + :n).
+    update_id של טלגרם נשמר ברשומה, כך שניסיון חוזר של אותו עדכון מחזיר את אותה תוצאה
+    """
+    session = write_session()
     try:
         today = date.today()
         
-        # בדוק אם כבר ביצע צ'ק-אין היום
-        existing_checkin = session.query(Attendance).filter_by(
-            telegram_id=telegram_id,
-            date=today
-        ).first()
-        
-        if existing_checkin:
-            return False, "כבר ביצעת צ'ק-אין היום!"
-        
         # קבל את המשתמש
-        user = session.query(User).filter_by(telegram_id=telegram_id).first()
+        user = _load_user(session, telegram_id)
         if not user:
             return False, "משתמש לא נמצא. שלח /start כדי להירשם"
         
-        # חישוב טוקנים לפי רצף
+        # חישוב הרצף מהעמודה השמורה - ממשיך רק אם הצ'ק-אין הקודם היה אתמול
         yesterday = today - timedelta(days=1)
-        yesterday_checkin = session.query(Attendance).filter_by(
-            telegram_id=telegram_id,
-            date=yesterday
-        ).first()
-        
-        # חשב את הרצף הנוכחי
-        recent_attendances = session.query(Attendance).filter(
-            Attendance.telegram_id == telegram_id,
-            Attendance.date >= today - timedelta(days=30)
-        ).order_by(Attendance.date.desc()).all()
-        
-        streak = 1
-        last_date = today
-        for attendance in recent_attendances:
-            if attendance.date == last_date - timedelta(days=1):
-                streak += 1
-                last_date = attendance.date
-            else:
-                break
+        if user.last_checkin == yesterday:
+            streak = (user.current_streak or 0) + 1
+        else:
+            streak = 1
         
         # חישוב בונוסים
         base_tokens = 1
@@ -280,29 +398,51 @@ def checkin_user(telegram_id):
         level_bonus = user.level // 3  # כל 3 רמות בונוס נוסף
         
         total_tokens = base_tokens + streak_bonus + level_bonus
+        experience = total_tokens * 10
         
-        # יצירת רשומת נוכחות
-        attendance = Attendance(
-            telegram_id=telegram_id,
-            date=today,
-            tokens_earned=total_tokens,
-            checkin_time=datetime.now()
+        # יצירת רשומת נוכחות - רק אם אין כבר אחת להיום
+        inserted = session.execute(
+            _insert(session, Attendance).values(
+                telegram_id=telegram_id,
+                date=today,
+                tokens_earned=total_tokens,
+                checkin_time=datetime.now(),
+                update_id=update_id
+            ).on_conflict_do_nothing()
+        ).rowcount
+        
+        if not inserted:
+            return _repeated_checkin(session, telegram_id, today, update_id)
+        
+        # עדכון המשתמש בצד השרת
+        session.execute(
+            update(User)
+            .where(User.telegram_id == telegram_id)
+            .values(
+                tokens=User.tokens + total_tokens,
+                experience=User.experience + experience,
+                total_experience=func.coalesce(User.total_experience, 0) + experience,
+                last_checkin=today,
+                current_streak=streak,
+                longest_streak=case(
+                    (func.coalesce(User.longest_streak, 0) < streak, streak),
+                    else_=User.longest_streak
+                )
+            )
+            .execution_options(synchronize_session=False)
         )
-        session.add(attendance)
-        
-        # עדכון המשתמש
-        user.tokens += total_tokens
-        user.last_checkin = today
-        user.experience += (total_tokens * 10)
-        user.total_experience += (total_tokens * 10)
+        # השורה נעולה עד סוף הטרנזקציה - אפשר לעבוד על הערכים העדכניים
+        session.refresh(user)
+        _log_tokens(session, user, total_tokens, 'checkin', reference=today.isoformat())
         
         # עדכון רמה אם צריך
-        update_user_level(user)
+        level_up_tokens = _level_up_bonus(user)
         
-        # עדכון סטטיסטיקות יומיות
-        update_daily_stats(telegram_id, today, total_tokens)
+        # עדכון סטטיסטיקות יומיות ומדדי היום באותה טרנזקציה
+        _record_activity(session, user, today, tokens=total_tokens + level_up_tokens, checkins=1)
         
         session.commit()
+        invalidate_after_commit(STATS_CACHE, TODAY_CACHE, STREAK_CACHE, LEADERBOARD_CACHE)
         
         # יצירת הודעה עם פירוט
         message = f"🎉 צ'ק-אין נרשם בהצלחה!\n\n"
@@ -325,61 +465,126 @@ def checkin_user(telegram_id):
     finally:
         session.close()
 
+def _repeated_checkin(session, telegram_id, today, update_id):
+    """תשובה לצ'ק-אין שכבר נרשם היום - הצלחה אם זה ניסיון חוזר של אותו עדכון"""
+    if update_id is not None:
+        attendance = session.query(Attendance).filter_by(
+            telegram_id=telegram_id,
+            date=today,
+            update_id=update_id
+        ).first()
+        if attendance:
+            return True, (
+                f"🎉 צ'ק-אין נרשם בהצלחה!\n\n"
+                f"💰 קיבלת: {attendance.tokens_earned} טוקנים"
+            )
+    return False, "כבר ביצעת צ'ק-אין היום!"
+
 def update_user_level(user):
-    """עדכון רמת המשתמש לפי הניסיון"""
-    # נוסחת רמות מורכבת יותר
-    level_thresholds = [0, 100, 300, 600, 1000, 1500, 2100, 2800, 
-                       3600, 4500, 5500, 6600, 7800, 9100, 10500]
-    
-    new_level = 1
-    for i, threshold in enumerate(level_thresholds[1:], 1):
-        if user.experience >= threshold:
-            new_level = i + 1
-        else:
-            break
+    """עדכון רמת המשתמש לפי הניסיון (עקומת הרמות ב-database/levels.py)"""
+    new_level = level_for_experience(user.experience)
     
     if new_level > user.level:
         user.level = new_level
-        user.next_level_exp = level_thresholds[new_level] if new_level < len(level_thresholds) else level_thresholds[-1] * 1.5
+        user.next_level_exp = next_level_experience(new_level)
         # בונוס עלייה ברמה
-        user.tokens += new_level * 5
+        session = object_session(user)
+        if session is not None:
+            _add_tokens(session, user, new_level * 5)
+            _log_tokens(session, user, new_level * 5, 'level_up', reference=str(new_level))
+        else:
+            user.tokens += new_level * 5
         return True, new_level
     
     return False, user.level
 
-def update_daily_stats(telegram_id, date, tokens_earned):
-    """עדכון סטטיסטיקות יומיות"""
-    session = Session()
+def _level_up_bonus(user):
+    """update_user_level - מחזיר את טוקני הבונוס שנוספו בעלייה ברמה (למדדי היום)"""
+    tokens_before = user.tokens
+    update_user_level(user)
+    return user.tokens - tokens_before
+
+def _add_tokens(session, user, amount, **counters):
+    """שינוי יתרה בצד השרת (tokens = tokens + :n, וכך גם מוני counters של המשתמש) ורענון
+    הערכים במשתמש - בניגוד ל-user.tokens += n, לא דורס שינוי מקביל באותה שורה"""
+    # שינויים ממתינים במשתמש נכתבים לפני ה-UPDATE כדי שהרענון לא ימחק אותם
+    session.flush()
+    values = {
+        name: func.coalesce(getattr(User, name), 0) + delta
+        for name, delta in dict(counters, tokens=amount).items()
+    }
+    session.execute(
+        update(User)
+        .where(User.telegram_id == user.telegram_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    session.refresh(user, list(values))
+
+def update_daily_stats(telegram_id, date, tokens_earned, session=None):
+    """הוספת טוקנים לשורת היום של המשתמש - מחזיר True אם נשמר
+    עם session - העדכון נכנס לטרנזקציה של הקורא, שאחראי ל-commit"""
+    owns_session = session is None
+    if owns_session:
+        session = write_session()
     try:
-        stats = session.query(UserDailyStats).filter_by(
-            telegram_id=telegram_id,
-            date=date
-        ).first()
-        
-        if not stats:
-            stats = UserDailyStats(
-                telegram_id=telegram_id,
-                date=date,
-                tasks_completed=0,
-                tokens_earned=tokens_earned,
-                streak_days=1
-            )
-            session.add(stats)
-        else:
-            stats.tokens_earned += tokens_earned
-        
-        session.commit()
+        user = _load_user(session, telegram_id)
+        if not user:
+            return False
+        _record_activity(session, user, date, tokens=tokens_earned)
+        if owns_session:
+            session.commit()
+            invalidate_after_commit(STATS_CACHE, TODAY_CACHE)
+        return True
     except Exception as e:
+        if not owns_session:
+            raise
         session.rollback()
         logger.error(f"❌ שגיאה בעדכון סטטיסטיקות יומיות: {e}")
+        return False
     finally:
-        session.close()
+        if owns_session:
+            session.close()
+
+def _record_activity(session, user, day, tokens=0, checkins=0, tasks=0, referrals=0):
+    """רישום פעולה בשורת היום של המשתמש ובמדדי היום (ללא commit) - upsert אחד על (משתמש, תאריך)
+    
+    כל פעולה שמזכה את המשתמש עוברת כאן, בטרנזקציה של הפעולה עצמה, כך ש-user_daily_stats
+    הוא המקור לדוחות הפעילות. streak_days הוא הרצף בתוקף אחרי הפעולה (user כבר מעודכן).
+    משתמש נספר כפעיל באותו יום כשיש לו צ'ק-אין או משימה שהושלמה.
+    """
+    streak = effective_streak(user.current_streak, user.last_checkin, day)
+    stmt = _insert(session, UserDailyStats).values(
+        telegram_id=user.telegram_id,
+        date=day,
+        checkins=checkins,
+        tasks_completed=tasks,
+        referrals=referrals,
+        tokens_earned=tokens,
+        streak_days=streak
+    )
+    after_checkins, after_tasks = session.execute(stmt.on_conflict_do_update(
+        index_elements=['telegram_id', 'date'],
+        set_={
+            'checkins': func.coalesce(UserDailyStats.checkins, 0) + stmt.excluded.checkins,
+            'tasks_completed': func.coalesce(UserDailyStats.tasks_completed, 0) + stmt.excluded.tasks_completed,
+            'referrals': func.coalesce(UserDailyStats.referrals, 0) + stmt.excluded.referrals,
+            'tokens_earned': func.coalesce(UserDailyStats.tokens_earned, 0) + stmt.excluded.tokens_earned,
+            'streak_days': stmt.excluded.streak_days
+        }
+    ).returning(UserDailyStats.checkins, UserDailyStats.tasks_completed)).one()
+    
+    # פעיל לפני ואחרי הפעולה - הפרש של 1/-1 במונה הפעילים של היום
+    active_after = (after_checkins + after_tasks) > 0
+    active_before = (after_checkins - checkins + after_tasks - tasks) > 0
+    _bump_rollup(session, day, checkins=checkins, tasks_completed=tasks, new_referrals=referrals,
+                  tokens_minted=tokens, active_users=int(active_after) - int(active_before))
 
 def get_balance(telegram_id):
     """קבלת יתרת טוקנים"""
-    session = Session()
+    session = open_session()
     try:
-        user = session.query(User).filter_by(telegram_id=telegram_id).first()
+        user = _load_user(session, telegram_id)
         return user.tokens if user else 0
     except Exception as e:
         logger.error(f"❌ שגיאה בקבלת יתרה: {e}")
@@ -389,9 +594,9 @@ def get_balance(telegram_id):
 
 def get_user(telegram_id):
     """קבלת משתמש לפי ID"""
-    session = Session()
+    session = open_session()
     try:
-        user = session.query(User).filter_by(telegram_id=telegram_id).first()
+        user = _load_user(session, telegram_id)
         return user
     except Exception as e:
         logger.error(f"❌ שגיאה בקבלת משתמש: {e}")
@@ -401,7 +606,7 @@ def get_user(telegram_id):
 
 def get_all_users(limit=None, offset=0):
     """קבלת כל המשתמשים"""
-    session = Session()
+    session = open_session()
     try:
         query = session.query(User).order_by(desc(User.created_at))
         if limit:
@@ -414,16 +619,96 @@ def get_all_users(limit=None, offset=0):
     finally:
         session.close()
 
+# גודל מנה בסריקת כל המשתמשים
+USER_STREAM_BATCH_SIZE = 1000
+
+def count_users():
+    """מספר המשתמשים הרשומים"""
+    session = open_session()
+    try:
+        return session.query(func.count(User.id)).scalar() or 0
+    finally:
+        session.close()
+
+def get_users_page(after_id=0, limit=USER_STREAM_BATCH_SIZE, columns=('telegram_id',)):
+    """מנה של משתמשים לפי סדר id (keyset, אחרי after_id) - רק העמודות המבוקשות, בלי אובייקטי ORM"""
+    session = open_session()
+    try:
+        fields = [User.id] + [getattr(User, column) for column in columns if column != 'id']
+        return session.query(*fields).filter(User.id > after_id).order_by(User.id).limit(limit).all()
+    finally:
+        session.close()
+
+def iter_users(columns=('telegram_id',), batch_size=USER_STREAM_BATCH_SIZE):
+    """מעבר על כל המשתמשים מנה אחר מנה - הזיכרון לא תלוי במספר המשתמשים.
+    כל מנה היא שאילתה קצרה משלה (ולא yield_per על טרנזקציה אחת), כדי לא להחזיק
+    טרנזקציה - וב-SQLite את נעילת הכתיבה - לאורך כל הסריקה"""
+    after_id = 0
+    while True:
+        page = get_users_page(after_id, batch_size, columns)
+        if not page:
+            return
+        yield from page
+        after_id = page[-1].id
+
+def recompute_user_levels(batch_size=USER_STREAM_BATCH_SIZE):
+    """חישוב מחדש של הרמה והניסיון לרמה הבאה לכל המשתמשים - אחרי שינוי בעקומת הרמות
+    
+    המשתמשים נסרקים במנות לפי id, כל מנה בטרנזקציה קצרה משלה. הרמות של המנה מחושבות יחד
+    (levels_for_experience) ורק השורות שהשתנו נכתבות, ב-UPDATE אחד (executemany).
+    טוקנים לא מוענקים ולא נלקחים, ורמה יכולה גם לרדת אם הסף שלה עלה.
+    מחזיר {'users', 'changed', 'error'} - error הוא None אם כל המנות נכתבו, ואחרת הודעת השגיאה
+    (המנות שלפני השגיאה כבר נשמרו והרצה חוזרת ממשיכה מהן).
+    """
+    result = {'users': 0, 'changed': 0, 'error': None}
+    after_id = 0
+    try:
+        while True:
+            session = write_session()
+            try:
+                users = session.query(User.id, User.experience, User.level, User.next_level_exp).filter(
+                    User.id > after_id
+                ).order_by(User.id).limit(batch_size).all()
+                if not users:
+                    break
+                after_id = users[-1].id
+                
+                changes = []
+                for user, level in zip(users, levels_for_experience(row.experience for row in users)):
+                    next_exp = next_level_experience(level)
+                    if user.level != level or user.next_level_exp != next_exp:
+                        changes.append({'id': user.id, 'level': level, 'next_level_exp': next_exp})
+                
+                if changes:
+                    session.execute(update(User), changes)
+                session.commit()
+                result['users'] += len(users)
+                result['changed'] += len(changes)
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+    except Exception as e:
+        result['error'] = str(e)
+        logger.error(f"❌ שגיאה בחישוב הרמות מחדש אחרי {result['users']} משתמשים: {e}")
+    
+    if result['changed']:
+        invalidate_after_commit(STATS_CACHE, LEADERBOARD_CACHE)
+    if result['error'] is None:
+        logger.info(f"✅ רמות חושבו מחדש: {result['changed']} מתוך {result['users']} משתמשים עודכנו")
+    return result
+
 def get_user_level_info(telegram_id):
     """קבלת מידע על רמת המשתמש"""
-    session = Session()
+    session = open_session()
     try:
-        user = session.query(User).filter_by(telegram_id=telegram_id).first()
+        user = _load_user(session, telegram_id)
         if not user:
             return None
         
         # חישוב דירוג
-        rank = session.query(User).filter(User.tokens > user.tokens).count() + 1
+        rank = _get_rank(session, user)['position']
         
         # חישוב אחוזי התקדמות
         progress_percentage = int((user.experience / user.next_level_exp) * 100) if user.next_level_exp > 0 else 0
@@ -453,9 +738,10 @@ def get_user_level_info(telegram_id):
     finally:
         session.close()
 
+@cached(LEADERBOARD_CACHE, ttl=LEADERBOARD_CACHE_TTL)
 def get_top_users(limit=10, order_by='tokens'):
     """קבלת רשימת המשתמשים המובילים"""
-    session = Session()
+    session = open_session()
     try:
         if order_by == 'tokens':
             users = session.query(User).order_by(desc(User.tokens)).limit(limit).all()
@@ -464,14 +750,12 @@ def get_top_users(limit=10, order_by='tokens'):
         elif order_by == 'referrals':
             users = session.query(User).order_by(desc(User.total_referrals)).limit(limit).all()
         elif order_by == 'streak':
-            # חישוב רצף מורכב יותר
-            users = session.query(User).all()
-            users_with_streak = []
-            for user in users:
-                streak = calculate_user_streak(user.telegram_id)
-                users_with_streak.append((user, streak))
-            users_with_streak.sort(key=lambda x: x[1], reverse=True)
-            users = [u[0] for u in users_with_streak[:limit]]
+            # רק רצפים בתוקף (צ'ק-אין אחרון היום או אתמול)
+            yesterday = date.today() - timedelta(days=1)
+            users = session.query(User).filter(
+                User.current_streak > 0,
+                User.last_checkin >= yesterday
+            ).order_by(desc(User.current_streak)).limit(limit).all()
         else:
             users = session.query(User).order_by(desc(User.tokens)).limit(limit).all()
         
@@ -483,36 +767,98 @@ def get_top_users(limit=10, order_by='tokens'):
         session.close()
 
 def calculate_user_streak(telegram_id):
-    """חישוב רצף צ'ק-אין של משתמש"""
-    session = Session()
+    """רצף צ'ק-אין של משתמש (מהעמודה השמורה)"""
+    session = open_session()
     try:
-        attendances = session.query(Attendance).filter_by(
+        row = session.query(User.current_streak, User.last_checkin).filter_by(
             telegram_id=telegram_id
-        ).order_by(Attendance.date.desc()).all()
+        ).first()
         
-        if not attendances:
+        if not row:
             return 0
         
-        streak = 0
-        current_date = date.today()
+        return effective_streak(row.current_streak, row.last_checkin)
+    except Exception as e:
+        logger.error(f"❌ שגיאה בחישוב רצף: {e}")
+        return 0
+    finally:
+        session.close()
+
+def effective_streak(current_streak, last_checkin, today=None):
+    """רצף בתוקף - רצף שלא חודש מאז אתמול נחשב שבור גם לפני ריצת האיפוס היומית"""
+    today = today or date.today()
+    if not current_streak or not last_checkin:
+        return 0
+    if last_checkin < today - timedelta(days=1):
+        return 0
+    return current_streak
+
+def rollover_streaks(today=None):
+    """איפוס רצפים שנשברו - להרצה פעם ביום אחרי חצות"""
+    session = write_session()
+    try:
+        today = today or date.today()
+        yesterday = today - timedelta(days=1)
         
-        for attendance in attendances:
-            if attendance.date == current_date:
-                streak += 1
-                current_date -= timedelta(days=1)
+        updated = session.query(User).filter(
+            User.current_streak > 0,
+            or_(User.last_checkin == None, User.last_checkin < yesterday)
+        ).update({User.current_streak: 0}, synchronize_session=False)
+        
+        session.commit()
+        invalidate_after_commit(STREAK_CACHE, LEADERBOARD_CACHE)
+        logger.info(f"✅ אופסו {updated} רצפים שנשברו")
+        return updated
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ שגיאה באיפוס רצפים: {e}")
+        return 0
+    finally:
+        session.close()
+
+def backfill_user_streaks():
+    """חישוב רצף נוכחי ורצף מירבי מתוך היסטוריית הנוכחות (למסדי נתונים קיימים)"""
+    session = write_session()
+    try:
+        today = date.today()
+        streaks = {}
+        
+        # מעבר יחיד על כל הנוכחות לפי משתמש ותאריך
+        rows = session.query(Attendance.telegram_id, Attendance.date).order_by(
+            Attendance.telegram_id, Attendance.date
+        ).yield_per(1000)
+        
+        for telegram_id, checkin_date in rows:
+            current, longest, last_date = streaks.get(telegram_id, (0, 0, None))
+            if last_date == checkin_date:
+                continue
+            if last_date and checkin_date - last_date == timedelta(days=1):
+                current += 1
             else:
-                break
+                current = 1
+            streaks[telegram_id] = (current, max(longest, current), checkin_date)
         
-        return streak
+        for telegram_id, (current, longest, last_date) in streaks.items():
+            session.query(User).filter_by(telegram_id=telegram_id).update({
+                User.current_streak: effective_streak(current, last_date, today),
+                User.longest_streak: longest,
+                User.last_checkin: last_date
+            }, synchronize_session=False)
+        
+        session.commit()
+        invalidate_after_commit(STREAK_CACHE, LEADERBOARD_CACHE)
+        logger.info(f"✅ רצפים חושבו עבור {len(streaks)} משתמשים")
+        return len(streaks)
     except Exception as e:
-        logger.error(f"❌ שגיאה בחישוב רצף: {e}")
+        session.rollback()
+        logger.error(f"❌ שגיאה בחישוב רצפים: {e}")
         return 0
     finally:
         session.close()
 
 def get_user_referrals(telegram_id, limit=10):
     """קבלת רשימת ההפניות של משתמש"""
-    session = Session()
+    session = open_session()
     try:
         referrals = session.query(Referral).filter_by(
             referrer_id=telegram_id
@@ -526,7 +872,7 @@ def get_user_referrals(telegram_id, limit=10):
 
 def get_total_referrals(telegram_id):
     """קבלת מספר ההפניות הכולל של משתמש"""
-    session = Session()
+    session = open_session()
     try:
         count = session.query(Referral).filter_by(referrer_id=telegram_id).count()
         return count
@@ -538,7 +884,7 @@ def get_total_referrals(telegram_id):
 
 def get_referred_users(telegram_id):
     """קבלת רשימת המוזמנים של משתמש"""
-    session = Session()
+    session = open_session()
     try:
         referrals = session.query(Referral).filter_by(referrer_id=telegram_id).all()
         referred_ids = [r.referred_id for r in referrals]
@@ -556,7 +902,7 @@ def get_referred_users(telegram_id):
 
 def get_user_attendance_history(telegram_id, days=30):
     """קבלת היסטוריית נוכחות של משתמש"""
-    session = Session()
+    session = open_session()
     try:
         start_date = date.today() - timedelta(days=days)
         attendances = session.query(Attendance).filter(
@@ -571,63 +917,151 @@ def get_user_attendance_history(telegram_id, days=30):
     finally:
         session.close()
 
+# ========== דפדוף ברשימת המשתמשים ==========
+
+USER_PAGE_SIZE = 20
+
+# סדרי הדפדוף האפשריים: עמודת המיון (יורד) - id שובר שוויון
+USER_PAGE_ORDERS = {
+    'created': User.created_at,
+    'tokens': User.tokens,
+}
+
+# העמודות שמוצגות ברשימה
+USER_PAGE_COLUMNS = (
+    User.id, User.telegram_id, User.first_name, User.last_name, User.username,
+    User.tokens, User.level, User.total_referrals, User.created_at
+)
+
+def encode_user_cursor(order, row):
+    """מצביע לדף הבא/הקודם - ערך עמודת המיון ו-id של השורה בקצה הדף"""
+    value = row.created_at.isoformat() if order == 'created' else str(row.tokens)
+    return f"{value}|{row.id}"
+
+def decode_user_cursor(order, cursor):
+    value, _, row_id = cursor.rpartition('|')
+    value = datetime.fromisoformat(value) if order == 'created' else int(value)
+    return value, int(row_id)
+
+def _keyset_rows(query, column, cursor, backwards, limit):
+    """עד limit שורות אחרי המצביע בסדר (column, id) יורד - או לפניו כש-backwards.
+    שתי שאילתות שכל אחת מהן מתחילה בדיוק במקום באינדקס: קודם השורות עם אותו ערך
+    ו-id קטן/גדול יותר, ואז השורות שאחרי הערך. השוואת (column, id) < (?, ?) אחת
+    הייתה סורקת ב-SQLite את כל השורות עם ערך זהה (למשל אלפי משתמשים עם 0 טוקנים)"""
+    if backwards:
+        by_id, by_key = (User.id, (column, User.id))
+    else:
+        by_id, by_key = (desc(User.id), (desc(column), desc(User.id)))
+    if cursor is None:
+        return query.order_by(*by_key).limit(limit).all()
+    
+    value, row_id = cursor
+    same_value = query.filter(column == value, User.id > row_id if backwards else User.id < row_id)
+    rows = same_value.order_by(by_id).limit(limit).all()
+    if len(rows) < limit:
+        beyond = query.filter(column > value if backwards else column < value)
+        rows += beyond.order_by(*by_key).limit(limit - len(rows)).all()
+    return rows
+
+def get_users_keyset_page(order='created', after=None, before=None, limit=USER_PAGE_SIZE):
+    """דף של משתמשים בדפדוף keyset - החדשים (או העשירים) קודם.
+    after / before הם מצביעים מדף קודם (next_cursor / prev_cursor). במקום OFFSET
+    השאילתה מתחילה מהשורה שבמצביע באינדקס (עמודה, id), ולכן דף 500 עולה כמו דף 1.
+    מחזיר dict עם users, next_cursor ו-prev_cursor (None כשאין דף כזה)"""
+    order = order if order in USER_PAGE_ORDERS else 'created'
+    column = USER_PAGE_ORDERS[order]
+    empty = {'users': [], 'next_cursor': None, 'prev_cursor': None, 'order': order}
+    session = open_session()
+    try:
+        backwards = before is not None and after is None
+        cursor = decode_user_cursor(order, after if not backwards else before) if (after or before) else None
+        
+        query = session.query(*USER_PAGE_COLUMNS)
+        if order == 'created':
+            # משתמשים ישנים בלי תאריך הרשמה לא ניתנים למיקום במצביע
+            query = query.filter(User.created_at != None)
+        
+        # שורה אחת נוספת כדי לדעת אם יש עוד דף באותו כיוון
+        rows = _keyset_rows(query, column, cursor, backwards, limit + 1)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if backwards:
+            rows.reverse()
+        
+        if not rows:
+            return empty
+        
+        has_next = has_more if not backwards else True
+        has_prev = has_more if backwards else cursor is not None
+        return {
+            'users': rows,
+            'next_cursor': encode_user_cursor(order, rows[-1]) if has_next else None,
+            'prev_cursor': encode_user_cursor(order, rows[0]) if has_prev else None,
+            'order': order,
+        }
+    except (ValueError, TypeError) as e:
+        logger.warning(f"⚠️ מצביע דפדוף לא תקין: {e}")
+        return empty
+    finally:
+        session.close()
+
 # ========== פונקציות משימות ==========
 
+# הודעות כאשר משימה כבר הושלמה בחלון הזמן שלה
+TASK_UNAVAILABLE_MESSAGES = {
+    TaskFrequency.DAILY: "כבר השלמת משימה זו היום",
+    TaskFrequency.WEEKLY: "כבר השלמת משימה זו השבוע",
+    TaskFrequency.MONTHLY: "כבר השלמת משימה זו החודש",
+    TaskFrequency.ONE_TIME: "כבר השלמת משימה זו בעבר",
+}
+
+def get_task_windows(today=None):
+    """תחילת חלון הזמן של כל תדירות משימה (None - חד פעמית, ללא חלון)"""
+    today = today or date.today()
+    start_of_day = datetime.combine(today, datetime.min.time())
+    return {
+        TaskFrequency.DAILY: start_of_day,
+        TaskFrequency.WEEKLY: start_of_day - timedelta(days=today.weekday()),
+        TaskFrequency.MONTHLY: start_of_day.replace(day=1),
+        TaskFrequency.ONE_TIME: None,
+    }
+
+def resolve_task_availability(session, telegram_id, tasks, today=None):
+    """קביעת זמינות כל המשימות למשתמש בשאילתה מקובצת אחת - מחזיר {task_id: זמין}"""
+    task_ids = [task.id for task in tasks]
+    if not task_ids:
+        return {}
+    
+    # ההשלמה האחרונה של כל משימה מספיקה כדי להכריע לכל התדירויות
+    last_completions = dict(session.query(
+        TaskCompletion.task_id,
+        func.max(TaskCompletion.completed_at)
+    ).filter(
+        TaskCompletion.telegram_id == telegram_id,
+        TaskCompletion.task_id.in_(task_ids)
+    ).group_by(TaskCompletion.task_id).all())
+    
+    windows = get_task_windows(today)
+    availability = {}
+    for task in tasks:
+        last_completed = last_completions.get(task.id)
+        window_start = windows.get(task.frequency)
+        if last_completed is None:
+            availability[task.id] = True
+        elif window_start is None:
+            availability[task.id] = False
+        else:
+            availability[task.id] = last_completed < window_start
+    
+    return availability
+
 def get_available_tasks(telegram_id):
     """קבלת רשימת משימות זמינות למשתמש"""
-    session = Session()
+    session = open_session()
     try:
-        # קבל את כל המשימות הפעילות
         tasks = session.query(Task).filter_by(is_active=True).all()
-        
-        # סינון משימות שכבר הושלמו היום/השבוע/החודש
-        available_tasks = []
-        today = date.today()
-        
-        for task in tasks:
-            # בדוק אם המשתמש כבר השלים את המשימה בתדירות המתאימה
-            if task.frequency == TaskFrequency.DAILY:
-                # בדוק אם השלים היום
-                completed_today = session.query(TaskCompletion).filter(
-                    TaskCompletion.telegram_id == telegram_id,
-                    TaskCompletion.task_id == task.id,
-                    func.date(TaskCompletion.completed_at) == today
-                ).first()
-                if not completed_today:
-                    available_tasks.append(task)
-                    
-            elif task.frequency == TaskFrequency.WEEKLY:
-                # תחילת השבוע
-                start_of_week = today - timedelta(days=today.weekday())
-                completed_this_week = session.query(TaskCompletion).filter(
-                    TaskCompletion.telegram_id == telegram_id,
-                    TaskCompletion.task_id == task.id,
-                    TaskCompletion.completed_at >= start_of_week
-                ).first()
-                if not completed_this_week:
-                    available_tasks.append(task)
-                    
-            elif task.frequency == TaskFrequency.MONTHLY:
-                # תחילת החודש
-                start_of_month = date(today.year, today.month, 1)
-                completed_this_month = session.query(TaskCompletion).filter(
-                    TaskCompletion.telegram_id == telegram_id,
-                    TaskCompletion.task_id == task.id,
-                    TaskCompletion.completed_at >= start_of_month
-                ).first()
-                if not completed_this_month:
-                    available_tasks.append(task)
-                    
-            elif task.frequency == TaskFrequency.ONE_TIME:
-                # בדוק אם אי פעם השלים
-                ever_completed = session.query(TaskCompletion).filter(
-                    TaskCompletion.telegram_id == telegram_id,
-                    TaskCompletion.task_id == task.id
-                ).first()
-                if not ever_completed:
-                    available_tasks.append(task)
-        
-        return available_tasks
+        availability = resolve_task_availability(session, telegram_id, tasks)
+        return [task for task in tasks if availability[task.id]]
     except Exception as e:
         logger.error(f"❌ שגיאה בקבלת משימות: {e}")
         return []
@@ -636,7 +1070,7 @@ def get_available_tasks(telegram_id):
 
 def get_user_tasks(telegram_id):
     """קבלת רשימת המשימות של משתמש"""
-    session = Session()
+    session = open_session()
     try:
         tasks = session.query(TaskCompletion).filter_by(
             telegram_id=telegram_id
@@ -650,45 +1084,20 @@ def get_user_tasks(telegram_id):
 
 def complete_task(telegram_id, task_id, proof_text=None):
     """השלמת משימה עם ולידציה"""
-    session = Session()
+    session = write_session()
     try:
         task = session.query(Task).filter_by(id=task_id).first()
         if not task or not task.is_active:
             return False, "המשימה לא קיימת או לא פעילה"
         
-        user = session.query(User).filter_by(telegram_id=telegram_id).first()
+        user = _load_user(session, telegram_id)
         if not user:
             return False, "משתמש לא נמצא"
         
         # בדוק אם ניתן להשלים את המשימה
-        today = date.today()
-        
-        if task.frequency == TaskFrequency.DAILY:
-            completed_today = session.query(TaskCompletion).filter(
-                TaskCompletion.telegram_id == telegram_id,
-                TaskCompletion.task_id == task_id,
-                func.date(TaskCompletion.completed_at) == today
-            ).first()
-            if completed_today:
-                return False, "כבר השלמת משימה זו היום"
-                
-        elif task.frequency == TaskFrequency.WEEKLY:
-            start_of_week = today - timedelta(days=today.weekday())
-            completed_this_week = session.query(TaskCompletion).filter(
-                TaskCompletion.telegram_id == telegram_id,
-                TaskCompletion.task_id == task_id,
-                TaskCompletion.completed_at >= start_of_week
-            ).first()
-            if completed_this_week:
-                return False, "כבר השלמת משימה זו השבוע"
-                
-        elif task.frequency == TaskFrequency.ONE_TIME:
-            ever_completed = session.query(TaskCompletion).filter(
-                TaskCompletion.telegram_id == telegram_id,
-                TaskCompletion.task_id == task_id
-            ).first()
-            if ever_completed:
-                return False, "כבר השלמת משימה זו בעבר"
+        availability = resolve_task_availability(session, telegram_id, [task])
+        if not availability[task.id]:
+            return False, TASK_UNAVAILABLE_MESSAGES.get(task.frequency, "המשימה אינה זמינה כעת")
         
         # אם המשימה דורשת הוכחה, סמן כממתינה לאישור
         status = TaskStatus.PENDING if task.requires_proof else TaskStatus.COMPLETED
@@ -703,15 +1112,16 @@ def complete_task(telegram_id, task_id, proof_text=None):
             completed_at=datetime.now()
         )
         
+        session.add(completion)
+        
         # אם לא דורש אישור, הוסף את הטוקנים מיד
         if status == TaskStatus.COMPLETED:
-            user.tokens += task.tokens_reward
-            user.experience += task.exp_reward
-            user.total_experience += task.exp_reward
-            update_user_level(user)
+            _add_tokens(session, user, task.tokens_reward,
+                        experience=task.exp_reward, total_experience=task.exp_reward)
+            _record_task_completion(session, user, completion)
         
-        session.add(completion)
         session.commit()
+        invalidate_after_commit(STATS_CACHE, TODAY_CACHE, LEADERBOARD_CACHE)
         
         if status == TaskStatus.COMPLETED:
             return True, f"🎉 השלמת משימה! קיבלת {task.tokens_reward} טוקנים!"
@@ -725,9 +1135,16 @@ def complete_task(telegram_id, task_id, proof_text=None):
     finally:
         session.close()
 
+def _record_task_completion(session, user, completion):
+    """משימה שהושלמה (מיד או באישור מנהל) - הטוקנים כבר נוספו; יומן, רמה וסטטיסטיקות היום באותה טרנזקציה"""
+    session.flush()
+    _log_tokens(session, user, completion.tokens_earned, 'task', reference=str(completion.id))
+    level_up_tokens = _level_up_bonus(user)
+    _record_activity(session, user, date.today(), tokens=completion.tokens_earned + level_up_tokens, tasks=1)
+
 def get_pending_tasks():
     """קבלת משימות ממתינות לאישור"""
-    session = Session()
+    session = open_session()
     try:
         tasks = session.query(TaskCompletion).filter_by(
             status=TaskStatus.PENDING
@@ -741,7 +1158,7 @@ def get_pending_tasks():
 
 def approve_task(task_completion_id, admin_id):
     """אישור משימה על ידי מנהל"""
-    session = Session()
+    session = write_session()
     try:
         completion = session.query(TaskCompletion).filter_by(id=task_completion_id).first()
         if not completion:
@@ -751,7 +1168,7 @@ def approve_task(task_completion_id, admin_id):
             return False, "המשימה כבר אושרה או נדחתה"
         
         task = session.query(Task).filter_by(id=completion.task_id).first()
-        user = session.query(User).filter_by(telegram_id=completion.telegram_id).first()
+        user = _load_user(session, completion.telegram_id)
         
         if not task or not user:
             return False, "שגיאה בנתונים"
@@ -760,12 +1177,12 @@ def approve_task(task_completion_id, admin_id):
         completion.status = TaskStatus.COMPLETED
         completion.verified_by = admin_id
         
-        user.tokens += completion.tokens_earned
-        user.experience += completion.exp_earned
-        user.total_experience += completion.exp_earned
-        update_user_level(user)
+        _add_tokens(session, user, completion.tokens_earned,
+                    experience=completion.exp_earned, total_experience=completion.exp_earned)
+        _record_task_completion(session, user, completion)
         
         session.commit()
+        invalidate_after_commit(STATS_CACHE, TODAY_CACHE, LEADERBOARD_CACHE)
         return True, f"✅ המשימה אושרה! המשתמש קיבל {completion.tokens_earned} טוקנים."
         
     except Exception as e:
@@ -777,7 +1194,7 @@ def approve_task(task_completion_id, admin_id):
 
 def reject_task(task_completion_id, admin_id, reason=None):
     """דחיית משימה על ידי מנהל"""
-    session = Session()
+    session = write_session()
     try:
         completion = session.query(TaskCompletion).filter_by(id=task_completion_id).first()
         if not completion:
@@ -801,67 +1218,308 @@ def reject_task(task_completion_id, admin_id, reason=None):
     finally:
         session.close()
 
+# ========== מדדים יומיים מצטברים ==========
+
+# עמודות המדדים בטבלת daily_rollups
+ROLLUP_COLUMNS = ('checkins', 'new_users', 'tasks_completed', 'new_referrals', 'tokens_minted', 'active_users')
+
+def _bump_rollup(session, day, **deltas):
+    """הוספה למדדי היום (ללא commit) - upsert על שורת התאריך, באותה טרנזקציה של הכתיבה עצמה"""
+    deltas = {column: value for column, value in deltas.items() if value}
+    if not deltas:
+        return
+    stmt = _insert(session, DailyRollup).values(
+        date=day, **{column: deltas.get(column, 0) for column in ROLLUP_COLUMNS}
+    )
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=['date'],
+        set_={column: getattr(DailyRollup, column) + getattr(stmt.excluded, column) for column in deltas}
+    ))
+
+def get_daily_rollups(days=7, today=None):
+    """מדדי הימים האחרונים (מהישן לחדש) - יום בלי פעילות מופיע עם אפסים"""
+    session = open_session()
+    try:
+        today = today or date.today()
+        start = today - timedelta(days=days - 1)
+        rows = {row.date: row for row in session.query(DailyRollup).filter(
+            DailyRollup.date >= start, DailyRollup.date <= today
+        )}
+        result = []
+        for i in range(days):
+            day = start + timedelta(days=i)
+            row = rows.get(day)
+            result.append(dict(date=day, **{column: getattr(row, column) if row else 0 for column in ROLLUP_COLUMNS}))
+        return result
+    except Exception as e:
+        logger.error(f"❌ שגיאה בקבלת מדדים יומיים: {e}")
+        return []
+    finally:
+        session.close()
+
+def _as_date(value):
+    # func.date מחזיר מחרוזת ב-SQLite
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+def backfill_daily_rollups(start=None, end=None, overwrite=False):
+    """חישוב מדדי הימים מההיסטוריה (למסדי נתונים קיימים) - מחזיר את מספר הימים שחושבו
+    
+    בלי overwrite נכתבים רק ימים שאין להם עדיין שורה, כי מה שנספר בזמן הכתיבה מדויק יותר:
+    בונוסי עלייה ברמה וטוקנים שהוענקו ידנית לא נשמרים באף טבלה ולכן חסרים ב-tokens_minted
+    שמחושב כאן, ומשימה שאושרה נספרת ביום ההגשה ולא ביום האישור.
+    """
+    session = write_session()
+    try:
+        days = {}
+        
+        def add(day, **values):
+            row = days.setdefault(_as_date(day), dict.fromkeys(ROLLUP_COLUMNS, 0))
+            for column, value in values.items():
+                row[column] += value or 0
+        
+        def in_range(day_column):
+            conditions = []
+            if start:
+                conditions.append(day_column >= start)
+            if end:
+                conditions.append(day_column <= end)
+            return conditions
+        
+        # צ'ק-אינים וטוקני הצ'ק-אין
+        for day, count, tokens in session.query(
+            Attendance.date, func.count(Attendance.id), func.sum(Attendance.tokens_earned)
+        ).filter(*in_range(Attendance.date)).group_by(Attendance.date):
+            add(day, checkins=count, tokens_minted=tokens)
+        
+        # משתמשים חדשים ובונוס ההרשמה
+        user_day = func.date(User.created_at)
+        for day, count in session.query(user_day, func.count(User.id)).filter(
+            User.created_at != None, *in_range(user_day)
+        ).group_by(user_day):
+            add(day, new_users=count, tokens_minted=count * 10)
+        
+        # הפניות - 5 טוקנים למצטרף ו-10 למזמין
+        referral_day = func.date(Referral.created_at)
+        for day, count in session.query(referral_day, func.count(Referral.id)).filter(
+            Referral.created_at != None, *in_range(referral_day)
+        ).group_by(referral_day):
+            add(day, new_referrals=count, tokens_minted=count * 15)
+        
+        # משימות שהושלמו
+        task_day = func.date(TaskCompletion.completed_at)
+        for day, count, tokens in session.query(
+            task_day, func.count(TaskCompletion.id), func.sum(TaskCompletion.tokens_earned)
+        ).filter(TaskCompletion.status == TaskStatus.COMPLETED, *in_range(task_day)).group_by(task_day):
+            add(day, tasks_completed=count, tokens_minted=tokens)
+        
+        # פעילים - משתמשים שונים עם צ'ק-אין או משימה שהושלמה באותו יום
+        activity = select(
+            Attendance.telegram_id.label('telegram_id'), Attendance.date.label('day')
+        ).where(*in_range(Attendance.date)).union_all(
+            select(TaskCompletion.telegram_id, task_day).where(
+                TaskCompletion.status == TaskStatus.COMPLETED, *in_range(task_day)
+            )
+        ).subquery()
+        for day, count in session.query(
+            activity.c.day, func.count(func.distinct(activity.c.telegram_id))
+        ).group_by(activity.c.day):
+            add(day, active_users=count)
+        
+        if days:
+            stmt = _insert(session, DailyRollup)
+            if overwrite:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['date'],
+                    set_={column: getattr(stmt.excluded, column) for column in ROLLUP_COLUMNS}
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing()
+            session.execute(stmt, [dict(date=day, **values) for day, values in sorted(days.items())])
+        
+        session.commit()
+        invalidate_after_commit(STATS_CACHE, TODAY_CACHE)
+        logger.info(f"✅ מדדים יומיים חושבו עבור {len(days)} ימים")
+        return len(days)
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ שגיאה בחישוב מדדים יומיים: {e}")
+        return 0
+    finally:
+        session.close()
+
+# ========== יומן טוקנים ==========
+
+# רשומות היומן של הטרנזקציה נאספות בסשן ונכתבות יחד לפני ה-commit
+LEDGER_PENDING = 'token_ledger'
+LEDGER_PAGE_SIZE = 20
+
+def _log_tokens(session, user, amount, source, reference=None, reason=None):
+    """רישום שינוי יתרה ביומן (ללא commit) - user.tokens כבר כולל את השינוי"""
+    if not amount:
+        return
+    session.info.setdefault(LEDGER_PENDING, []).append({
+        'telegram_id': user.telegram_id,
+        'amount': amount,
+        'balance_after': user.tokens,
+        'source': source,
+        'reference': reference,
+        'reason': reason[:200] if reason else None,
+        'created_at': datetime.now()
+    })
+
+@event.listens_for(Session, 'before_commit')
+def _write_token_ledger(session):
+    # כל רשומות הטרנזקציה ב-INSERT אחד (executemany), לפי סדר הרישום
+    entries = session.info.pop(LEDGER_PENDING, None)
+    if entries:
+        session.execute(insert(TokenLedger), entries)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_token_ledger(session, previous_transaction):
+    session.info.pop(LEDGER_PENDING, None)
+
+def get_token_statement(telegram_id, before_id=None, limit=LEDGER_PAGE_SIZE):
+    """דף מתוך יומן הטוקנים של משתמש (מהחדש לישן) - before_id הוא id האחרון בדף הקודם"""
+    session = open_session()
+    try:
+        query = session.query(TokenLedger).filter(TokenLedger.telegram_id == telegram_id)
+        if before_id:
+            query = query.filter(TokenLedger.id < before_id)
+        return [
+            {
+                'id': entry.id,
+                'amount': entry.amount,
+                'balance_after': entry.balance_after,
+                'source': entry.source,
+                'reference': entry.reference,
+                'reason': entry.reason,
+                'created_at': entry.created_at
+            }
+            for entry in query.order_by(desc(TokenLedger.id)).limit(limit)
+        ]
+    except Exception as e:
+        logger.error(f"❌ שגיאה בקבלת יומן טוקנים: {e}")
+        return []
+    finally:
+        session.close()
+
+def reconcile_token_ledger(fix=False, batch_size=USER_STREAM_BATCH_SIZE, max_samples=20):
+    """השוואת User.tokens מול היומן - במנות של משתמשים לפי id, כל מנה בטרנזקציה קצרה משלה
+    
+    לכל משתמש נבדקים סכום הרשומות ויתרת הרשומה האחרונה. עם fix נרשמת רשומת תיקון
+    (opening_balance למשתמש בלי רשומות - למשל ממסד שקדם ליומן, adjustment לפער).
+    מחזיר {'users', 'mismatched', 'fixed', 'samples'}.
+    """
+    result = {'users': 0, 'mismatched': 0, 'fixed': 0, 'samples': []}
+    after_id = 0
+    while True:
+        session = write_session()
+        try:
+            users = session.query(User.id, User.telegram_id, User.tokens).filter(
+                User.id > after_id
+            ).order_by(User.id).limit(batch_size).all()
+            if not users:
+                return result
+            after_id = users[-1].id
+            
+            telegram_ids = [user.telegram_id for user in users]
+            totals = {
+                telegram_id: (total, last_id)
+                for telegram_id, total, last_id in session.query(
+                    TokenLedger.telegram_id, func.sum(TokenLedger.amount), func.max(TokenLedger.id)
+                ).filter(TokenLedger.telegram_id.in_(telegram_ids)).group_by(TokenLedger.telegram_id)
+            }
+            last_balances = dict(session.query(TokenLedger.id, TokenLedger.balance_after).filter(
+                TokenLedger.id.in_([last_id for _, last_id in totals.values()])
+            )) if totals else {}
+            
+            fixes = []
+            for user in users:
+                result['users'] += 1
+                tokens = user.tokens or 0
+                total, last_id = totals.get(user.telegram_id, (0, None))
+                last_balance = last_balances.get(last_id, 0)
+                if total == tokens and last_balance == tokens:
+                    continue
+                
+                result['mismatched'] += 1
+                if len(result['samples']) < max_samples:
+                    result['samples'].append({
+                        'telegram_id': user.telegram_id, 'tokens': tokens,
+                        'ledger_total': total, 'last_balance': last_balance
+                    })
+                if fix:
+                    fixes.append({
+                        'telegram_id': user.telegram_id,
+                        'amount': tokens - total,
+                        'balance_after': tokens,
+                        'source': 'opening_balance' if last_id is None else 'adjustment',
+                        'reason': 'reconcile_token_ledger',
+                        'created_at': datetime.now()
+                    })
+            
+            if fixes:
+                session.execute(insert(TokenLedger), fixes)
+                result['fixed'] += len(fixes)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"❌ שגיאה בהתאמת יומן הטוקנים: {e}")
+            return result
+        finally:
+            session.close()
+
 # ========== פונקציות סטטיסטיקה ==========
 
+# חלון הימים לחישוב ממוצע פעילים יומי
+DAILY_ACTIVE_WINDOW_DAYS = 30
+
+@cached(STATS_CACHE, ttl=STATS_CACHE_TTL)
 def get_system_stats():
     """קבלת סטטיסטיקות מערכת מקיפות"""
-    session = Session()
+    session = open_session()
     try:
-        from sqlalchemy import func
-        
-        # סטטיסטיקות בסיסיות
-        total_users = session.query(User).count()
-        
-        # משתמשים פעילים היום (עשו צ'ק-אין)
         today = date.today()
-        active_today = session.query(Attendance).filter(
-            Attendance.date == today
-        ).distinct(Attendance.telegram_id).count()
-        
-        total_tokens = session.query(func.sum(User.tokens)).scalar() or 0
-        
-        # סטטיסטיקות מתקדמות
-        total_referrals = session.query(Referral).count()
-        total_tasks_completed = session.query(TaskCompletion).filter_by(
-            status=TaskStatus.COMPLETED
-        ).count()
+        window_start = today - timedelta(days=DAILY_ACTIVE_WINDOW_DAYS - 1)
+        
+        # משתמשים - ספירה, סכום טוקנים וממוצע רמה בשאילתה אחת
+        total_users, total_tokens, avg_level_result = session.query(
+            func.count(User.id),
+            func.sum(User.tokens),
+            func.avg(User.level)
+        ).one()
+        total_tokens = total_tokens or 0
+        
+        # פעילות - מטבלת המדדים היומיים (שורה אחת לכל יום) במקום סריקת היסטוריית הנוכחות
+        in_window = DailyRollup.date >= window_start
+        (total_checkins, total_referrals, total_tasks_completed,
+         active_today, window_active, window_days) = (value or 0 for value in session.query(
+            func.sum(DailyRollup.checkins),
+            func.sum(DailyRollup.new_referrals),
+            func.sum(DailyRollup.tasks_completed),
+            func.sum(case((DailyRollup.date == today, DailyRollup.active_users), else_=0)),
+            func.sum(case((in_window, DailyRollup.active_users), else_=0)),
+            func.sum(case((and_(in_window, DailyRollup.active_users > 0), 1), else_=0))
+        ).one())
         
         # חישוב ממוצעים
         avg_tokens = total_tokens / total_users if total_users > 0 else 0
-        avg_level_result = session.query(func.avg(User.level)).scalar()
-        avg_level = round(avg_level_result, 2) if avg_level_result else 0
+        avg_level = round(float(avg_level_result), 2) if avg_level_result else 0
+        avg_daily = window_active / window_days if window_days else 0
         
         # התפלגות רמות
-        level_distribution = {}
-        for i in range(1, 11):
-            count = session.query(User).filter_by(level=i).count()
-            level_distribution[f'level_{i}'] = count
+        level_counts = dict(session.query(User.level, func.count(User.id)).group_by(User.level).all())
+        level_distribution = {f'level_{i}': level_counts.get(i, 0) for i in range(1, MAX_LEVEL + 1)}
         
         # משימות פופולריות
-        popular_tasks = session.query(
-            TaskCompletion.task_id,
-            func.count(TaskCompletion.task_id).label('count')
-        ).filter_by(status=TaskStatus.COMPLETED).group_by(
-            TaskCompletion.task_id
-        ).order_by(desc('count')).limit(5).all()
-        
-        popular_tasks_data = []
-        for task_id, count in popular_tasks:
-            task = session.query(Task).filter_by(id=task_id).first()
-            if task:
-                popular_tasks_data.append({
-                    'name': task.name,
-                    'count': count
-                })
-        
-        # סטטיסטיקות נוספות
-        total_checkins = session.query(Attendance).count()
-        avg_daily_active = session.query(
-            func.date(Attendance.date),
-            func.count(func.distinct(Attendance.telegram_id))
-        ).group_by(func.date(Attendance.date)).all()
+        completion_count = func.count(TaskCompletion.id).label('count')
+        popular_tasks = session.query(Task.name, completion_count).join(
+            TaskCompletion, TaskCompletion.task_id == Task.id
+        ).filter(
+            TaskCompletion.status == TaskStatus.COMPLETED
+        ).group_by(Task.id, Task.name).order_by(desc('count')).limit(5).all()
         
-        avg_daily = sum(count for _, count in avg_daily_active) / len(avg_daily_active) if avg_daily_active else 0
+        popular_tasks_data = [{'name': name, 'count': count} for name, count in popular_tasks]
         
         return {
             'total_users': total_users,
@@ -897,34 +1555,22 @@ def get_system_stats():
         session.close()
 
 def get_checkin_data(days=7):
-    """קבלת נתוני צ'ק-אין לימים אחרונים"""
-    session = Session()
-    try:
-        data = []
-        for i in range(days):
-            day = date.today() - timedelta(days=i)
-            count = session.query(Attendance).filter(Attendance.date == day).count()
-            data.append({
-                'date': day.strftime('%Y-%m-%d'),
-                'day_name': day.strftime('%a'),
-                'count': count
-            })
-        return list(reversed(data))
-    except Exception as e:
-        logger.error(f"❌ שגיאה בקבלת נתוני צ'ק-אין: {e}")
-        return []
-    finally:
-        session.close()
+    """קבלת נתוני צ'ק-אין לימים אחרונים - שאילתה אחת על daily_rollups"""
+    return [
+        {
+            'date': row['date'].strftime('%Y-%m-%d'),
+            'day_name': row['date'].strftime('%a'),
+            'count': row['checkins']
+        }
+        for row in get_daily_rollups(days)
+    ]
 
 def get_activity_count():
     """קבלת מספר הפעילים היום"""
-    session = Session()
+    session = open_session()
     try:
-        today = date.today()
-        count = session.query(Attendance).filter(
-            Attendance.date == today
-        ).distinct(Attendance.telegram_id).count()
-        return count
+        rollup = session.get(DailyRollup, date.today())
+        return rollup.active_users if rollup else 0
     except Exception as e:
         logger.error(f"❌ שגיאה בקבלת מספר פעילים: {e}")
         return 0
@@ -932,35 +1578,28 @@ def get_activity_count():
         session.close()
 
 def get_user_activity_report(telegram_id, days=30):
-    """קבלת דוח פעילות של משתמש"""
-    session = Session()
+    """קבלת דוח פעילות של משתמש - שאילתה אחת על user_daily_stats"""
+    session = open_session()
     try:
         start_date = date.today() - timedelta(days=days)
         
-        # צ'ק-אין
-        checkins = session.query(Attendance).filter(
-            Attendance.telegram_id == telegram_id,
-            Attendance.date >= start_date
-        ).all()
-        
-        # משימות
-        tasks = session.query(TaskCompletion).filter(
-            TaskCompletion.telegram_id == telegram_id,
-            TaskCompletion.completed_at >= start_date
-        ).all()
-        
-        # הפניות
-        referrals = session.query(Referral).filter(
-            Referral.referrer_id == telegram_id,
-            Referral.created_at >= start_date
-        ).all()
+        checkins, tasks, referrals, tokens_earned, days_active = session.query(
+            func.sum(UserDailyStats.checkins),
+            func.sum(UserDailyStats.tasks_completed),
+            func.sum(UserDailyStats.referrals),
+            func.sum(UserDailyStats.tokens_earned),
+            func.sum(case((UserDailyStats.checkins + UserDailyStats.tasks_completed > 0, 1), else_=0))
+        ).filter(
+            UserDailyStats.telegram_id == telegram_id,
+            UserDailyStats.date >= start_date
+        ).one()
         
         return {
-            'checkins': len(checkins),
-            'tasks': len(tasks),
-            'referrals': len(referrals),
-            'tokens_earned': sum(c.tokens_earned for c in checkins) + sum(t.tokens_earned for t in tasks),
-            'days_active': len(set(c.date for c in checkins))
+            'checkins': checkins or 0,
+            'tasks': tasks or 0,
+            'referrals': referrals or 0,
+            'tokens_earned': tokens_earned or 0,
+            'days_active': days_active or 0
         }
     except Exception as e:
         logger.error(f"❌ שגיאה בקבלת דוח פעילות: {e}")
@@ -968,24 +1607,388 @@ def get_user_activity_report(telegram_id, days=30):
     finally:
         session.close()
 
+def get_user_daily_history(telegram_id, days=7, today=None):
+    """היסטוריה יומית של משתמש (מהחדש לישן) - יום בלי פעילות מופיע עם אפסים"""
+    session = open_session()
+    try:
+        today = today or date.today()
+        start_date = today - timedelta(days=days - 1)
+        rows = {row.date: row for row in session.query(UserDailyStats).filter(
+            UserDailyStats.telegram_id == telegram_id,
+            UserDailyStats.date >= start_date,
+            UserDailyStats.date <= today
+        )}
+        
+        history = []
+        for i in range(days):
+            day = today - timedelta(days=i)
+            row = rows.get(day)
+            history.append({
+                'date': day,
+                'checked_in': bool(row and row.checkins),
+                'tasks_completed': row.tasks_completed or 0 if row else 0,
+                'referrals': row.referrals or 0 if row else 0,
+                'tokens_earned': row.tokens_earned or 0 if row else 0,
+                'streak_days': row.streak_days or 0 if row else 0
+            })
+        return history
+    except Exception as e:
+        logger.error(f"❌ שגיאה בקבלת היסטוריה יומית: {e}")
+        return []
+    finally:
+        session.close()
+
+def backfill_user_daily_stats(batch_size=1000):
+    """חישוב user_daily_stats מההיסטוריה (למסדי נתונים קיימים) - מחזיר את מספר השורות שנכתבו
+    
+    צ'ק-אינים, משימות שהושלמו, הפניות ובונוסי ההרשמה מחושבים מחדש לכל (משתמש, יום),
+    בזרם ממוין לפי משתמש ותאריך כדי לחשב גם את הרצף של כל יום. בונוסי עלייה ברמה
+    וטוקנים שהוענקו ידנית לא נשמרים בהיסטוריה, ושורות שכתבו אותם נדרסות.
+    """
+    session = write_session()
+    try:
+        task_day = func.date(TaskCompletion.completed_at)
+        referral_day = func.date(Referral.created_at)
+        user_day = func.date(User.created_at)
+        
+        def source(telegram_id, day, checkins=0, tasks=0, referrals=0, tokens=0):
+            return select(
+                telegram_id.label('telegram_id'), day.label('day'),
+                literal(checkins).label('checkins'), literal(tasks).label('tasks'),
+                literal(referrals).label('referrals'),
+                (literal(tokens) if isinstance(tokens, int) else tokens).label('tokens')
+            )
+        
+        activity = source(Attendance.telegram_id, Attendance.date, checkins=1, tokens=Attendance.tokens_earned).union_all(
+            source(TaskCompletion.telegram_id, task_day, tasks=1, tokens=TaskCompletion.tokens_earned).where(
+                TaskCompletion.status == TaskStatus.COMPLETED
+            ),
+            source(Referral.referrer_id, referral_day, referrals=1, tokens=10).where(Referral.created_at != None),
+            source(Referral.referred_id, referral_day, tokens=5).where(Referral.created_at != None),
+            source(User.telegram_id, user_day, tokens=10).where(User.created_at != None)
+        ).subquery()
+        
+        rows = session.query(
+            activity.c.telegram_id, activity.c.day,
+            func.sum(activity.c.checkins), func.sum(activity.c.tasks),
+            func.sum(activity.c.referrals), func.sum(activity.c.tokens)
+        ).group_by(activity.c.telegram_id, activity.c.day).order_by(
+            activity.c.telegram_id, activity.c.day
+        ).yield_per(batch_size)
+        
+        stmt = _insert(session, UserDailyStats)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['telegram_id', 'date'],
+            set_={column: getattr(stmt.excluded, column)
+                  for column in ('checkins', 'tasks_completed', 'referrals', 'tokens_earned', 'streak_days')}
+        )
+        
+        written = 0
+        batch = []
+        current_user, streak, last_checkin = None, 0, None
+        for telegram_id, day, checkins, tasks, referrals, tokens in rows:
+            day = _as_date(day)
+            if telegram_id != current_user:
+                current_user, streak, last_checkin = telegram_id, 0, None
+            if checkins:
+                streak = streak + 1 if last_checkin == day - timedelta(days=1) else 1
+                last_checkin = day
+            batch.append({
+                'telegram_id': telegram_id,
+                'date': day,
+                'checkins': checkins or 0,
+                'tasks_completed': tasks or 0,
+                'referrals': referrals or 0,
+                'tokens_earned': tokens or 0,
+                'streak_days': effective_streak(streak, last_checkin, day)
+            })
+            if len(batch) >= batch_size:
+                session.execute(stmt, batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            session.execute(stmt, batch)
+            written += len(batch)
+        
+        session.commit()
+        logger.info(f"✅ סטטיסטיקות יומיות חושבו: {written} שורות")
+        return written
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ שגיאה בחישוב סטטיסטיקות יומיות: {e}")
+        return 0
+    finally:
+        session.close()
+
+# ========== פונקציות שידור ==========
+
+BROADCAST_ACTIVE_STATUSES = ('pending', 'running')
+# מזהה נעילת תפיסת השידורים ב-PostgreSQL (pg_advisory_xact_lock) - שתי תפיסות לא רצות במקביל
+BROADCAST_LOCK_ID = 7_260_002
+
+def create_broadcast_job(text, created_by, status_chat_id=None, status_message_id=None):
+    """יצירת שידור ורשומת מסירה לכל משתמש (INSERT ... SELECT בצד השרת) - מחזיר (מזהה, מספר נמענים)"""
+    session = write_session()
+    try:
+        job = BroadcastJob(text=text, created_by=created_by, status='pending',
+                           status_chat_id=status_chat_id, status_message_id=status_message_id)
+        session.add(job)
+        session.flush()
+        
+        session.execute(insert(BroadcastDelivery).from_select(
+            ['job_id', 'telegram_id', 'status', 'attempts'],
+            select(literal(job.id, Integer), User.telegram_id, literal('pending', String), literal(0, Integer))
+        ))
+        job.total = session.query(func.count(BroadcastDelivery.id)).filter(
+            BroadcastDelivery.job_id == job.id
+        ).scalar()
+        if not job.total:
+            job.status = 'completed'
+            job.finished_at = datetime.now()
+        
+        session.commit()
+        logger.info(f"📢 נוצר שידור {job.id} ל-{job.total} נמענים")
+        return job.id, job.total
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ שגיאה ביצירת שידור: {e}")
+        return None, 0
+    finally:
+        session.close()
+
+def get_broadcast_job(job_id):
+    """פרטי שידור ומוני ההתקדמות שלו"""
+    session = open_session()
+    try:
+        job = session.get(BroadcastJob, job_id)
+        if not job:
+            return None
+        return {
+            'id': job.id,
+            'text': job.text,
+            'status': job.status,
+            'total': job.total or 0,
+            'sent': job.sent or 0,
+            'failed': job.failed or 0,
+            'status_chat_id': job.status_chat_id,
+            'status_message_id': job.status_message_id,
+            'created_at': job.created_at,
+            'finished_at': job.finished_at,
+        }
+    finally:
+        session.close()
+
+def get_claimable_broadcast_jobs(lease_seconds):
+    """שידורים שלא הסתיימו ואין תהליך שמחזיק בהם (או שהתהליך שהחזיק בהם הפסיק לחדש)"""
+    session = open_session()
+    try:
+        cutoff = datetime.now() - timedelta(seconds=lease_seconds)
+        rows = session.query(BroadcastJob.id).filter(
+            BroadcastJob.status.in_(BROADCAST_ACTIVE_STATUSES),
+            or_(BroadcastJob.owner == None, BroadcastJob.heartbeat_at < cutoff)
+        ).order_by(BroadcastJob.id).all()
+        return [job_id for job_id, in rows]
+    finally:
+        session.close()
+
+def claim_broadcast_job(job_id, owner, lease_seconds):
+    """תפיסת שידור לתהליך הנוכחי - רק אם הוא פנוי ואף תהליך אחר לא משדר כרגע.
+    
+    מגבלת הקצב של השידור (TokenBucket ב-bot/broadcast.py) היא לכל תהליך, ולכן כל השידורים
+    רצים בתהליך אחד בכל פעם: תהליך אחר יתפוס שידור רק אחרי שההחזקה של המשדר פגה."""
+    session = write_session()
+    try:
+        now = datetime.now()
+        stale = now - timedelta(seconds=lease_seconds)
+        if session.get_bind().dialect.name == 'postgresql':
+            # ב-SQLite טרנזקציית הכתיבה כבר מונעת תפיסה מקבילה
+            session.execute(text("SELECT pg_advisory_xact_lock(:id)"), {'id': BROADCAST_LOCK_ID})
+        busy = session.query(BroadcastJob.id).filter(
+            BroadcastJob.status.in_(BROADCAST_ACTIVE_STATUSES),
+            BroadcastJob.owner != None,
+            BroadcastJob.owner != owner,
+            BroadcastJob.heartbeat_at >= stale
+        ).first()
+        if busy:
+            return False
+        
+        claimed = session.query(BroadcastJob).filter(
+            BroadcastJob.id == job_id,
+            BroadcastJob.status.in_(BROADCAST_ACTIVE_STATUSES),
+            or_(BroadcastJob.owner == None, BroadcastJob.owner == owner,
+                BroadcastJob.heartbeat_at < stale)
+        ).update({BroadcastJob.status: 'running', BroadcastJob.owner: owner,
+                  BroadcastJob.heartbeat_at: now}, synchronize_session=False)
+        session.commit()
+        return claimed == 1
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ שגיאה בתפיסת שידור {job_id}: {e}")
+        return False
+    finally:
+        session.close()
+
+def get_pending_deliveries(job_id, after_id=0, limit=200):
+    """המנה הבאה של נמענים שטרם קיבלו את השידור - (מזהה מסירה, telegram_id) לפי סדר"""
+    session = open_session()
+    try:
+        return [tuple(row) for row in session.query(BroadcastDelivery.id, BroadcastDelivery.telegram_id).filter(
+            BroadcastDelivery.job_id == job_id,
+            BroadcastDelivery.status == 'pending',
+            BroadcastDelivery.id > after_id
+        ).order_by(BroadcastDelivery.id).limit(limit).all()]
+    finally:
+        session.close()
+
+def record_broadcast_deliveries(job_id, owner, deliveries):
+    """שמירת תוצאות מנה של מסירות ועדכון המונים - מחזיר False אם השידור בוטל או עבר לתהליך אחר.
+    deliveries: רשימת dict עם id, status, attempts, error, sent_at"""
+    session = write_session()
+    try:
+        sent = sum(1 for d in deliveries if d['status'] == 'sent')
+        failed = sum(1 for d in deliveries if d['status'] == 'failed')
+        
+        still_owner = session.query(BroadcastJob).filter(
+            BroadcastJob.id == job_id,
+            BroadcastJob.owner == owner,
+            BroadcastJob.status == 'running'
+        ).update({BroadcastJob.sent: BroadcastJob.sent + sent,
+                  BroadcastJob.failed: BroadcastJob.failed + failed,
+                  BroadcastJob.heartbeat_at: datetime.now()}, synchronize_session=False) == 1
+        
+        # המסירות נשמרות גם אם השידור בוטל - ההודעות האלה כבר נשלחו
+        if deliveries:
+            session.execute(update(BroadcastDelivery), deliveries)
+        
+        session.commit()
+        return still_owner
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ שגיאה בשמירת התקדמות שידור {job_id}: {e}")
+        raise
+    finally:
+        session.close()
+
+def finish_broadcast_job(job_id, owner):
+    """סימון שידור שהסתיים ושחרור ההחזקה בו"""
+    session = write_session()
+    try:
+        session.query(BroadcastJob).filter(
+            BroadcastJob.id == job_id,
+            BroadcastJob.owner == owner,
+            BroadcastJob.status == 'running'
+        ).update({BroadcastJob.status: 'completed', BroadcastJob.owner: None,
+                  BroadcastJob.finished_at: datetime.now()}, synchronize_session=False)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ שגיאה בסיום שידור {job_id}: {e}")
+    finally:
+        session.close()
+
+def release_broadcast_job(job_id, owner):
+    """שחרור שידור שלא הסתיים (כיבוי התהליך) - תהליך אחר או הפעלה הבאה ימשיכו מאותה נקודה"""
+    session = write_session()
+    try:
+        session.query(BroadcastJob).filter(
+            BroadcastJob.id == job_id,
+            BroadcastJob.owner == owner
+        ).update({BroadcastJob.owner: None}, synchronize_session=False)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ שגיאה בשחרור שידור {job_id}: {e}")
+    finally:
+        session.close()
+
+def cancel_broadcast_job(job_id):
+    """ביטול שידור פעיל - התהליך ששולח אותו עוצר בסוף המנה הנוכחית"""
+    session = write_session()
+    try:
+        cancelled = session.query(BroadcastJob).filter(
+            BroadcastJob.id == job_id,
+            BroadcastJob.status.in_(BROADCAST_ACTIVE_STATUSES)
+        ).update({BroadcastJob.status: 'cancelled', BroadcastJob.owner: None,
+                  BroadcastJob.finished_at: datetime.now()}, synchronize_session=False)
+        session.commit()
+        return cancelled == 1
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ שגיאה בביטול שידור {job_id}: {e}")
+        return False
+    finally:
+        session.close()
+
+# ========== מניעת כפילויות webhook ==========
+
+def claim_update(update_id):
+    """רישום update_id כמטופל - מחזיר False אם העדכון כבר התקבל (גם בתהליך אחר)"""
+    session = write_session()
+    try:
+        stmt = _insert(session, ProcessedUpdate).values(
+            update_id=update_id, received_at=datetime.now()
+        ).on_conflict_do_nothing(index_elements=['update_id'])
+        claimed = session.execute(stmt).rowcount > 0
+        session.commit()
+        return claimed
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ שגיאה ברישום עדכון {update_id}: {e}")
+        raise
+    finally:
+        session.close()
+
+def claim_scheduled_job(name, owner, day=None):
+    """תפיסת ההרצה היומית של משימה מתוזמנת - מחזיר False אם תהליך אחר כבר הריץ אותה היום
+    (כל worker מתזמן את המשימות, ורק הראשון מריץ)"""
+    session = write_session()
+    try:
+        stmt = _insert(session, ScheduledJobRun).values(
+            name=name, run_date=day or date.today(), owner=owner, started_at=datetime.now()
+        ).on_conflict_do_nothing(index_elements=['name', 'run_date'])
+        claimed = session.execute(stmt).rowcount > 0
+        session.commit()
+        return claimed
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ שגיאה בתפיסת המשימה {name}: {e}")
+        return False
+    finally:
+        session.close()
+
+def prune_processed_updates(max_age_seconds):
+    """מחיקת עדכונים ישנים מטבלת הכפילויות - טלגרם לא שולח שוב עדכון ישן מ-24 שעות"""
+    session = write_session()
+    try:
+        cutoff = datetime.now() - timedelta(seconds=max_age_seconds)
+        deleted = session.query(ProcessedUpdate).filter(
+            ProcessedUpdate.received_at < cutoff
+        ).delete(synchronize_session=False)
+        session.commit()
+        return deleted
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ שגיאה בניקוי טבלת העדכונים: {e}")
+        return 0
+    finally:
+        session.close()
+
 # ========== פונקציות אדמין ==========
 
 def add_tokens_to_user(telegram_id, amount, reason=None):
     """הוספת טוקנים למשתמש עם סיבה"""
-    session = Session()
+    session = write_session()
     try:
-        user = session.query(User).filter_by(telegram_id=telegram_id).first()
+        user = _load_user(session, telegram_id)
         if not user:
             return False, 0, "משתמש לא נמצא"
         
-        user.tokens += amount
-        
-        # רישום לעקביות
-        if reason:
-            # ניתן ליצור כאן טבלת היסטוריית טרנזקציות
-            pass
+        _add_tokens(session, user, amount)
+        _log_tokens(session, user, amount, 'admin', reason=reason)
+        _record_activity(session, user, date.today(), tokens=amount)
         
         session.commit()
+        invalidate_after_commit(STATS_CACHE, TODAY_CACHE, LEADERBOARD_CACHE)
         
         return True, user.tokens, f"✅ נוספו {amount} טוקנים ל{user.first_name}"
     except Exception as e:
@@ -995,9 +1998,23 @@ def add_tokens_to_user(telegram_id, amount, reason=None):
     finally:
         session.close()
 
+def _longest_streak(session, telegram_id, before):
+    """הרצף המירבי של משתמש מהיסטוריית הנוכחות עד (לא כולל) before"""
+    dates = session.query(Attendance.date).filter(
+        Attendance.telegram_id == telegram_id,
+        Attendance.date < before
+    ).order_by(Attendance.date).distinct()
+    longest = current = 0
+    last_date = None
+    for (checkin_date,) in dates:
+        current = current + 1 if last_date and checkin_date - last_date == timedelta(days=1) else 1
+        longest = max(longest, current)
+        last_date = checkin_date
+    return longest
+
 def reset_user_checkin(telegram_id):
     """איפוס צ'ק-אין של משתמש"""
-    session = Session()
+    session = write_session()
     try:
         today = date.today()
         
@@ -1009,14 +2026,35 @@ def reset_user_checkin(telegram_id):
         
         if attendance:
             # החזר את הטוקנים
-            user = session.query(User).filter_by(telegram_id=telegram_id).first()
+            refunded = 0
+            user = _load_user(session, telegram_id)
+            if user:
+                # היתרה העדכנית (ונעילת השורה ב-PostgreSQL) - ההחזר לא מוריד את היתרה מתחת ל-0
+                session.refresh(user, ['tokens'], with_for_update=True)
+                refunded = min(attendance.tokens_earned, user.tokens)
+                _add_tokens(session, user, -refunded)
+                _log_tokens(session, user, -refunded, 'checkin_reset', reference=today.isoformat())
+                
+                # החזרת הרצף למצבו לפני הצ'ק-אין של היום - הרצף המירבי הקודם לא נשמר בשום
+                # מקום, ולכן מחושב מחדש מהנוכחות שלפני היום
+                if user.last_checkin == today:
+                    user.longest_streak = _longest_streak(session, telegram_id, before=today)
+                    user.current_streak = max((user.current_streak or 0) - 1, 0)
+                    if user.current_streak > 0:
+                        user.last_checkin = today - timedelta(days=1)
+                    else:
+                        user.last_checkin = session.query(func.max(Attendance.date)).filter(
+                            Attendance.telegram_id == telegram_id,
+                            Attendance.date < today
+                        ).scalar()
+            
+            # ביטול הצ'ק-אין גם בסטטיסטיקות היום - המשתמש לא נספר כפעיל אם לא עשה דבר נוסף
             if user:
-                user.tokens -= attendance.tokens_earned
-                if user.tokens < 0:
-                    user.tokens = 0
+                _record_activity(session, user, today, tokens=-refunded, checkins=-1)
             
             session.delete(attendance)
             session.commit()
+            invalidate_after_commit(STATS_CACHE, TODAY_CACHE, STREAK_CACHE, LEADERBOARD_CACHE)
             return True, "✅ צ'ק-אין אופס בהצלחה"
         
         return False, "לא נמצא צ'ק-אין לאיפוס"
@@ -1027,23 +2065,14 @@ def reset_user_checkin(telegram_id):
     finally:
         session.close()
 
-def broadcast_message_to_all():
-    """קבלת כל משתמשי המערכת לשידור"""
-    session = Session()
-    try:
-        users = session.query(User).all()
-        user_ids = [user.telegram_id for user in users]
-        
-        return user_ids
-    except Exception as e:
-        logger.error(f"❌ שגיאה בקבלת רשימת משתמשים: {e}")
-        return []
-    finally:
-        session.close()
+def broadcast_message_to_all(batch_size=USER_STREAM_BATCH_SIZE):
+    """מזהי הטלגרם של כל משתמשי המערכת לשידור - בזרם, מנה אחר מנה"""
+    for row in iter_users(('telegram_id',), batch_size):
+        yield row.telegram_id
 
 def create_new_task(task_data):
     """יצירת משימה חדשה"""
-    session = Session()
+    session = write_session()
     try:
         task = Task(**task_data)
         session.add(task)
@@ -1056,52 +2085,70 @@ def create_new_task(task_data):
     finally:
         session.close()
 
-def get_user_leaderboard_position(telegram_id, category='tokens'):
-    """קבלת מיקום המשתמש בטבלת המובילים"""
-    session = Session()
+def _ranked_ahead_filter(category, user):
+    """תנאי "מדורג מעל המשתמש" לכל קטגוריה - נשען על האינדקסים של users"""
+    if category == 'level':
+        return or_(
+            User.level > user.level,
+            and_(User.level == user.level, User.experience > user.experience)
+        )
+    return User.tokens > user.tokens
+
+def _get_rank(session, user, category='tokens', top_n=10):
+    """מיקום מדויק והפער לכניסה ל-Top N בעזרת ספירות על אינדקס"""
+    ahead, total = session.execute(select(
+        select(func.count(User.id)).where(_ranked_ahead_filter(category, user)).scalar_subquery(),
+        select(func.count(User.id)).scalar_subquery()
+    )).one()
+    position = ahead + 1
+    
+    # הפער ל-Top N נמדד בטוקנים - ערך הטוקנים של המקום ה-N
+    gap_to_top = None
+    if category == 'tokens' and position > top_n:
+        threshold = session.query(User.tokens).order_by(desc(User.tokens)).offset(top_n - 1).limit(1).scalar()
+        if threshold is not None:
+            gap_to_top = max(threshold - user.tokens, 0)
+    
+    return {
+        'position': position,
+        'total': total,
+        'percentage': int((position / total) * 100) if total > 0 else 0,
+        'top_n': top_n,
+        'gap_to_top': gap_to_top
+    }
+
+def get_user_rank(telegram_id, category='tokens', top_n=10):
+    """מיקום המשתמש בדירוג והפער ל-Top N (None אם המשתמש לא קיים)"""
+    session = open_session()
     try:
-        if category == 'tokens':
-            # ספור כמה משתמשים עם יותר טוקנים
-            user = session.query(User).filter_by(telegram_id=telegram_id).first()
-            if not user:
-                return None
-            
-            position = session.query(User).filter(User.tokens > user.tokens).count() + 1
-            total = session.query(User).count()
-            
-            return {
-                'position': position,
-                'total': total,
-                'percentage': int((position / total) * 100) if total > 0 else 0
-            }
-        
-        elif category == 'level':
-            user = session.query(User).filter_by(telegram_id=telegram_id).first()
-            if not user:
-                return None
-            
-            position = session.query(User).filter(
-                or_(
-                    User.level > user.level,
-                    and_(User.level == user.level, User.experience > user.experience)
-                )
-            ).count() + 1
-            
-            total = session.query(User).count()
-            
-            return {
-                'position': position,
-                'total': total,
-                'percentage': int((position / total) * 100) if total > 0 else 0
-            }
+        user = _load_user(session, telegram_id)
+        if not user:
+            return None
         
-        return None
+        rank = _get_rank(session, user, category, top_n)
+        rank['value'] = user.level if category == 'level' else user.tokens
+        return rank
     except Exception as e:
-        logger.error(f"❌ שגיאה בקבלת מיקום בטבלה: {e}")
+        logger.error(f"❌ שגיאה בחישוב דירוג: {e}")
         return None
     finally:
         session.close()
 
+def get_user_leaderboard_position(telegram_id, category='tokens'):
+    """קבלת מיקום המשתמש בטבלת המובילים"""
+    if category not in ('tokens', 'level'):
+        return None
+    
+    rank = get_user_rank(telegram_id, category)
+    if not rank:
+        return None
+    
+    return {
+        'position': rank['position'],
+        'total': rank['total'],
+        'percentage': rank['percentage']
+    }
+
 # ========== פונקציות API ==========
 
 def get_api_stats():
@@ -1131,59 +2178,36 @@ def get_api_stats():
     }
 
 def search_users(query, limit=20):
-    """חיפוש משתמשים לפי שם, שם משתמש או מזהה"""
-    session = Session()
+    """חיפוש משתמשים לפי שם, שם משתמש או תחילית מזהה - מדורג, על אינדקס החיפוש (database/search.py)"""
+    session = open_session()
     try:
-        from sqlalchemy import cast, String
-        
-        users = session.query(User).filter(
-            or_(
-                User.first_name.ilike(f"%{query}%"),
-                User.last_name.ilike(f"%{query}%"),
-                User.username.ilike(f"%{query}%"),
-                cast(User.telegram_id, String).ilike(f"%{query}%")
-            )
-        ).limit(limit).all()
+        ids = search_user_ids(session, query, limit)
+        if not ids:
+            return []
         
-        return users
+        rows = {row.id: row for row in session.query(*USER_PAGE_COLUMNS).filter(User.id.in_(ids)).all()}
+        return [rows[user_id] for user_id in ids if user_id in rows]
     except Exception as e:
         logger.error(f"❌ שגיאה בחיפוש משתמשים: {e}")
         return []
     finally:
         session.close()
 
+@cached(TODAY_CACHE, ttl=STATS_CACHE_TTL)
 def get_today_stats():
     """סטטיסטיקות להיום"""
-    session = Session()
+    session = open_session()
     try:
-        today = date.today()
-        
-        # משתמשים חדשים היום
-        new_users_today = session.query(User).filter(
-            func.date(User.created_at) == today
-        ).count()
-        
-        # צ'ק-אין היום
-        checkins_today = session.query(Attendance).filter(
-            Attendance.date == today
-        ).count()
-        
-        # משימות שהושלמו היום
-        tasks_completed_today = session.query(TaskCompletion).filter(
-            func.date(TaskCompletion.completed_at) == today,
-            TaskCompletion.status == TaskStatus.COMPLETED
-        ).count()
-        
-        # הפניות חדשות היום
-        new_referrals_today = session.query(Referral).filter(
-            func.date(Referral.created_at) == today
-        ).count()
+        # שורת היום בטבלת המדדים - קריאה אחת לפי המפתח
+        rollup = session.get(DailyRollup, date.today())
         
         return {
-            'new_users_today': new_users_today,
-            'checkins_today': checkins_today,
-            'tasks_completed_today': tasks_completed_today,
-            'new_referrals_today': new_referrals_today
+            'new_users_today': rollup.new_users if rollup else 0,
+            'checkins_today': rollup.checkins if rollup else 0,
+            'tasks_completed_today': rollup.tasks_completed if rollup else 0,
+            'new_referrals_today': rollup.new_referrals if rollup else 0,
+            'tokens_minted_today': rollup.tokens_minted if rollup else 0,
+            'active_users_today': rollup.active_users if rollup else 0
         }
     except Exception as e:
         logger.error(f"❌ שגיאה בקבלת סטטיסטיקות היום: {e}")
@@ -1191,34 +2215,32 @@ def get_today_stats():
             'new_users_today': 0,
             'checkins_today': 0,
             'tasks_completed_today': 0,
-            'new_referrals_today': 0
+            'new_referrals_today': 0,
+            'tokens_minted_today': 0,
+            'active_users_today': 0
         }
     finally:
         session.close()
 
+@cached(STREAK_CACHE, ttl=STATS_CACHE_TTL)
 def get_streak_stats():
     """סטטיסטיקות רצפים"""
-    session = Session()
+    session = open_session()
     try:
-        # רצף ממוצע
-        all_users = session.query(User).all()
-        streaks = []
-        for user in all_users:
-            streak = calculate_user_streak(user.telegram_id)
-            streaks.append(streak)
-        
-        avg_streak = sum(streaks) / len(streaks) if streaks else 0
-        
-        # רצף מירבי
-        max_streak = max(streaks) if streaks else 0
+        # רצף בתוקף בלבד - גם אם האיפוס היומי עוד לא רץ
+        yesterday = date.today() - timedelta(days=1)
+        streak = case((User.last_checkin >= yesterday, User.current_streak), else_=0)
         
-        # משתמשים עם רצף 7+ ימים
-        users_with_7plus_streak = len([s for s in streaks if s >= 7])
+        avg_streak, max_streak, users_with_7plus_streak = session.query(
+            func.avg(streak),
+            func.max(streak),
+            func.sum(case((streak >= 7, 1), else_=0))
+        ).one()
         
         return {
-            'avg_streak': round(avg_streak, 1),
-            'max_streak': max_streak,
-            'users_with_7plus_streak': users_with_7plus_streak
+            'avg_streak': round(float(avg_streak or 0), 1),
+            'max_streak': max_streak or 0,
+            'users_with_7plus_streak': users_with_7plus_streak or 0
         }
     except Exception as e:
         logger.error(f"❌ שגיאה בקבלת סטטיסטיקות רצפים: {e}")
@@ -1257,19 +2279,28 @@ def get_daily_stats():
 
 # ========== ייצוא פונקציות ==========
 __all__ = [
-    'init_database',
+    'init_database', 'get_bootstrap_version', 'is_database_current',
     'register_user', 'checkin_user', 'get_user', 'get_all_users',
-    'get_balance', 'get_user_level_info', 'update_user_level',
-    'get_top_users', 'calculate_user_streak',
+    'count_users', 'get_users_page', 'iter_users', 'get_users_keyset_page',
+    'get_balance', 'get_user_level_info', 'update_user_level', 'recompute_user_levels',
+    'get_top_users', 'calculate_user_streak', 'effective_streak',
+    'rollover_streaks', 'backfill_user_streaks',
     'get_user_referrals', 'get_total_referrals', 'get_referred_users',
     'get_user_attendance_history',
+    'get_task_windows', 'resolve_task_availability',
     'get_available_tasks', 'get_user_tasks', 'complete_task',
     'get_pending_tasks', 'approve_task', 'reject_task',
     'get_system_stats', 'get_checkin_data', 'get_activity_count',
-    'get_user_activity_report',
+    'get_user_activity_report', 'get_user_daily_history', 'backfill_user_daily_stats',
+    'get_daily_rollups', 'backfill_daily_rollups',
+    'get_token_statement', 'reconcile_token_ledger',
     'add_tokens_to_user', 'reset_user_checkin', 'broadcast_message_to_all',
-    'create_new_task', 'get_user_leaderboard_position',
+    'create_new_task', 'get_user_rank', 'get_user_leaderboard_position',
     'get_api_stats', 'search_users',
     'get_today_stats', 'get_streak_stats', 'get_activity_stats',
-    'get_daily_stats'
+    'get_daily_stats',
+    'create_broadcast_job', 'get_broadcast_job', 'get_claimable_broadcast_jobs',
+    'claim_broadcast_job', 'get_pending_deliveries', 'record_broadcast_deliveries',
+    'finish_broadcast_job', 'release_broadcast_job', 'cancel_broadcast_job',
+    'claim_update', 'claim_scheduled_job', 'prune_processed_updates'
 ]
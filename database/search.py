@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+אינדקס חיפוש משתמשים - שם פרטי, שם משפחה, שם משתמש ותחילית של מזהה טלגרם
+
+לכל מסד נתונים ה-backend המתאים לו:
+• SQLite - טבלת FTS5 עם tokenizer של trigram (חיפוש תת-מחרוזת), שמתעדכנת
+  ב-triggers על users, ודירוג bm25
+• PostgreSQL - אינדקס GIN של pg_trgm על השמות, ודירוג similarity
+• אחרת (או כשההרחבה לא זמינה) - אינדקס n-gram בזיכרון התהליך, שמשלים
+  משתמשים חדשים (id גדול מהאחרון שנטען) לפני כל חיפוש
+
+תחילית מזהה מחופשת תמיד על האינדקס הייחודי של telegram_id, כטווחים של מספרים.
+"""
+
+import re
+import logging
+import threading
+from array import array
+from collections import defaultdict
+
+from sqlalchemy import text, or_, func
+
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = 'users_search'
+TRGM_INDEX = 'ix_users_search_trgm'
+
+# מזהי טלגרם הם עד 15 ספרות - תחילית מתורגמת לטווח אחד לכל אורך אפשרי
+MAX_ID_DIGITS = 15
+NGRAM = 3
+
+# עמודות החיפוש ומשקלן בדירוג (שם משתמש ושם פרטי לפני שם משפחה)
+SEARCH_COLUMNS = ('first_name', 'last_name', 'username')
+BM25_WEIGHTS = (8.0, 4.0, 10.0)
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+# ========== עזר ==========
+
+def search_terms(query):
+    """מילות החיפוש באותיות קטנות, בלי @ בתחילת שם משתמש"""
+    return [word.lstrip('@') for word in query.lower().split() if word.lstrip('@')]
+
+def id_prefix_ranges(prefix):
+    """טווחי telegram_id שמתחילים בספרות prefix - (123 -> 123, 1230-1239, 12300-12399, ...)"""
+    if not prefix.isdigit() or prefix.startswith('0') or len(prefix) > MAX_ID_DIGITS:
+        return []
+    value = int(prefix)
+    return [(value * 10 ** k, (value + 1) * 10 ** k - 1) for k in range(MAX_ID_DIGITS - len(prefix) + 1)]
+
+def search_by_id_prefix(session, prefix, limit):
+    """מזהים שמתחילים בתחילית - המזהה המדויק קודם, ואז לפי אורך"""
+    # חיפוש נפרד לכל טווח (seek על האינדקס); OR של כל הטווחים גורם ל-SQLite לסרוק את כל האינדקס
+    ids = []
+    for low, high in id_prefix_ranges(prefix):
+        rows = session.query(User.id).filter(
+            User.telegram_id.between(low, high)
+        ).order_by(User.telegram_id).limit(limit - len(ids)).all()
+        ids += [user_id for user_id, in rows]
+        if len(ids) >= limit:
+            break
+    return ids
+
+def _like_escape(word):
+    return re.sub(r'([\\%_])', r'\\\1', word)
+
+def _prefix_scan(session, words, limit):
+    """מילים קצרות מדי לאינדקס (פחות מ-3 תווים) - התאמה לתחילת השם"""
+    conditions = [
+        or_(*(func.lower(getattr(User, column)).like(f"{_like_escape(word)}%", escape='\\')
+              for column in SEARCH_COLUMNS))
+        for word in words
+    ]
+    # לפי id - הסריקה נעצרת אחרי limit התאמות במקום למיין את כל הטבלה
+    rows = session.query(User.id).filter(*conditions).order_by(User.id).limit(limit).all()
+    return [user_id for user_id, in rows]
+
+# ========== SQLite FTS5 ==========
+
+class FtsSearchBackend:
+    """טבלת FTS5 חיצונית (content='users') עם trigram - מתעדכנת ב-triggers"""
+
+    name = 'fts5'
+
+    @staticmethod
+    def install(conn):
+        """יצירת הטבלה וה-triggers (ומילוי ראשוני אם הטבלה חדשה) - מחזיר True אם נוצרה"""
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+        ), {'name': SEARCH_TABLE}).first()
+        if exists:
+            return False
+
+        columns = ", ".join(SEARCH_COLUMNS)
+        new_values = ", ".join(f"new.{c}" for c in SEARCH_COLUMNS)
+        old_values = ", ".join(f"old.{c}" for c in SEARCH_COLUMNS)
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5({columns}, "
+            f"content='users', content_rowid='id', tokenize='trigram')"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER {SEARCH_TABLE}_ai AFTER INSERT ON users BEGIN "
+            f"INSERT INTO {SEARCH_TABLE}(rowid, {columns}) VALUES (new.id, {new_values}); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER {SEARCH_TABLE}_ad AFTER DELETE ON users BEGIN "
+            f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {columns}) "
+            f"VALUES ('delete', old.id, {old_values}); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER {SEARCH_TABLE}_au AFTER UPDATE OF {columns} ON users BEGIN "
+            f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {columns}) "
+            f"VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {SEARCH_TABLE}(rowid, {columns}) VALUES (new.id, {new_values}); END"
+        ))
+        conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+        return True
+
+    def search(self, session, words, limit):
+        indexed = [word for word in words if len(word) >= NGRAM]
+        if len(indexed) < len(words):
+            return _prefix_scan(session, words, limit)
+        # כל מילה כביטוי (תת-מחרוזת) בכל אחת מהעמודות - וכולן חייבות להופיע
+        match = " ".join('"' + word.replace('"', '""') + '"' for word in indexed)
+        weights = ", ".join(str(weight) for weight in BM25_WEIGHTS)
+        rows = session.execute(text(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match "
+            f"ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT :limit"
+        ), {'match': match, 'limit': limit}).all()
+        return [user_id for user_id, in rows]
+
+# ========== PostgreSQL pg_trgm ==========
+
+_TRGM_DOCUMENT = (
+    "lower(coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' || coalesce(username, ''))"
+)
+
+class TrigramSearchBackend:
+    """אינדקס GIN של pg_trgm על ביטוי השמות - מתעדכן יחד עם הטבלה"""
+
+    name = 'pg_trgm'
+
+    @staticmethod
+    def install(conn):
+        exists = conn.execute(text(
+            "SELECT 1 FROM pg_indexes WHERE indexname = :name"
+        ), {'name': TRGM_INDEX}).first()
+        if exists:
+            return False
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {TRGM_INDEX} ON users USING gin (({_TRGM_DOCUMENT}) gin_trgm_ops)"
+        ))
+        return True
+
+    def search(self, session, words, limit):
+        conditions = " AND ".join(f"{_TRGM_DOCUMENT} LIKE :w{i} ESCAPE '\\'" for i in range(len(words)))
+        params = {f"w{i}": f"%{_like_escape(word)}%" for i, word in enumerate(words)}
+        params.update(query=" ".join(words), limit=limit)
+        rows = session.execute(text(
+            f"SELECT id FROM users WHERE {conditions} "
+            f"ORDER BY word_similarity(:query, {_TRGM_DOCUMENT}) DESC, id LIMIT :limit"
+        ), params).all()
+        return [user_id for user_id, in rows]
+
+# ========== n-gram בזיכרון ==========
+
+class NgramSearchBackend:
+    """אינדקס n-gram בזיכרון התהליך - לכל trigram רשימה ממוינת של id (array)"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._postings = defaultdict(lambda: array('q'))
+        self._documents = {}
+        self._max_id = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self, session):
+        """טעינת משתמשים שנרשמו מאז הטעינה הקודמת (גם בתהליכים אחרים)"""
+        columns = [User.id] + [getattr(User, column) for column in SEARCH_COLUMNS]
+        while True:
+            rows = session.query(*columns).filter(User.id > self._max_id).order_by(User.id).limit(5000).all()
+            if not rows:
+                return
+            for user_id, *names in rows:
+                document = " ".join(name.lower() for name in names if name)
+                self._documents[user_id] = document
+                for gram in {document[i:i + NGRAM] for i in range(len(document) - NGRAM + 1)}:
+                    self._postings[gram].append(user_id)
+            self._max_id = rows[-1].id
+
+    def _candidates(self, word):
+        grams = {word[i:i + NGRAM] for i in range(len(word) - NGRAM + 1)}
+        postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+        if not postings or not postings[0]:
+            return set()
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+        return candidates
+
+    @staticmethod
+    def _score(document, words):
+        # מילה שלמה > תחילת מילה > תת-מחרוזת, ומסמך קצר לפני ארוך
+        tokens = document.split()
+        score = 0
+        for word in words:
+            if word in tokens:
+                score += 3
+            elif any(token.startswith(word) for token in tokens):
+                score += 2
+            else:
+                score += 1
+        return -score, len(document)
+
+    def search(self, session, words, limit):
+        with self._lock:
+            self._refresh(session)
+            indexed = [word for word in words if len(word) >= NGRAM]
+            if indexed:
+                candidates = None
+                for word in indexed:
+                    found = self._candidates(word)
+                    candidates = found if candidates is None else candidates & found
+                pool = ((user_id, self._documents[user_id]) for user_id in candidates)
+            else:
+                # מילים קצרות מדי ל-trigram - ההתאמות הראשונות לפי id, כמו ב-_prefix_scan
+                matches = []
+                for user_id, document in self._documents.items():
+                    if all(word in document for word in words):
+                        matches.append(user_id)
+                        if len(matches) >= limit:
+                            break
+                return matches
+            matches = [(user_id, document) for user_id, document in pool
+                       if all(word in document for word in words)]
+        matches.sort(key=lambda match: (self._score(match[1], words), match[0]))
+        return [user_id for user_id, _ in matches[:limit]]
+
+# ========== בחירת backend ==========
+
+def install_search_index(engine):
+    """יצירת אינדקס החיפוש במסד (FTS5 / pg_trgm) אם הוא נתמך - נקרא מ-upgrade_schema"""
+    backends = {'sqlite': FtsSearchBackend, 'postgresql': TrigramSearchBackend}
+    backend = backends.get(engine.dialect.name)
+    if backend is None:
+        return None
+    try:
+        with engine.begin() as conn:
+            if backend.install(conn):
+                logger.info(f"✅ אינדקס חיפוש משתמשים נוצר ({backend.name})")
+        return backend.name
+    except Exception as e:
+        logger.warning(f"⚠️ אינדקס חיפוש {backend.name} לא זמין - חיפוש בזיכרון: {e}")
+        return None
+
+def _detect_backend(session):
+    """ה-backend לפי מה שקיים במסד בפועל"""
+    dialect = session.get_bind().dialect.name
+    try:
+        if dialect == 'sqlite' and session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+        ), {'name': SEARCH_TABLE}).first():
+            return FtsSearchBackend()
+        if dialect == 'postgresql' and session.execute(text(
+            "SELECT 1 FROM pg_indexes WHERE indexname = :name"
+        ), {'name': TRGM_INDEX}).first():
+            return TrigramSearchBackend()
+    except Exception as e:
+        logger.warning(f"⚠️ שגיאה בזיהוי אינדקס החיפוש: {e}")
+    return NgramSearchBackend()
+
+def get_search_backend(session):
+    """backend אחד לכל מסד נתונים (לפי כתובת המנוע)"""
+    key = str(session.get_bind().url)
+    backend = _backends.get(key)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(key)
+            if backend is None:
+                backend = _backends[key] = _detect_backend(session)
+                logger.info(f"🔍 חיפוש משתמשים: {backend.name}")
+    return backend
+
+def search_user_ids(session, query, limit=20):
+    """מזהי שורות (users.id) שמתאימים לחיפוש, לפי דירוג - התאמות מזהה טלגרם קודם"""
+    words = search_terms(query or "")
+    if not words:
+        return []
+
+    ids = []
+    if len(words) == 1 and words[0].isdigit():
+        ids = search_by_id_prefix(session, words[0], limit)
+    if len(ids) < limit:
+        seen = set(ids)
+        ids += [user_id for user_id in get_search_backend(session).search(session, words, limit)
+                if user_id not in seen]
+    return ids[:limit]
+
+__all__ = [
+    'install_search_index', 'get_search_backend', 'search_user_ids', 'id_prefix_ranges',
+    'FtsSearchBackend', 'TrigramSearchBackend', 'NgramSearchBackend'
+]
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+יחידת עבודה - סשן אחד לכל עדכון טלגרם או בקשת Flask
+פונקציות השאילתה משתמשות בסשן הפעיל אם קיים, ואחרת פותחות סשן עצמאי כרגיל
+"""
+
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .models import Session
+from .cache import invalidate
+from .engine import WRITE_EXECUTION_OPTIONS
+
+logger = logging.getLogger(__name__)
+
+_current_session = ContextVar('crypto_class_unit_of_work', default=None)
+
+class UnitOfWorkSession:
+    """מעטפת לסשן של יחידת העבודה כפי שפונקציית שאילתה רואה אותו:
+    commit הופך ל-flush, close לא סוגר, ו-rollback מבטל את כל היחידה"""
+
+    def __init__(self, session):
+        self._session = session
+
+    def commit(self):
+        self._session.flush()
+
+    def rollback(self):
+        # ניתוק האובייקטים שכבר נטענו (למשל במטמון) כדי שה-rollback לא יפוג אותם
+        self._session.expunge_all()
+        self._session.rollback()
+        self._session.info.pop('users', None)
+        self._session.info.pop('pending_invalidations', None)
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+def get_current_session():
+    """הסשן של יחידת העבודה הפעילה (או None)"""
+    return _current_session.get()
+
+def open_session():
+    """סשן לפונקציית שאילתה - של יחידת העבודה הפעילה, או סשן עצמאי חדש"""
+    current = _current_session.get()
+    if current is not None:
+        if current.info.get('write') and not current.in_transaction():
+            # יחידת כתיבה - גם הקריאה הראשונה פותחת טרנזקציית כתיבה
+            current.connection(execution_options=WRITE_EXECUTION_OPTIONS)
+        return UnitOfWorkSession(current)
+    return Session()
+
+def write_session():
+    """סשן לפונקציית שאילתה שכותבת - כמו open_session, אבל הטרנזקציה היא טרנזקציית כתיבה
+    (BEGIN IMMEDIATE ב-SQLite).
+
+    ב-WAL טרנזקציית קריאה שמנסה לכתוב נכשלת מיד עם "database is locked" (busy_timeout לא עוזר),
+    ולכן יחידת עבודה שעד עכשיו רק קראה פותחת את הטרנזקציה שלה מחדש ככתיבה"""
+    current = _current_session.get()
+    if current is None:
+        session = Session()
+        session.connection(execution_options=WRITE_EXECUTION_OPTIONS)
+        return session
+
+    if not current.info.get('write'):
+        if current.in_transaction() and _only_read(current):
+            _restart_transaction(current)
+        current.info['write'] = True
+    return open_session()
+
+def _only_read(session):
+    """כל כתיבה ביחידה עוברת ב-write_session - לפניה היחידה רק קראה, אלא אם יש שינויים ממתינים"""
+    return (session.get_bind().dialect.name == 'sqlite'
+            and not (session.new or session.dirty or session.deleted))
+
+def _restart_transaction(session):
+    """סגירת טרנזקציית הקריאה של היחידה - הטרנזקציה הבאה נפתחת ככתיבה"""
+    # ניתוק האובייקטים שכבר נטענו כדי שה-rollback לא יפוג אותם (כמו ב-UnitOfWorkSession.rollback)
+    session.expunge_all()
+    session.rollback()
+    session.info.pop('users', None)
+
+def invalidate_after_commit(*namespaces):
+    """ביטול מטמון - נדחה עד ה-commit של יחידת העבודה אם יש כזו"""
+    current = _current_session.get()
+    if current is not None:
+        current.info.setdefault('pending_invalidations', set()).update(namespaces)
+    else:
+        invalidate(*namespaces)
+
+def begin_unit_of_work(write=False):
+    """פתיחת יחידת עבודה - מחזיר token לסגירה עם end_unit_of_work
+    write - היחידה תכתוב, והטרנזקציה שלה נפתחת ככתיבה כבר בשאילתה הראשונה"""
+    session = Session(expire_on_commit=False)
+    if write:
+        session.info['write'] = True
+    return _current_session.set(session)
+
+def detach_unit_of_work(token):
+    """ניתוק יחידת העבודה מההקשר הנוכחי - מחזיר את הסשן לסגירה עם finish_session"""
+    session = _current_session.get()
+    _current_session.reset(token)
+    return session
+
+def finish_session(session, error=None):
+    """commit אחד לכל היחידה (או rollback אם הייתה שגיאה) וסגירת הסשן"""
+    try:
+        if error is None:
+            session.commit()
+            pending = session.info.pop('pending_invalidations', None)
+            if pending:
+                invalidate(*pending)
+        else:
+            session.expunge_all()
+            session.rollback()
+    finally:
+        session.close()
+
+def end_unit_of_work(token, error=None):
+    """סגירת יחידת העבודה שנפתחה עם begin_unit_of_work"""
+    finish_session(detach_unit_of_work(token), error)
+
+@contextmanager
+def unit_of_work(write=False):
+    """יחידת עבודה סינכרונית - יחידה פנימית מצטרפת לחיצונית"""
+    current = _current_session.get()
+    if current is not None:
+        yield current
+        return
+
+    token = begin_unit_of_work(write)
+    try:
+        yield _current_session.get()
+    except BaseException as e:
+        end_unit_of_work(token, e)
+        raise
+    end_unit_of_work(token)
+
+__all__ = [
+    'UnitOfWorkSession', 'get_current_session', 'open_session', 'write_session',
+    'invalidate_after_commit', 'begin_unit_of_work', 'detach_unit_of_work',
+    'finish_session', 'end_unit_of_work',
+    'unit_of_work'
+]
@@ -14,6 +14,8 @@ print("=" * 50)
 
 try:
     from database.db import init_database
+    from database.models import get_engine
+    from database.migrations import MIGRATIONS, get_applied_migrations
     from config import get_app_info
     
     info = get_app_info()
@@ -23,8 +25,19 @@ try:
     print()
     
     try:
-        init_database()
-        print("✅ מסד הנתונים אותחל בהצלחה!")
+        if init_database():
+            print("✅ מסד הנתונים אותחל בהצלחה!")
+        else:
+            print("✅ מסד הנתונים כבר מעודכן - אין מה לאתחל")
+        print()
+        
+        # מיגרציות הסכמה (database/migrations.py) - כולן רצות כחלק מ-init_database
+        with get_engine().connect() as conn:
+            applied = get_applied_migrations(conn)
+        print("🧱 מיגרציות:")
+        for migration in MIGRATIONS:
+            mark = "✅" if migration.id in applied else "⏳"
+            print(f"   {mark} {migration.id:04d} {migration.name}")
         print()
         
         print("📊 טבלאות שנוצרו:")